@@ -28,6 +28,25 @@ const storage = multer.diskStorage({
   }
 });
 
+// Product images are shared: the import scripts store each picture once
+// (content-addressed) and reuse placeholders, so several products can point
+// at the same file. Only delete an image once no product references it.
+const removeImageIfUnreferenced = (db, imagePath, label) => {
+  if (!imagePath) return;
+  db.get('SELECT 1 FROM products WHERE image_path = ? LIMIT 1', [imagePath], (err, row) => {
+    if (err) {
+      console.error(`Error checking references of ${label}:`, err);
+      return;
+    }
+    if (row) return;
+    fs.unlink(path.join(__dirname, '..', imagePath), (err) => {
+      if (err && err.code !== 'ENOENT') {
+        console.error(`Error deleting ${label}:`, err);
+      }
+    });
+  });
+};
+
 const fileFilter = (req, file, cb) => {
   // Allow Excel files for import endpoint, images elsewhere
   const isExcel = file.originalname.match(/\.(xlsx|xls)$/i);
@@ -669,16 +688,7 @@ router.put(
       let imagePath = currentProduct.image_path;
       
       if (req.file) {
-        // Delete old image if it exists
-        if (currentProduct.image_path) {
-          const oldImagePath = path.join(__dirname, '..', currentProduct.image_path);
-          fs.unlink(oldImagePath, (err) => {
-            if (err && err.code !== 'ENOENT') {
-              console.error('Error deleting old image:', err);
-            }
-          });
-        }
-        
+        // The old image is removed once the update is saved (if no other product uses it)
         // Set new image path
         imagePath = `/uploads/products/${req.file.filename}`;
       }
@@ -731,6 +741,11 @@ router.put(
             return res.status(404).json({ message: 'Product not found' });
           }
           
+          // Delete the old image if no product references it any more
+          if (req.file && currentProduct.image_path !== imagePath) {
+            removeImageIfUnreferenced(db, currentProduct.image_path, 'old image');
+          }
+          
           // Update rack location if provided
           if (rackLocationId) {
             // First check if there's an existing inventory record
@@ -867,15 +882,8 @@ router.delete('/:id', auth, (req, res) => {
           return res.status(404).json({ message: 'Product not found' });
         }
         
-        // Delete the product image if it exists
-        if (currentProduct.image_path) {
-          const imagePath = path.join(__dirname, '..', currentProduct.image_path);
-          fs.unlink(imagePath, (err) => {
-            if (err && err.code !== 'ENOENT') {
-              console.error('Error deleting product image:', err);
-            }
-          });
-        }
+        // Delete the product image if no other product references it
+        removeImageIfUnreferenced(db, currentProduct.image_path, 'product image');
         
         // Log the action in audit_log
         const logId = uuidv4();
@@ -1,6 +1,26 @@
 import pandas as pd
+import numpy as np
 import json
 import os
+import re
+import math
+import time
+import argparse
+import datetime
+from itertools import islice
+import zipfile
+from excel_reader import find_header_row, column_names, clean_value, HEADER_SCAN_ROWS
+from xlsx_media import sheet_parts
+from xlsx_rows import row_fragments, RowDecoder
+from profiling import profiled, add_profile_arguments
+
+# Profiler configuration
+RESERVOIR_SIZE = 10000  # Rows sampled per sheet
+TYPE_THRESHOLD = 0.7  # Share of non-null values a type needs to be suggested
+NUMERIC_TEXT = re.compile(r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$')
+DATE_TEXT = re.compile(r'^(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[./-]\d{1,2}[./-]\d{2,4})([ T]\d{1,2}:\d{2}(:\d{2})?)?$')
+# Value classes used in the profile
+NULL, NUMERIC, DATE, TEXT = 0, 1, 2, 3
 
 def analyze_excel(file_path):
     # Read all sheets from the Excel file
@@ -71,9 +91,175 @@ def analyze_excel(file_path):
             for col in empty_cols:
                 print(f"  - Column {col}")
 
-if __name__ == "__main__":
-    file_path = "PL- ARPER.xlsx"
-    if os.path.exists(file_path):
-        analyze_excel(file_path)
+def reservoir_sample(rows, size, rng):
+    """Draw a uniform sample of size items from an iterable of unknown length.
+
+    Uses Algorithm L, which jumps over the items that will not be kept
+    instead of drawing a random number for each of them. Returns
+    (sample, number of items seen).
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, size))
+    count = len(sample)
+    if count < size:
+        return sample, count
+
+    def log_random():
+        return math.log(rng.random() or 1e-300)
+
+    log_w = log_random() / size
+    while True:
+        # Items skipped before the next one enters the reservoir
+        skip = math.floor(log_random() / math.log(-math.expm1(log_w)))
+        skipped = sum(1 for _ in islice(rows, skip))
+        count += skipped
+        if skipped < skip:
+            return sample, count
+        item = next(rows, None)
+        if item is None:
+            return sample, count
+        count += 1
+        sample[rng.integers(size)] = item
+        log_w += log_random() / size
+
+def classify_value(value):
+    """Return the value class (NULL, NUMERIC, DATE or TEXT) of a cell"""
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return TEXT
+    if isinstance(value, (int, float)):
+        return NULL if value != value else NUMERIC  # NaN counts as empty
+    if isinstance(value, (datetime.date, datetime.time)):
+        return DATE
+    text = str(value)
+    if NUMERIC_TEXT.match(text):
+        return NUMERIC
+    if DATE_TEXT.match(text):
+        return DATE
+    return TEXT
+
+def profile_column(values):
+    """Profile one column of the sample with NumPy: type ratios, nulls, cardinality and numeric range"""
+    classes = np.fromiter((classify_value(value) for value in values), dtype=np.int8, count=len(values))
+    counts = np.bincount(classes, minlength=4)
+    non_null = int(len(values) - counts[NULL])
+    filled = classes != NULL
+    profile = {
+        'null_count': int(counts[NULL]),
+        'null_ratio': float(counts[NULL] / len(values)) if len(values) else 0.0,
+        'numeric_ratio': float(counts[NUMERIC] / non_null) if non_null else 0.0,
+        'date_ratio': float(counts[DATE] / non_null) if non_null else 0.0,
+        'text_ratio': float(counts[TEXT] / non_null) if non_null else 0.0,
+        'distinct': 0,
+        'distinct_ratio': 0.0,
+    }
+    if non_null:
+        filled_values = np.array(values, dtype=object)[filled]
+        distinct = len(np.unique(filled_values.astype(str)))
+        profile['distinct'] = distinct
+        profile['distinct_ratio'] = distinct / non_null
+        profile['sample_values'] = [str(value) for value in filled_values[:3]]
+        numeric = classes == NUMERIC
+        if numeric.any():
+            numbers = np.array(values, dtype=object)[numeric].astype(float)
+            profile['min'] = float(numbers.min())
+            profile['max'] = float(numbers.max())
+            profile['mean'] = float(numbers.mean())
+
+    if profile['numeric_ratio'] > TYPE_THRESHOLD:
+        profile['suggested_type'] = "NUMERIC"
+    elif profile['date_ratio'] > TYPE_THRESHOLD:
+        profile['suggested_type'] = "DATE"
+    elif non_null:
+        profile['suggested_type'] = "TEXT"
     else:
-        print(f"File not found: {file_path}") 
\ No newline at end of file
+        profile['suggested_type'] = "EMPTY"
+    return profile
+
+def profile_sheet(archive, decoder, sheet_name, sample_size, rng):
+    """Sample the data rows of one worksheet and profile every column.
+
+    Only the header rows and the sampled rows are decoded; every other row
+    is just counted.
+    """
+    fragments = row_fragments(archive, sheet_name)
+    leading = decoder.decode(list(islice(fragments, HEADER_SCAN_ROWS)))
+    header_index = find_header_row([values for _, values in leading])
+    if header_index is None:
+        header_index = 0
+    header_row, header = leading[header_index] if leading else (None, [])
+
+    def data_rows():
+        # Rows already decoded are sampled as they are; the rest stay raw until sampled
+        yield from leading[header_index + 1:]
+        yield from fragments
+
+    sample, row_count = reservoir_sample(data_rows(), sample_size, rng)
+    raw = [item for item in sample if isinstance(item, bytes)]
+    decoded = iter(decoder.decode(raw))
+    sample = [next(decoded) if isinstance(item, bytes) else item for item in sample]
+
+    # Widen the header to the widest sampled row
+    width = max([len(header)] + [len(values) for _, values in sample])
+    columns = column_names(list(header) + [None] * (width - len(header)))
+    grid = [[clean_value(value) for value in values] + [None] * (width - len(values)) for _, values in sample]
+    column_values = list(zip(*grid)) if grid else [() for _ in columns]
+
+    profiles = {}
+    for name, values in zip(columns, column_values):
+        profile = profile_column(list(values))
+        profile['estimated_nulls'] = round(profile['null_ratio'] * row_count)
+        profiles[name] = profile
+
+    return {
+        'name': sheet_name,
+        'rows': row_count,
+        'header_row': header_row,
+        'columns': columns,
+        'sampled_rows': len(sample),
+        'column_profiles': profiles,
+        'sample_data': [dict(zip(columns, (str(value) if value is not None else None for value in row)))
+                        for row in grid[:3]],
+    }
+
+def profile_excel(file_path, sample_size=RESERVOIR_SIZE, seed=None):
+    """Profile every sheet of a workbook from a reservoir sample of its rows; returns a JSON-ready dict"""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(file_path) as archive:
+        decoder = RowDecoder(archive)
+        sheets = [profile_sheet(archive, decoder, name, sample_size, rng) for name, _ in sheet_parts(archive)]
+    return {
+        'file': os.path.basename(file_path),
+        'sheets': sheets,
+        'total_sheets': len(sheets),
+        'sample_size': sample_size,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Analyze the structure of an Excel workbook')
+    parser.add_argument('file_path', nargs='?', default="PL- ARPER.xlsx", help='Path to the Excel file')
+    parser.add_argument('--column-profile', action='store_true',
+                        help='Profile columns from a row sample and emit JSON instead of printing sheets')
+    parser.add_argument('--sample-size', type=int, default=RESERVOIR_SIZE, help='Rows sampled per sheet')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for a repeatable sample')
+    parser.add_argument('--output', default=None, help='Write the profile JSON to this file instead of stdout')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('analyze_excel', args.profile, args.profile_top):
+        file_path = args.file_path
+        if not os.path.exists(file_path):
+            print(f"File not found: {file_path}")
+        elif args.column_profile:
+            result = profile_excel(file_path, args.sample_size, args.seed)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, indent=2)
+                print(f"Profile written to {args.output} ({result['elapsed_seconds']}s)")
+            else:
+                print(json.dumps(result, indent=2))
+        else:
+            analyze_excel(file_path) 
@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from profiling import profile_from_argv
 
 # Configuration - same as import_excel_data.py
 EXCEL_FILE = "PL- ARPER.xlsx"
@@ -65,4 +66,5 @@ def analyze_excel():
         print(f"Error analyzing Excel file: {e}")
 
 if __name__ == "__main__":
-    analyze_excel()
+    with profile_from_argv('analyze_excel_products'):
+        analyze_excel()
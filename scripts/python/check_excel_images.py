@@ -2,6 +2,7 @@ import openpyxl
 import os
 from openpyxl.drawing.image import Image
 import pandas as pd
+from profiling import profile_from_argv
 
 # Configuration
 EXCEL_FILE = "PL- ARPER.xlsx"
@@ -61,4 +62,5 @@ def check_excel_file():
             print(f"Error reading as DataFrame: {e}")
 
 if __name__ == "__main__":
-    check_excel_file()
+    with profile_from_argv('check_excel_images'):
+        check_excel_file()
@@ -1,15 +1,18 @@
-import pandas as pd
-import sqlite3
 import os
 import datetime
 import uuid
+from excel_reader import read_sheet, cell_text, cell_number
+from db_indexes import ensure_indexes
+from rack_codes import rack_key, ensure_rack_keys
+from db_connection import connect
+from profiling import profile_from_argv
 
 def create_database():
     """Create an enterprise-grade inventory management database based on the Excel data."""
     db_file = "arper_inventory.db"
     
     # Connect to SQLite database (will create if it doesn't exist)
-    conn = sqlite3.connect(db_file)
+    conn = connect(db_file, profile='bulk')
     cursor = conn.cursor()
     
     print(f"Creating database: {db_file}")
@@ -52,6 +55,8 @@ def create_database():
         location_id TEXT PRIMARY KEY,
         name TEXT NOT NULL,
         description TEXT,
+        type TEXT,
+        rack_key TEXT,
         parent_location_id TEXT,
         created_at TEXT DEFAULT CURRENT_TIMESTAMP,
         updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
@@ -204,6 +209,10 @@ def create_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_po_items_po ON purchase_order_items (po_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log (user_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_action ON audit_log (action)')
+    # Covering indexes for the per-row lookups of the import scripts
+    ensure_indexes(conn)
+    # One rack location per canonical rack code
+    ensure_rack_keys(conn)
     
     # Create views for common queries
     cursor.execute('''
@@ -272,29 +281,12 @@ def import_excel_data(conn, admin_id):
     
     print(f"Importing data from Excel file: {excel_file}")
     
-    # Read Excel with pandas - using header=None to manually handle headers
-    df = pd.read_excel(excel_file, sheet_name="PL", header=None)
+    # Stream the PL sheet; the header row (usually row 1) is detected while reading
+    columns, header_row, rows = read_sheet(excel_file, sheet_name="PL")
     
-    # Find the header row (usually row 1 based on our analysis)
-    header_row = 1  # This is 0-indexed in pandas
-    
-    # Extract column names from the header row
-    column_names = df.iloc[header_row].tolist()
-    
-    # Create a new DataFrame with proper headers, skipping the header row
-    data_df = df.iloc[header_row+1:].reset_index(drop=True)
-    data_df.columns = range(len(data_df.columns))  # Reset to numeric columns
-    
-    # Map the column indices to meaningful names based on our analysis
-    column_mapping = {
-        0: 'SR_NO',
-        1: 'DESCRIPTION',
-        2: 'QTY',
-        3: 'IMAGE_NO',
-        4: 'IMAGE',
-        5: 'RACK_NO',
-        6: 'REMARKS'
-    }
+    # Map the column positions to meaningful names based on our analysis:
+    # 0 SR_NO, 1 DESCRIPTION, 2 QTY, 3 IMAGE_NO, 4 IMAGE, 5 RACK_NO, 6 REMARKS
+    description_col, qty_col, image_no_col, rack_col = columns[1], columns[2], columns[3], columns[5]
     
     # Map Excel columns to database fields
     cursor = conn.cursor()
@@ -306,48 +298,29 @@ def import_excel_data(conn, admin_id):
     VALUES (?, 'Imported Products', 'Products imported from Excel')
     ''', (category_id,))
     
-    # Create default location based on RACK NO column
+    # Rack locations are created the first time a rack is seen in the sheet
     location_mappings = {}
     
-    # Extract unique rack numbers from column 5 (RACK_NO)
-    rack_column = 5
-    unique_racks = set()
-    
-    for rack in data_df[rack_column].dropna().unique():
-        rack_name = str(rack).strip()
-        if rack_name:
-            unique_racks.add(rack_name)
-    
-    print(f"Found {len(unique_racks)} unique rack locations")
-    
-    for rack_name in unique_racks:
-        location_id = str(uuid.uuid4())
-        cursor.execute('''
-        INSERT INTO locations (location_id, name, description)
-        VALUES (?, ?, ?)
-        ''', (location_id, rack_name, f"Location imported from Excel: {rack_name}"))
-        location_mappings[rack_name] = location_id
-    
     # Default location for items without a rack
     default_location_id = str(uuid.uuid4())
     cursor.execute('''
-    INSERT INTO locations (location_id, name, description)
-    VALUES (?, 'Default Location', 'Default location for items without a specified rack')
+    INSERT INTO locations (location_id, name, description, type)
+    VALUES (?, 'Default Location', 'Default location for items without a specified rack', 'Warehouse')
     ''', (default_location_id,))
     
     # Import products and inventory
     imported_count = 0
     
-    for idx, row in data_df.iterrows():
+    for idx, row in enumerate(rows):
         try:
             # Skip rows without a description
-            if pd.isna(row[1]):  # DESCRIPTION is in column 1
+            product_name = cell_text(row[description_col])
+            if not product_name:
                 continue
                 
             # Create product
             product_id = str(uuid.uuid4())
-            product_name = str(row[1]).strip()  # DESCRIPTION
-            image_path = str(row[3]) if not pd.isna(row[3]) else ""  # IMAGE_NO
+            image_path = cell_text(row[image_no_col]) or ""  # IMAGE_NO
             
             cursor.execute('''
             INSERT INTO products (product_id, name, description, category_id, image_path)
@@ -355,12 +328,19 @@ def import_excel_data(conn, admin_id):
             ''', (product_id, product_name, product_name, category_id, image_path))
             
             # Get location
-            rack = str(row[5]).strip() if not pd.isna(row[5]) else ""  # RACK_NO
-            location_id = location_mappings.get(rack, default_location_id)
+            rack = cell_text(row[rack_col]) or ""  # RACK_NO
+            key = rack_key(rack)  # "R3 E1" and "R3E1" are the same rack
+            if key and key not in location_mappings:
+                location_mappings[key] = str(uuid.uuid4())
+                cursor.execute('''
+                INSERT INTO locations (location_id, name, description, type, rack_key)
+                VALUES (?, ?, ?, 'Rack', ?)
+                ''', (location_mappings[key], rack, f"Location imported from Excel: {rack}", key))
+            location_id = location_mappings.get(key, default_location_id)
             
             # Create inventory record
             inventory_id = str(uuid.uuid4())
-            quantity = int(row[2]) if not pd.isna(row[2]) else 0  # QTY
+            quantity = int(cell_number(row[qty_col]))  # QTY
             
             cursor.execute('''
             INSERT INTO inventory (inventory_id, product_id, location_id, quantity)
@@ -380,8 +360,10 @@ def import_excel_data(conn, admin_id):
         except Exception as e:
             print(f"Error importing row {idx+1}: {e}")
     
+    print(f"Found {len(location_mappings)} unique rack locations")
     conn.commit()
     print(f"Successfully imported {imported_count} products from Excel")
 
 if __name__ == "__main__":
-    create_database() 
\ No newline at end of file
+    with profile_from_argv('create_database'):
+        create_database()
@@ -1,11 +1,11 @@
 import os
-import sqlite3
-import uuid
-from PIL import Image, ImageDraw, ImageFont
+from placeholder_images import create_placeholders
+from db_connection import DB_FILE, connect
+from profiling import profile_from_argv
 
 # Configuration
-DB_FILE = "./data/inventory.db"
 UPLOADS_FOLDER = "./uploads/products"
+PLACEHOLDER_WORKERS = None  # Processes used to render placeholders (None = one per CPU)
 
 def create_placeholder_images():
     """Create placeholder images for all products in the database"""
@@ -22,7 +22,7 @@ def create_placeholder_images():
         print(f"Created uploads folder: {UPLOADS_FOLDER}")
     
     # Connect to database
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cursor = conn.cursor()
     
     try:
@@ -32,15 +32,13 @@ def create_placeholder_images():
         
         print(f"Found {len(products)} products")
         
-        # Create placeholder image for each product
-        for product_id, product_name in products:
-            image_path = create_placeholder_image(product_name, product_id)
-            
-            # Update product image path in database
-            cursor.execute(
-                "UPDATE products SET image_path = ? WHERE product_id = ?",
-                (image_path, product_id)
-            )
+        # Render each distinct name once, in parallel, and update all rows in one statement
+        image_paths = create_placeholders([product_name or '' for _, product_name in products], style='plain',
+                                          uploads_folder=UPLOADS_FOLDER, workers=PLACEHOLDER_WORKERS)
+        cursor.executemany(
+            "UPDATE products SET image_path = ? WHERE product_id = ?",
+            [(image_path, product_id) for (product_id, _), image_path in zip(products, image_paths)]
+        )
         
         # Commit changes
         conn.commit()
@@ -52,34 +50,6 @@ def create_placeholder_images():
     finally:
         conn.close()
 
-def create_placeholder_image(text, product_id):
-    """Create a placeholder image with the given text"""
-    width, height = 400, 400
-    background_color = (240, 240, 240)
-    text_color = (100, 100, 100)
-    
-    # Create a new image with the given background color
-    image = Image.new('RGB', (width, height), background_color)
-    draw = ImageDraw.Draw(image)
-    
-    # Try to load a font, use default if not available
-    try:
-        font = ImageFont.truetype("arial.ttf", 40)
-    except IOError:
-        font = ImageFont.load_default()
-    
-    # Draw the text in the center of the image
-    text_width, text_height = 200, 40  # Approximate values
-    position = ((width - text_width) // 2, (height - text_height) // 2)
-    draw.text(position, text[:20], fill=text_color, font=font)  # Limit text length
-    
-    # Save the image
-    filename = f"product_{product_id}.png"
-    filepath = os.path.join(UPLOADS_FOLDER, filename)
-    image.save(filepath)
-    
-    print(f"Created placeholder image: {filepath}")
-    return f"/uploads/products/{filename}"
-
 if __name__ == "__main__":
-    create_placeholder_images()
+    with profile_from_argv('create_placeholder_images'):
+        create_placeholder_images()
@@ -0,0 +1,179 @@
+"""Online backups of the inventory database.
+
+Backups are taken with SQLite's backup API (sqlite3.Connection.backup),
+which copies the database a few pages at a time and sleeps between steps,
+so the Node API can keep reading and writing while a backup runs. The
+result is always a consistent database, never a torn file copy.
+
+Backups are written to ./data/backups as inventory_backup_<timestamp>.db.gz
+(or .db without compression), and only the newest KEEP_BACKUPS are kept.
+SQLite has no page-level incremental backup. The nearest equivalent here:
+a run is skipped when the database and its WAL are unchanged since the
+last backup.
+
+The "snapshot" method uses VACUUM INTO instead. In WAL mode it copies from
+one read snapshot, so concurrent writes cannot make it restart. It also
+writes a compacted copy.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+BACKUP_FOLDER = "./data/backups"
+BACKUP_PREFIX = "inventory_backup_"
+BACKUP_PATTERN = re.compile(rf'^{BACKUP_PREFIX}\d{{8}}_\d{{6}}(_\d+)?\.db(\.gz)?$')
+STATE_FILE = "last_backup.json"  # Source fingerprint of the newest backup, kept in the backup folder
+PAGES_PER_STEP = 1024  # Pages copied per backup step (4 MB with the default page size)
+STEP_SLEEP = 0.01  # Seconds to sleep between steps so writers can get the lock
+KEEP_BACKUPS = 14
+CHUNK_SIZE = 1024 * 1024
+
+def source_fingerprint(db_file):
+    """Return size and mtime of the database and its WAL, used to detect unchanged databases"""
+    fingerprint = {}
+    for suffix in ('', '-wal'):
+        path = db_file + suffix
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprint[suffix or 'db'] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+def _progress_printer(label):
+    """Return a backup progress callback that prints at most once per 10%"""
+    last = [-1]
+
+    def progress(status, remaining, total):
+        if total <= 0:
+            return
+        percent = int((total - remaining) * 100 / total)
+        if percent // 10 > last[0] or remaining == 0:
+            last[0] = percent // 10
+            print(f"  {label}: {percent}% ({total - remaining}/{total} pages)")
+    return progress
+
+def _copy_online(db_file, target_file, pages, sleep):
+    """Copy db_file to target_file with the backup API, a few pages per step"""
+    source = connect(db_file)
+    target = sqlite3.connect(target_file)
+    try:
+        source.backup(target, pages=pages, progress=_progress_printer("Backup"), sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+
+def _copy_snapshot(db_file, target_file):
+    """Write a compacted copy of db_file from a single read snapshot (VACUUM INTO)"""
+    source = connect(db_file)
+    try:
+        source.execute("VACUUM INTO ?", (target_file,))
+    finally:
+        source.close()
+
+def _compress(source_file, target_file):
+    """gzip source_file into target_file"""
+    with open(source_file, 'rb') as source, gzip.open(target_file, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+def list_backups(backup_folder=BACKUP_FOLDER):
+    """Return the backup files in backup_folder, oldest first"""
+    if not os.path.isdir(backup_folder):
+        return []
+    paths = [os.path.join(backup_folder, name) for name in os.listdir(backup_folder) if BACKUP_PATTERN.match(name)]
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+def prune_backups(backup_folder=BACKUP_FOLDER, keep=KEEP_BACKUPS):
+    """Delete all but the newest keep backups; returns the deleted paths"""
+    backups = list_backups(backup_folder)
+    expired = backups[:-keep] if keep > 0 else []
+    for path in expired:
+        os.remove(path)
+        print(f"Pruned old backup: {path}")
+    return expired
+
+def backup_database(db_file=DB_FILE, backup_folder=BACKUP_FOLDER, compress=True, keep=KEEP_BACKUPS,
+                    pages=PAGES_PER_STEP, sleep=STEP_SLEEP, method='backup', force=False):
+    """Back up db_file while it stays in use and return the backup path.
+
+    method is 'backup' (page-stepped backup API) or 'snapshot' (VACUUM INTO).
+    Unless force is set, the previous backup path is returned without a new
+    copy when the database has not changed since it was taken.
+    """
+    os.makedirs(backup_folder, exist_ok=True)
+    state_file = os.path.join(backup_folder, STATE_FILE)
+    fingerprint = source_fingerprint(db_file)
+
+    if not force and os.path.exists(state_file):
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('source') == fingerprint and os.path.exists(state.get('backup', '')):
+                print(f"Database unchanged since last backup: {state['backup']}")
+                return state['backup']
+        except (OSError, ValueError):
+            pass
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_file = os.path.join(backup_folder, f"{BACKUP_PREFIX}{timestamp}.db")
+    suffix = 1
+    while os.path.exists(backup_file) or os.path.exists(backup_file + '.gz'):
+        backup_file = os.path.join(backup_folder, f"{BACKUP_PREFIX}{timestamp}_{suffix}.db")
+        suffix += 1
+    partial_file = backup_file + '.partial'
+
+    started = time.perf_counter()
+    try:
+        if method == 'snapshot':
+            _copy_snapshot(db_file, partial_file)
+        else:
+            _copy_online(db_file, partial_file, pages, sleep)
+        if compress:
+            _compress(partial_file, partial_file + '.gz')
+            os.remove(partial_file)
+            partial_file += '.gz'
+            backup_file += '.gz'
+        os.replace(partial_file, backup_file)
+    except Exception:
+        for path in (partial_file, partial_file + '.gz'):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    elapsed = time.perf_counter() - started
+    print(f"Created backup: {backup_file} ({os.path.getsize(backup_file) / 1024 / 1024:.1f} MB, {elapsed:.2f}s)")
+
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump({'source': fingerprint, 'backup': backup_file}, f)
+    prune_backups(backup_folder, keep)
+    return backup_file
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up the inventory database while it is in use')
+    parser.add_argument('db_file', nargs='?', default=DB_FILE, help='Path to the SQLite database')
+    parser.add_argument('--folder', default=BACKUP_FOLDER, help='Backup folder')
+    parser.add_argument('--method', choices=('backup', 'snapshot'), default='backup',
+                        help='backup: page-stepped backup API; snapshot: VACUUM INTO from one read snapshot')
+    parser.add_argument('--no-compress', action='store_true', help='Write a plain .db file instead of .db.gz')
+    parser.add_argument('--keep', type=int, default=KEEP_BACKUPS, help='Number of backups to keep')
+    parser.add_argument('--pages', type=int, default=PAGES_PER_STEP, help='Pages copied per backup step')
+    parser.add_argument('--sleep', type=float, default=STEP_SLEEP, help='Seconds to pause between steps')
+    parser.add_argument('--force', action='store_true', help='Back up even if the database is unchanged')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('db_backup', args.profile, args.profile_top):
+        if not os.path.exists(args.db_file):
+            print(f"Error: Database file '{args.db_file}' not found!")
+            return
+        backup_database(args.db_file, args.folder, compress=not args.no_compress, keep=args.keep,
+                        pages=args.pages, sleep=args.sleep, method=args.method, force=args.force)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Shared SQLite connection factory for the Python scripts.
+
+Every script used to call sqlite3.connect with the defaults: rollback
+journal, synchronous=FULL, a 2 MB page cache and no busy timeout. It then
+failed with "database is locked" whenever the Node API was writing. connect()
+opens the database with one of the tuned PROFILES below. The database path
+follows the Node app: the DB_FILENAME environment variable, or
+./data/inventory.db.
+"""
+import os
+import sqlite3
+
+DB_FILE = os.environ.get('DB_FILENAME') or "./data/inventory.db"
+
+# PRAGMA settings per profile, applied in this order. WAL lets readers and one
+# writer work concurrently and, with synchronous=NORMAL, fsyncs only at
+# checkpoints instead of on every commit.
+PROFILES = {
+    'default': {
+        'busy_timeout': 30000,  # ms to wait for a lock held by another process
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,  # 64 MB (negative values are KiB)
+        'mmap_size': 268435456,  # 256 MB
+        'temp_store': 'MEMORY',
+    },
+    # Imports: larger cache and fewer, bigger checkpoints while writing many rows
+    'bulk': {
+        'busy_timeout': 60000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -262144,  # 256 MB
+        'mmap_size': 1073741824,  # 1 GB
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 10000,  # pages (~40 MB) between automatic checkpoints
+    },
+    # Reporting and checks: never writes
+    'readonly': {
+        'busy_timeout': 30000,
+        'query_only': 'ON',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+}
+
+def apply_profile(conn, profile='default'):
+    """Apply a profile's PRAGMA settings to an open connection"""
+    for pragma, value in PROFILES[profile].items():
+        if pragma == 'journal_mode':
+            # Switching to WAL is persistent and needs no other connection in a
+            # transaction; keep the current mode if that is not possible now
+            try:
+                conn.execute(f"PRAGMA journal_mode = {value}")
+            except sqlite3.OperationalError as e:
+                print(f"Could not switch journal mode to {value}: {e}")
+        else:
+            conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
+
+def connect(db_file=None, profile='default', **kwargs):
+    """Open the database with a tuned profile ('default', 'bulk' or 'readonly').
+
+    Extra keyword arguments are passed to sqlite3.connect.
+    """
+    db_file = db_file or DB_FILE
+    timeout = PROFILES[profile]['busy_timeout'] / 1000
+    if profile == 'readonly':
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_file)}?mode=ro", uri=True, timeout=timeout, **kwargs)
+    else:
+        conn = sqlite3.connect(db_file, timeout=timeout, **kwargs)
+    return apply_profile(conn, profile)
+
+def checkpoint(conn, mode='PASSIVE'):
+    """Run a WAL checkpoint; PASSIVE never blocks readers or writers"""
+    return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
@@ -0,0 +1,112 @@
+"""Indexes for the lookups the import scripts run per row, and a check for them.
+
+The importers look up rack locations by (name, type) and update_rack_locations
+looks up products by name. Without indexes each lookup scans the whole table.
+ensure_indexes creates covering indexes for these access patterns;
+running this module prints the query plan of every hot-path query and exits
+non-zero when one of them still scans a table.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+
+# (index name, table, columns); the trailing id column makes the indexes
+# covering, so the lookups never touch the table rows
+IMPORT_INDEXES = [
+    ('idx_locations_name_type', 'locations', ('name', 'type', 'location_id')),
+    ('idx_products_name', 'products', ('name', 'product_id')),
+    # Latest transaction of an inventory row, for the db_integrity quantity check
+    ('idx_inventory_transactions_latest', 'inventory_transactions', ('product_id', 'location_id', 'created_at')),
+]
+
+# Queries the importers run once per row, with sample parameters for EXPLAIN
+HOT_PATH_QUERIES = [
+    ("rack lookup",
+     "SELECT location_id FROM locations WHERE name = ? AND type = 'Rack'", ('R1',)),
+    ("rack key lookup",
+     "SELECT location_id FROM locations WHERE rack_key = ?", ('R1E1',)),
+    ("location by name",
+     "SELECT location_id FROM locations WHERE name = ?", ('Main Warehouse',)),
+    ("product by name",
+     "SELECT product_id FROM products WHERE name = ?", ('CHAIR',)),
+    ("inventory row",
+     "SELECT inventory_id FROM inventory WHERE product_id = ? AND location_id = ?", ('p', 'l')),
+    ("latest transaction",
+     "SELECT new_quantity FROM inventory_transactions WHERE product_id = ? AND location_id = ? "
+     "ORDER BY created_at DESC, rowid DESC LIMIT 1", ('p', 'l')),
+]
+
+def table_columns(conn, table):
+    """Return the column names of a table (empty if the table does not exist)"""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def ensure_indexes(conn):
+    """Create the import indexes that are missing; returns the names created"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for name, table, columns in IMPORT_INDEXES:
+        if name in existing:
+            continue
+        missing = set(columns) - table_columns(conn, table)
+        if missing:
+            print(f"Skipping index {name}: {table} has no column(s) {', '.join(sorted(missing))}")
+            continue
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+        created.append(name)
+        print(f"Created index {name} on {table} ({', '.join(columns)})")
+    return created
+
+def query_plan(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines of a query"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def scanning_queries(conn, queries=HOT_PATH_QUERIES):
+    """Return [(label, plan detail)] for every query whose plan scans a table"""
+    scans = []
+    for label, sql, params in queries:
+        try:
+            plan = query_plan(conn, sql, params)
+        except sqlite3.OperationalError as e:
+            scans.append((label, f"cannot plan query: {e}"))
+            continue
+        for detail in plan:
+            print(f"  {label}: {detail}")
+            if detail.startswith('SCAN') and 'CONSTANT ROW' not in detail:
+                scans.append((label, detail))
+    return scans
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the importer lookups use indexes')
+    parser.add_argument('db_file', nargs='?', default=DB_FILE, help='Path to the SQLite database')
+    parser.add_argument('--create', action='store_true', help='Create missing indexes before checking')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('db_indexes', args.profile, args.profile_top):
+        if not os.path.exists(args.db_file):
+            print(f"Error: Database file '{args.db_file}' not found!")
+            sys.exit(2)
+
+        conn = connect(args.db_file)
+        try:
+            if args.create:
+                ensure_indexes(conn)
+                conn.commit()
+            print(f"Query plans for {args.db_file}:")
+            scans = scanning_queries(conn)
+        finally:
+            conn.close()
+
+        if scans:
+            print(f"\n{len(scans)} importer queries fall back to a table scan:")
+            for label, detail in scans:
+                print(f"  - {label}: {detail}")
+            sys.exit(1)
+        print("\nAll importer queries use an index")
+
+if __name__ == "__main__":
+    main()
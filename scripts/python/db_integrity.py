@@ -0,0 +1,196 @@
+"""Set-based integrity checks of the inventory database.
+
+Each check is one SQL query that returns the offending rows (orphaned
+inventory, dangling foreign keys, duplicate SKUs, stock that disagrees with
+the transaction log), so the database does the work in a single pass instead
+of the scripts walking the rows. Checks are independent and run in parallel,
+each on its own read-only connection. With a sample size, tables larger than
+that are checked on a few random rowid windows only, which are found through
+the rowid b-tree without scanning the table: a pre-deploy gate on a
+production-sized database then takes seconds. Use the full run (no sample)
+for a complete audit.
+"""
+import random
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from db_connection import connect
+from db_indexes import query_plan
+
+MAX_ROWS = 1000  # Offending rows fetched per check
+SAMPLE_WINDOWS = 8  # Random rowid ranges a sampled table is read from
+CHECK_TIMEOUT = 60.0  # Seconds before a check is interrupted
+PROGRESS_OPS = 10000  # SQLite VM instructions between timeout checks
+
+# name, description, tables the check needs (the first one is the table it
+# reads row by row and the one that gets sampled), SQL with {source} for that
+# table, and optionally a different SQL for sampled runs
+Check = namedtuple('Check', ['name', 'description', 'tables', 'sql', 'sample_sql'], defaults=[None])
+
+CHECKS = [
+    Check('inventory_orphan_product', 'Inventory rows whose product does not exist',
+          ('inventory', 'products'), """
+          SELECT i.inventory_id, i.product_id, i.location_id, i.quantity
+          FROM {source} i
+          WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.product_id = i.product_id)
+          """),
+    Check('inventory_dangling_location', 'Inventory rows whose location does not exist',
+          ('inventory', 'locations'), """
+          SELECT i.inventory_id, i.product_id, i.location_id, i.quantity
+          FROM {source} i
+          WHERE NOT EXISTS (SELECT 1 FROM locations l WHERE l.location_id = i.location_id)
+          """),
+    Check('product_dangling_category', 'Products whose category_id does not exist',
+          ('products', 'categories'), """
+          SELECT p.product_id, p.sku, p.name, p.category_id
+          FROM {source} p
+          WHERE p.category_id IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.category_id = p.category_id)
+          """),
+    Check('transaction_dangling_refs', 'Inventory transactions whose product or location does not exist',
+          ('inventory_transactions', 'products', 'locations'), """
+          SELECT t.transaction_id, t.product_id, t.location_id, t.created_at
+          FROM {source} t
+          WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.product_id = t.product_id)
+             OR NOT EXISTS (SELECT 1 FROM locations l WHERE l.location_id = t.location_id)
+          """),
+    # The UNIQUE constraint only stops exact duplicates; SKUs that differ in
+    # case or surrounding spaces are the same SKU to the people scanning them
+    Check('duplicate_sku', 'SKUs used by more than one product (ignoring case and spaces)',
+          ('products',), """
+          SELECT upper(trim(p.sku)) AS sku, COUNT(*) AS products, group_concat(p.product_id) AS product_ids
+          FROM {source} p
+          WHERE p.sku IS NOT NULL AND trim(p.sku) != ''
+          GROUP BY upper(trim(p.sku))
+          HAVING COUNT(*) > 1
+          """,
+          # A GROUP BY over a sample only sees duplicates inside the sample:
+          # probe the sku index for the common variants of each sampled SKU
+          """
+          SELECT p.product_id, p.sku, q.product_id AS duplicate_product_id, q.sku AS duplicate_sku
+          FROM {source} p
+          JOIN products q ON q.sku IN (trim(p.sku), upper(trim(p.sku)), lower(trim(p.sku)))
+                         AND q.product_id != p.product_id
+          WHERE p.sku IS NOT NULL AND trim(p.sku) != ''
+          """),
+    # Latest transaction per inventory row through the
+    # idx_inventory_transactions_latest index (see db_indexes)
+    Check('quantity_mismatch', 'Inventory quantity differs from the latest transaction new_quantity',
+          ('inventory', 'inventory_transactions'), """
+          SELECT inventory_id, product_id, location_id, quantity, latest_quantity
+          FROM (
+              SELECT i.inventory_id, i.product_id, i.location_id, i.quantity,
+                     (SELECT t.new_quantity FROM inventory_transactions t
+                      WHERE t.product_id = i.product_id AND t.location_id = i.location_id
+                        AND t.new_quantity IS NOT NULL
+                      ORDER BY t.created_at DESC, t.rowid DESC LIMIT 1) AS latest_quantity
+              FROM {source} i
+          )
+          WHERE latest_quantity IS NOT NULL AND latest_quantity != quantity
+          """),
+]
+
+def existing_tables(conn):
+    """Return the names of the tables in the database"""
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def estimated_rows(conn, table):
+    """Upper bound of a table's row count from its largest rowid (no table scan)"""
+    return conn.execute(f"SELECT max(rowid) FROM {table}").fetchone()[0] or 0
+
+def sample_source(conn, table, sample, rng):
+    """Return (source SQL, sampled) for a table: the table itself, or random rowid windows of it"""
+    if not sample:
+        return table, False
+    max_rowid = estimated_rows(conn, table)
+    if max_rowid <= sample:
+        return table, False
+    size = max(1, sample // SAMPLE_WINDOWS)
+    starts = sorted(rng.randint(1, max_rowid - size + 1) for _ in range(SAMPLE_WINDOWS))
+    ranges = ' OR '.join(f"rowid BETWEEN {start} AND {start + size - 1}" for start in starts)
+    return f"(SELECT * FROM {table} WHERE {ranges})", True
+
+def check_sql(check, source, sampled, max_rows):
+    """Return the SQL of a check over source, limited to max_rows + 1 rows"""
+    sql = check.sample_sql if sampled and check.sample_sql else check.sql
+    return f"{sql.format(source=source).strip()}\nLIMIT {max_rows + 1}"
+
+def unindexed_scans(conn, sql, sampled):
+    """Plan lines of a check that scan a table besides the one it reads on purpose.
+
+    A full run scans its driving table (the first scan of the plan); a sampled
+    run should not scan anything.
+    """
+    scans = [detail for detail in query_plan(conn, sql)
+             if detail.startswith('SCAN') and 'CONSTANT ROW' not in detail and 'SUBQUERY' not in detail]
+    return list(dict.fromkeys(scans if sampled else scans[1:]))
+
+def run_check(db_file, check, sample=None, seed=None, max_rows=MAX_ROWS, timeout=CHECK_TIMEOUT):
+    """Run one check on its own read-only connection and return its result dict"""
+    result = {'check': check.name, 'description': check.description, 'status': 'ok',
+              'rows': [], 'columns': [], 'truncated': False, 'sampled': False, 'warnings': []}
+    started = time.perf_counter()
+    conn = connect(db_file, profile='readonly')
+    try:
+        missing = set(check.tables) - existing_tables(conn)
+        if missing:
+            result['status'] = 'skipped'
+            result['warnings'].append(f"missing table(s): {', '.join(sorted(missing))}")
+            return result
+
+        rng = random.Random(f"{seed}:{check.name}")
+        source, result['sampled'] = sample_source(conn, check.tables[0], sample, rng)
+        sql = check_sql(check, source, result['sampled'], max_rows)
+        for detail in unindexed_scans(conn, sql, result['sampled']):
+            result['warnings'].append(f"no index, full scan: {detail} (see db_indexes.py --create)")
+
+        deadline = started + timeout
+        conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_OPS)
+        cursor = conn.execute(sql)
+        rows = cursor.fetchall()
+        result['columns'] = [column[0] for column in cursor.description]
+        result['truncated'] = len(rows) > max_rows
+        result['rows'] = rows[:max_rows]
+        if rows:
+            result['status'] = 'failed'
+    except sqlite3.OperationalError as e:
+        result['status'] = 'error'
+        result['warnings'].append(f"timed out after {timeout:.0f}s" if 'interrupted' in str(e) else str(e))
+    finally:
+        conn.close()
+        result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+def run_checks(db_file, checks=CHECKS, sample=None, seed=None, workers=None,
+               max_rows=MAX_ROWS, timeout=CHECK_TIMEOUT):
+    """Run the checks in parallel and return their results in the order of checks"""
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    with ThreadPoolExecutor(max_workers=workers or len(checks)) as executor:
+        futures = [executor.submit(run_check, db_file, check, sample, seed, max_rows, timeout)
+                   for check in checks]
+        results = [future.result() for future in futures]
+    for result in results:
+        result['seed'] = seed
+    return results
+
+def print_results(results, examples=5):
+    """Print one line per check and a few offending rows of the failed ones"""
+    for result in results:
+        found = len(result['rows'])
+        count = f"{found}{'+' if result['truncated'] else ''} row(s)" if found else ''
+        sampled = ' [sampled]' if result['sampled'] else ''
+        print(f"  {result['status'].upper():<8} {result['check']:<28} {result['seconds']:>7.2f}s{sampled} {count}")
+        for warning in result['warnings']:
+            print(f"           {warning}")
+        if result['status'] == 'failed':
+            print(f"           {result['description']}; {', '.join(result['columns'])}:")
+            for row in result['rows'][:examples]:
+                print(f"             {row}")
+    if any(result['sampled'] for result in results):
+        print(f"  Sampled with seed {results[0]['seed']} (pass --seed to repeat)")
+
+def failed(results):
+    """True when a check found problems or could not run to the end"""
+    return any(result['status'] in ('failed', 'error') for result in results)
@@ -0,0 +1,133 @@
+"""Streaming, read-only access to packing-list worksheets.
+
+The importers used to load whole sheets into pandas (sometimes twice, just to
+find the header row). This module opens the workbook once in openpyxl's
+read-only mode, detects the header within the first few rows and yields one
+record per data row, so memory stays flat regardless of the sheet size.
+"""
+import openpyxl
+
+# Cells that identify the header row of a packing list
+HEADER_MARKERS = ('SR No', 'DESCRIPTION', 'IMAGE NO')
+HEADER_SCAN_ROWS = 10
+
+def find_header_row(rows, markers=HEADER_MARKERS):
+    """Return the index of the first row containing one of the header markers, or None"""
+    for index, row in enumerate(rows):
+        for cell in row:
+            if isinstance(cell, str) and any(marker in cell for marker in markers):
+                return index
+    return None
+
+def column_names(header):
+    """Clean header cells into column names, matching pandas' naming for blanks and duplicates"""
+    names = []
+    seen = {}
+    for index, cell in enumerate(header):
+        name = str(cell).strip() if cell is not None else ''
+        if not name:
+            name = f"Unnamed: {index}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def clean_value(value):
+    """Strip strings and turn blank cells into None; numbers and dates keep their type"""
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+def read_sheet(excel_file, sheet_name=None, header_row=None, markers=HEADER_MARKERS, scan_rows=HEADER_SCAN_ROWS,
+               with_row_numbers=False):
+    """Open a worksheet for streaming.
+
+    Returns (columns, header_row, rows) where rows is a generator of dicts
+    mapping column name -> cell value. The header is detected in the first
+    scan_rows rows unless header_row (0-based) is given. Completely empty
+    rows are skipped. With with_row_numbers=True the generator yields
+    (Excel row number, record) pairs instead, using Excel's 1-based
+    numbering. The workbook is closed once the generator is exhausted or
+    closed.
+    """
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.active
+        row_iter = sheet.iter_rows(values_only=True)
+
+        # Buffer only the rows needed to locate the header
+        scan_limit = max(scan_rows, (header_row or 0) + 1)
+        leading = []
+        for row in row_iter:
+            leading.append(row)
+            if len(leading) >= scan_limit:
+                break
+
+        if header_row is None:
+            header_row = find_header_row(leading, markers)
+            if header_row is None:
+                print("Could not find header row, assuming first row")
+                header_row = 0
+
+        header = leading[header_row] if header_row < len(leading) else ()
+        columns = column_names(header)
+    except Exception:
+        workbook.close()
+        raise
+
+    def records():
+        try:
+            rows = _chain(leading[header_row + 1:], row_iter)
+            for row_number, row in enumerate(rows, start=header_row + 2):
+                values = [clean_value(value) for value in row]
+                if all(value is None for value in values):
+                    continue
+                if len(values) < len(columns):
+                    values.extend([None] * (len(columns) - len(values)))
+                record = dict(zip(columns, values))
+                yield (row_number, record) if with_row_numbers else record
+        finally:
+            workbook.close()
+
+    return columns, header_row, records()
+
+def sheet_names(excel_file):
+    """List the sheet names of a workbook without loading any cells"""
+    workbook = openpyxl.load_workbook(excel_file, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+def active_sheet_name(excel_file):
+    """Return the name of the sheet read_sheet opens when no sheet name is given"""
+    workbook = openpyxl.load_workbook(excel_file, read_only=True)
+    try:
+        return workbook.active.title
+    finally:
+        workbook.close()
+
+def cell_text(value):
+    """Return a cell value as stripped text, or None when blank"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+def cell_number(value, default=0):
+    """Return a cell value as a float, or default when it is blank or not numeric"""
+    if value is None or isinstance(value, bool):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def _chain(buffered, remaining):
+    """Yield the buffered rows and then the rest of the sheet iterator"""
+    yield from buffered
+    yield from remaining
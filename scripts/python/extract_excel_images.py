@@ -1,14 +1,26 @@
 import os
-import sqlite3
-import openpyxl
-from openpyxl_image_loader import SheetImageLoader
-import pandas as pd
+import time
+import zipfile
+import argparse
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
+from excel_reader import cell_text
+from layout_cache import open_layout
+from xlsx_media import read_sheet_images, ImageIndex, cell_range
+from image_store import store_image_stream, store_pil_image
+from import_metrics import RunMetrics, add_metrics_arguments
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
 
 # Configuration
-DB_FILE = "./arper_inventory.db"  # Main database file
 EXCEL_FILE = "PL- ARPER.xlsx"  # Excel file containing images
 UPLOADS_FOLDER = "uploads/products"
+DEFAULT_WORKERS = None  # Process pool size for the parallel mode (None = CPU count)
+IMAGE_FORMATS = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp'}
+
+# Workbook archive opened once per worker process
+_worker_archive = None
 
 def ensure_uploads_folder():
     """Ensure the uploads folder exists"""
@@ -16,7 +28,7 @@ def ensure_uploads_folder():
         os.makedirs(UPLOADS_FOLDER, exist_ok=True)
         print(f"Created directory: {UPLOADS_FOLDER}")
 
-def extract_images_from_excel():
+def extract_images_from_excel(debug=False, metrics_file=None):
     """Extract images embedded in the Excel file and map them to products"""
     ensure_uploads_folder()
     
@@ -31,7 +43,7 @@ def extract_images_from_excel():
         return
     
     # Connect to SQLite database
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cursor = conn.cursor()
     
     # Get all products from the database
@@ -44,165 +56,254 @@ def extract_images_from_excel():
     products = cursor.fetchall()
     print(f"Found {len(products)} products in database")
     
-    # Load the Excel file to find header row
+    # Create a mapping from product name to product_id
+    product_name_to_id = {}
+    for product_id, product_name, _ in products:
+        product_name_to_id.setdefault(product_name.strip(), product_id)
+    
+    # Stream the sheet; the header row and columns come from the cached layout of its format
     print(f"Loading Excel file: {EXCEL_FILE}")
-    df = pd.read_excel(EXCEL_FILE, header=None, engine='openpyxl')
-    
-    # Find the header row by looking for "SR No" or "DESCRIPTION"
-    header_row = None
-    for i in range(min(20, len(df))):
-        row = df.iloc[i]
-        for cell in row:
-            if isinstance(cell, str) and ('SR No' in cell or 'DESCRIPTION' in cell or 'IMAGE NO' in cell):
-                header_row = i
-                break
-        if header_row is not None:
-            break
-    
-    if header_row is None:
-        print("Could not find header row, assuming first row")
-        header_row = 0
-    
-    # Load the Excel sheet with the image loader
-    wb = openpyxl.load_workbook(EXCEL_FILE)
-    sheet = wb.active
-    image_loader = SheetImageLoader(sheet)
-    
-    # Find column indices
-    df = pd.read_excel(EXCEL_FILE, header=header_row, engine='openpyxl')
-    
-    # Clean column names
-    df.columns = [str(col).strip() for col in df.columns]
-    print(f"Columns in Excel: {df.columns.tolist()}")
+    metrics = RunMetrics('extract_excel_images', debug=debug, metrics_file=metrics_file)
+    layout, rows = open_layout(EXCEL_FILE, scan_rows=20, with_row_numbers=True)
+    columns = layout['columns']
+    print(f"Columns in Excel: {columns}")
     
     # Identify the relevant columns
-    name_col = next((col for col in df.columns if 'DESCRIPTION' in col), None)
-    image_no_col = next((col for col in df.columns if 'IMAGE NO' in col), None)
-    image_col = next((col for col in df.columns if col == 'IMAGE'), None)
-    
-    if not name_col:
-        name_col = 'Unnamed: 1'  # Fallback based on observation
-    if not image_no_col:
-        image_no_col = 'Unnamed: 3' # Fallback based on observation
-    if not image_col:
-        image_col = 'Unnamed: 4' # Fallback based on observation
+    name_col = layout['mapping']['name']
+    image_no_col = layout['mapping']['image_no']
+    image_col = layout['mapping']['image']
         
     print(f"Using columns: Product Name='{name_col}', Image No='{image_no_col}', Image='{image_col}'")
     
-    # Create a mapping from product name to product_id
-    product_name_to_id = {}
-    product_id_to_name = {}
-    for product in products:
-        product_id, product_name, _ = product
-        product_name_to_id[product_name] = product_id
-        product_id_to_name[product_id] = product_name
+    # Pictures are matched to rows through their drawing anchors; the IMAGE
+    # column (IMAGE NO as fallback) decides between pictures on the same row
+    image_col_index = columns.index(image_col) if image_col in columns else (
+        columns.index(image_no_col) if image_no_col in columns else None)
     
     # Extract images from Excel and save them
     updated_count = 0
     skipped_count = 0
     not_found_count = 0
     
-    # List all cells with images
-    if hasattr(image_loader, '_images'):
-        print(f"Total images found in Excel: {len(image_loader._images)}")
-        print(f"Images in these cells: {list(image_loader._images.keys())[:10]}...")
-    else:
-        print("No _images attribute found in image_loader")
-    
-    # Process each row in the Excel
-    for index, row in df.iterrows():
-        # Skip rows with no product name
-        if pd.isna(row[name_col]) or row[name_col] == 'DESCRIPTION':
-            continue
-            
-        product_name = str(row[name_col]).strip()
-        
-        # Look for product in database
-        product_id = None
-        for db_product in products:
-            db_id, db_name, _ = db_product
-            if db_name.strip() == product_name:
-                product_id = db_id
-                break
+    with zipfile.ZipFile(EXCEL_FILE) as archive:
+        # Read every drawing anchor once into a row interval index
+        image_index = ImageIndex(read_sheet_images(archive))
+        spanning = image_index.multi_row()
+        print(f"Total images found in Excel: {len(image_index)}")
+        if spanning:
+            print(f"Images spanning several rows: {', '.join(cell_range(image) for image in spanning[:10])}"
+                  f"{'...' if len(spanning) > 10 else ''}")
         
-        if not product_id:
-            print(f"Could not find product '{product_name}' in database")
-            not_found_count += 1
-            continue
-            
-        # Try to get image from the IMAGE column
-        excel_row = index + header_row + 2  # +2 for Excel's 1-indexed rows and header offset
+        # Product name per Excel row, in one streaming pass
+        row_products = {}
+        for excel_row, row in metrics.timed(rows):
+            product_name = cell_text(row.get(name_col))
+            if product_name and product_name != 'DESCRIPTION':
+                row_products[excel_row] = product_name
+        with metrics.phase('resolve'):
+            row_images = image_index.row_images((excel_row - 1 for excel_row in row_products), image_col_index)
+        metrics.total = len(row_products)
         
-        # Construct cell references for both potential image columns
-        image_cell_refs = []
+        stored = {}  # media part -> stored image path
         
-        # IMAGE column (usually E)
-        if image_col:
-            if isinstance(image_col, int):
-                col_letter = chr(65 + image_col)
-            else:
-                col_idx = df.columns.get_loc(image_col)
-                col_letter = chr(65 + col_idx)
-            image_cell_refs.append(f"{col_letter}{excel_row}")
-
-        # IMAGE NO column (usually D)
-        if image_no_col:
-            if isinstance(image_no_col, int):
-                col_letter = chr(65 + image_no_col)
-            else:
-                col_idx = df.columns.get_loc(image_no_col)
-                col_letter = chr(65 + col_idx)
-            image_cell_refs.append(f"{col_letter}{excel_row}")
+        # Process each product row in the Excel
+        for excel_row, product_name in row_products.items():
+            metrics.advance()
+            # Look for product in database
+            product_id = product_name_to_id.get(product_name)
+            if not product_id:
+                metrics.debug(f"Could not find product '{product_name}' in database")
+                not_found_count += 1
+                continue
             
-        # Also try neighboring cells
-        for cell_ref in list(image_cell_refs):
-            col_letter = cell_ref[0]
-            for offset in [-1, 1, 2]:
-                new_col_letter = chr(ord(col_letter) + offset)
-                image_cell_refs.append(f"{new_col_letter}{excel_row}")
-                
-        print(f"Processing row {excel_row}, product: {product_name}, checking cells: {image_cell_refs}")
+            image = row_images.get(excel_row - 1)
+            if image is None:
+                metrics.debug(f"No image found for {product_name} in row {excel_row}")
+                metrics.count('without_image')
+                continue
             
-        # Try all possible cells
-        image_found = False
-        for cell_ref in image_cell_refs:
             try:
-                if cell_ref in image_loader._images:
-                    img = image_loader.get(cell_ref)
-                    
-                    # Save the image to the uploads folder
-                    file_ext = ".jpg"  # Default to jpg
-                    new_filename = f"product_{product_id}{file_ext}"
-                    target_path = os.path.join(UPLOADS_FOLDER, new_filename)
-                    
-                    img.save(target_path)
-                    print(f"Saved image from {cell_ref} to {target_path}")
-                    
-                    # Update database
-                    db_image_path = f"/uploads/products/{new_filename}"
+                if image['media'] not in stored:
+                    # Save the image to the content-addressed uploads store
+                    with metrics.phase('image'):
+                        img = Image.open(BytesIO(archive.read(image['media'])))
+                        stored[image['media']] = store_pil_image(img, '.jpg', UPLOADS_FOLDER)
+                db_image_path = stored[image['media']]
+                metrics.debug(f"Saved image from {cell_range(image)} to {db_image_path}")
+                
+                # Update database
+                with metrics.phase('insert'):
                     cursor.execute(
                         "UPDATE products SET image_path = ? WHERE product_id = ?",
                         (db_image_path, product_id)
                     )
-                    updated_count += 1
-                    print(f"Updated product {product_name} with image from Excel")
-                    image_found = True
-                    break
+                updated_count += 1
+                metrics.debug(f"Updated product {product_name} with image from Excel")
             except Exception as e:
-                print(f"Error with cell {cell_ref}: {e}")
-        
-        if not image_found:
-            print(f"No image found for {product_name} in any of the checked cells")
+                metrics.count('failed')
+                metrics.info(f"Error with image at {cell_range(image)}: {e}")
     
     # Commit changes and close connections
-    conn.commit()
+    with metrics.phase('commit'):
+        conn.commit()
     conn.close()
-    wb.close()
     
     print(f"\nResults:")
     print(f"- {updated_count} products updated with images from Excel")
     print(f"- {skipped_count} products already had proper images")
     print(f"- {not_found_count} products in Excel not found in database")
+    metrics.count('updated', updated_count)
+    metrics.count('not_found', not_found_count)
+    metrics.finish(file=EXCEL_FILE, mode='sequential')
+
+def _open_worker_archive(excel_file):
+    """Process pool initializer: open the workbook zip once per worker"""
+    global _worker_archive
+    _worker_archive = zipfile.ZipFile(excel_file)
+
+def _render_media(job):
+    """Decode, resize and re-encode one embedded picture into the image store (runs in a worker process)"""
+    media_part, file_ext, max_size = job
+    img = Image.open(BytesIO(_worker_archive.read(media_part)))
+    if max_size:
+        img.thumbnail((max_size, max_size))
+    return store_pil_image(img, file_ext, UPLOADS_FOLDER)
+
+def extract_images_parallel(workers=DEFAULT_WORKERS, max_size=None, image_format=None, debug=False, metrics_file=None):
+    """Extract embedded pictures straight from the xlsx zip and map them to products.
+
+    Picture anchors are read from the sheet's drawing part, so nothing is
+    decoded to find out which row a picture belongs to. Without max_size or
+    image_format the original bytes are streamed to disk unchanged;
+    otherwise decoding, resizing and saving run in a process pool.
+    """
+    ensure_uploads_folder()
+    
+    if not os.path.exists(EXCEL_FILE):
+        print(f"Error: Excel file '{EXCEL_FILE}' not found!")
+        return
+        
+    print(f"Looking for database at: {os.path.abspath(DB_FILE)}")
+    if not os.path.exists(DB_FILE):
+        print(f"Error: Database file '{DB_FILE}' not found!")
+        return
+    
+    metrics = RunMetrics('extract_excel_images', debug=debug, metrics_file=metrics_file)
+    conn = connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT product_id, name FROM products ORDER BY name")
+    product_ids = {}
+    for product_id, product_name in cursor.fetchall():
+        product_ids.setdefault(product_name.strip(), product_id)
+    print(f"Found {len(product_ids)} products in database")
+    
+    # Map Excel row numbers to product names in one streaming pass
+    layout, rows = open_layout(EXCEL_FILE, scan_rows=20, with_row_numbers=True)
+    name_col = layout['mapping']['name']
+    image_col = layout['mapping']['image']
+    image_col_index = layout['columns'].index(image_col) if image_col in layout['columns'] else None
+    row_products = {}
+    for row_number, row in metrics.timed(rows):
+        product_name = cell_text(row.get(name_col))
+        if product_name and product_name != 'DESCRIPTION':
+            row_products[row_number] = product_name
+    
+    transform = bool(max_size or image_format)
+    not_found_count = 0
+    jobs = []
+    with zipfile.ZipFile(EXCEL_FILE) as archive:
+        image_index = ImageIndex(read_sheet_images(archive))
+        print(f"Total images found in Excel: {len(image_index)} ({len(image_index.multi_row())} spanning several rows)")
+        
+        # Resolve each product row to the picture anchored on (or reaching into) it
+        resolve_started = time.perf_counter()
+        row_images = image_index.row_images((row_number - 1 for row_number in row_products), image_col_index)
+        
+        for row, image in sorted(row_images.items()):
+            product_name = row_products[row + 1]
+            product_id = product_ids.get(product_name)
+            if not product_id:
+                metrics.debug(f"Could not find product '{product_name}' in database")
+                not_found_count += 1
+                continue
+            
+            if image_format:
+                file_ext = IMAGE_FORMATS[image_format]
+            else:
+                file_ext = os.path.splitext(image['media'])[1].lower() or '.jpg'
+            jobs.append((product_id, image['media'], file_ext))
+        metrics.add_time('resolve', time.perf_counter() - resolve_started)
+        
+        if not transform:
+            # No transform requested: stream the original bytes into the store
+            # without decoding; each media part is stored once even if several
+            # products share it
+            stored = {}
+            with metrics.phase('image'):
+                for _, media_part, file_ext in jobs:
+                    if media_part not in stored:
+                        # An unreadable part only skips the products showing it
+                        try:
+                            with archive.open(media_part) as src:
+                                stored[media_part] = store_image_stream(src, file_ext, UPLOADS_FOLDER)
+                        except Exception as e:
+                            stored[media_part] = None
+                            metrics.count('failed')
+                            metrics.info(f"Error with image {media_part}: {e}")
+                    metrics.advance()
+            image_paths = [stored[media_part] for _, media_part, _ in jobs]
+    
+    if transform:
+        # Each picture is rendered once, however many products share it
+        parts = list(dict.fromkeys((media_part, file_ext) for _, media_part, file_ext in jobs))
+        with metrics.phase('image'), ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_archive,
+                                                         initargs=(EXCEL_FILE,)) as pool:
+            # One undecodable picture (EMF/WMF, a broken part) only skips its products
+            futures = [pool.submit(_render_media, (media_part, file_ext, max_size)) for media_part, file_ext in parts]
+            rendered = {}
+            for (media_part, file_ext), future in zip(parts, futures):
+                try:
+                    rendered[media_part, file_ext] = future.result()
+                except Exception as e:
+                    rendered[media_part, file_ext] = None
+                    metrics.count('failed')
+                    metrics.info(f"Error with image {media_part}: {e}")
+        image_paths = []
+        for _, media_part, file_ext in jobs:
+            image_paths.append(rendered[media_part, file_ext])
+            metrics.advance()
+    
+    updates = [(image_path, job[0]) for job, image_path in zip(jobs, image_paths) if image_path]
+    with metrics.phase('insert'):
+        cursor.executemany("UPDATE products SET image_path = ? WHERE product_id = ?", updates)
+    with metrics.phase('commit'):
+        conn.commit()
+    conn.close()
+    
+    print(f"\nResults:")
+    print(f"- {len(updates)} products updated with images from Excel")
+    if len(updates) < len(jobs):
+        print(f"- {len(jobs) - len(updates)} products skipped, their picture could not be processed")
+    print(f"- {not_found_count} products in Excel not found in database")
+    metrics.count('updated', len(updates))
+    metrics.count('not_found', not_found_count)
+    metrics.finish(file=EXCEL_FILE, mode='parallel')
+    return len(updates)
 
 if __name__ == "__main__":
-    extract_images_from_excel() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Extract images embedded in the Excel file')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Read pictures straight from the xlsx zip and process them in a process pool')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Worker processes for --parallel')
+    parser.add_argument('--max-size', type=int, default=None, help='Resize pictures to fit in this many pixels')
+    parser.add_argument('--format', choices=sorted(IMAGE_FORMATS), default=None, help='Re-encode pictures to this format')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('extract_excel_images', args.profile, args.profile_top):
+        if args.parallel:
+            extract_images_parallel(workers=args.workers, max_size=args.max_size, image_format=args.format,
+                                    debug=args.debug, metrics_file=args.metrics_file)
+        else:
+            extract_images_from_excel(debug=args.debug, metrics_file=args.metrics_file)
@@ -1,19 +1,21 @@
 import os
-import sqlite3
-import pandas as pd
 import openpyxl
-from PIL import Image, ImageDraw, ImageFont
-import glob
 import shutil
-import uuid
 import sys
 import time
 import random
 import re
 import argparse
+import zipfile
+from image_index import get_image_index, find_image
+from placeholder_images import create_placeholder
+from image_store import content_digest, store_image_file
+from xlsx_media import read_sheet_images, ImageIndex, cell_range
+from import_metrics import RunMetrics, quiet_metrics, add_metrics_arguments
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
 
 # Configuration
-DB_FILE = "./data/arper_inventory.db"  # Updated to match the actual database name
 DEFAULT_EXCEL_FILE = "PL- ARPER.xlsx"
 UPLOADS_FOLDER = "uploads/products"
 MAX_RETRIES = 3
@@ -35,120 +37,45 @@ def ensure_uploads_folder():
         print(f"Uploads folder exists: {UPLOADS_FOLDER}")
 
 def get_image_files():
-    """Find all image files in current directory and subdirectories"""
-    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif']
-    image_files = []
-    
-    for ext in image_extensions:
-        image_files.extend(glob.glob(f"**/{ext}", recursive=True))
-    
-    print(f"Found {len(image_files)} image files")
-    return image_files
+    """Index all image files in current directory and subdirectories"""
+    image_index = get_image_index('.')
+    print(f"Found {len(image_index['files'])} image files")
+    return image_index
 
 def find_image_by_name(image_name, image_files):
-    """Find an image file by name (case insensitive)"""
+    """Find an image file by name (case insensitive) in the image index"""
     if not image_name:
         return None
     
-    # Clean the image name
-    image_name = image_name.strip()
-    image_name_lower = image_name.lower()
-    
-    # Try exact match first
-    for file_path in image_files:
-        filename = os.path.basename(file_path)
-        if filename.lower() == image_name_lower:
-            return file_path
-    
-    # Try contained match (e.g., IMG_8454 in filename)
-    for file_path in image_files:
-        if image_name_lower in file_path.lower():
-            return file_path
-    
-    return None
+    # Exact name, stem and IMG_#### matches are index lookups; contained
+    # matches (e.g. IMG_8454 in filename) fall back to the indexed names
+    return find_image(image_files, image_name)
 
-def create_placeholder_image(product_name, save_path, width=400, height=300):
-    """Create a colored image with product text"""
-    # Generate a color based on the product name
-    name_hash = sum(ord(c) for c in product_name)
-    r = (name_hash * 33) % 200 + 55  # Keep colors not too dark (55-255)
-    g = (name_hash * 89) % 200 + 55
-    b = (name_hash * 144) % 200 + 55
-    
-    # Create image
-    img = Image.new('RGB', (width, height), color=(r, g, b))
-    draw = ImageDraw.Draw(img)
-    
-    # Add text
-    try:
-        font = ImageFont.load_default()
-    except:
-        # If error, just create a blank image
-        img.save(save_path)
-        return
-    
-    # Wrap text to fit
-    words = product_name.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        current_line.append(word)
-        if len(' '.join(current_line)) > 20:  # arbitrary threshold
-            lines.append(' '.join(current_line[:-1]))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
-    
-    # Draw text in center
-    y_position = height // 2 - (len(lines) * 15) // 2
-    for line in lines:
-        text_width = len(line) * 7  # Rough estimate
-        x_position = (width - text_width) // 2
-        draw.text((x_position, y_position), line, fill=(255, 255, 255), font=font)
-        y_position += 20
-    
-    # Save image
-    img.save(save_path)
-    print(f"Created placeholder for {product_name}")
+def copy_file_with_retry(src, product_name, max_retries=MAX_RETRIES, metrics=None):
+    """Store a file in the content-addressed uploads store with retries and backoff.
 
-def copy_file_with_retry(src, dst, product_name, max_retries=MAX_RETRIES):
-    """Attempt to copy a file with retries and exponential backoff using read/write approach"""
-    # Make sure the destination directory exists
-    dst_dir = os.path.dirname(dst)
-    if not os.path.exists(dst_dir):
-        os.makedirs(dst_dir, exist_ok=True)
-    
+    Returns the image path to record in the database, or None. Content that
+    is already stored is not copied again.
+    """
+    metrics = metrics or quiet_metrics('copy_file_with_retry')
     # Verify source file exists
     if not os.path.exists(src):
-        print(f"Error: Source file does not exist: {src}")
-        return False
+        metrics.info(f"Error: Source file does not exist: {src}")
+        return None
     
     for attempt in range(max_retries):
         try:
-            # Use a read/write approach instead of shutil.copy2
-            with open(src, 'rb') as src_file:
-                image_data = src_file.read()
-                
-            with open(dst, 'wb') as dst_file:
-                dst_file.write(image_data)
-            
-            # Verify the file was copied successfully
-            if os.path.exists(dst) and os.path.getsize(dst) > 0:
-                print(f"Copied image for {product_name}: {src} -> {dst}")
-                return True
-            else:
-                print(f"File copy failed: Destination file does not exist or is empty: {dst}")
-                time.sleep(0.5)  # Short delay before retry
+            db_image_path = store_image_file(src, UPLOADS_FOLDER)
+            metrics.debug(f"Stored image for {product_name}: {src} -> {db_image_path}")
+            return db_image_path
         except Exception as e:
             delay = RETRY_DELAY * (attempt + 1) + random.uniform(0, 0.5)
-            print(f"Attempt {attempt+1}/{max_retries} failed: {e}")
-            print(f"Waiting {delay:.2f}s before retry...")
+            metrics.count('retries')
+            metrics.info(f"Attempt {attempt+1}/{max_retries} failed: {e}; waiting {delay:.2f}s before retry...")
             time.sleep(delay)
     
-    print(f"All {max_retries} attempts failed to copy image for {product_name}")
-    return False
+    metrics.info(f"All {max_retries} attempts failed to copy image for {product_name}")
+    return None
 
 def sanitize_filename(filename):
     """Sanitize a filename to remove invalid characters"""
@@ -162,109 +89,121 @@ def sanitize_filename(filename):
     
     return sanitized
 
-def extract_images_from_excel(excel_file=DEFAULT_EXCEL_FILE):
-    """Extract images from Excel file and return a dictionary of product_id -> image_path"""
+def grid_text(grid, row, col):
+    """Return the stripped text of a cell in a list-of-rows grid, or "" when blank or out of range"""
+    if row >= len(grid) or col >= len(grid[row]) or grid[row][col] is None:
+        return ""
+    return str(grid[row][col]).strip()
+
+def extract_images_from_excel(excel_file=DEFAULT_EXCEL_FILE, metrics=None):
+    """Extract images from Excel file and return a dictionary of product identifier -> image_path"""
+    metrics = metrics or quiet_metrics('extract_images_from_excel')
     print(f"Extracting images from Excel file: {excel_file}")
     
     # Create a temporary directory for extracted images
     temp_dir = os.path.join(os.path.dirname(os.path.abspath(excel_file)), "temp_excel_images")
     os.makedirs(temp_dir, exist_ok=True)
     
-    # Load Excel file
+    # Load Excel file (cell values only; pictures are read from the zip)
     try:
-        workbook = openpyxl.load_workbook(excel_file)
+        workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+        archive = zipfile.ZipFile(excel_file)
     except Exception as e:
         print(f"Error loading Excel file: {e}")
         return {}
     
     # Dictionary to store extracted images
     extracted_images = {}
+    saved = {}  # media part -> extracted file
     
-    # Process each sheet
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        print(f"Processing sheet: {sheet_name}")
-        
-        # Load sheet data into DataFrame for easier processing
-        df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
-        print(f"DataFrame shape: {df.shape}")
-        
-        # Extract product identifiers from the sheet (SKUs and names)
-        product_ids = set()
-        sku_column = None
-        name_column = None
-        
-        # Try to find SKU and name columns
-        for col in range(df.shape[1]):
-            for row in range(min(10, df.shape[0])):  # Check first 10 rows
-                cell_value = str(df.iloc[row, col]).strip() if not pd.isna(df.iloc[row, col]) else ""
-                
-                # Look for SKU-like patterns (ARPER-XXX)
-                if re.match(r'^[A-Z0-9]+-[A-Z0-9]+$', cell_value):
-                    sku_column = col
-                
-                # Look for description/name column
-                if cell_value.upper() in ["DESCRIPTION", "PRODUCT NAME", "ITEM"]:
-                    name_column = col
-        
-        # Extract images from the sheet
-        for image in sheet._images:
-            try:
-                # Get image data
-                image_data = workbook._images[image.ref]
-                
-                # Generate a unique filename
-                image_filename = f"excel_image_{uuid.uuid4()}.png"
-                image_path = os.path.join(temp_dir, image_filename)
-                
-                # Save the image
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)
-                
-                # Try to associate with a product
-                # Get the cell where the image is anchored
-                anchor_cell = image.anchor
-                if hasattr(anchor_cell, 'to'):
-                    row = anchor_cell.to.row
-                    col = anchor_cell.to.col
+    try:
+        # Process each sheet
+        for sheet_name in workbook.sheetnames:
+            sheet = workbook[sheet_name]
+            print(f"Processing sheet: {sheet_name}")
+            
+            # Take the cell values from the workbook already open instead of
+            # re-reading the whole file with pandas for every sheet
+            with metrics.phase('parse'):
+                grid = [list(row) for row in sheet.iter_rows(min_row=1, min_col=1, values_only=True)]
+            n_rows = len(grid)
+            n_cols = max((len(row) for row in grid), default=0)
+            print(f"Sheet shape: ({n_rows}, {n_cols})")
+            
+            # Find the SKU, name and picture columns in the first rows
+            sku_column = None
+            name_column = None
+            image_column = None
+            first_row = 0
+            for col in range(n_cols):
+                for row in range(min(10, n_rows)):  # Check first 10 rows
+                    cell_value = grid_text(grid, row, col)
+                    
+                    # Look for SKU-like patterns (ARPER-XXX)
+                    if re.match(r'^[A-Z0-9]+-[A-Z0-9]+$', cell_value):
+                        sku_column = col
+                    
+                    # Look for description/name column; products start below it
+                    if cell_value.upper() in ["DESCRIPTION", "PRODUCT NAME", "ITEM"]:
+                        name_column = col
+                        first_row = max(first_row, row + 1)
+                    
+                    if cell_value.upper() == "IMAGE":
+                        image_column = col
+            
+            # Read every picture anchor of the sheet once into a row interval index
+            image_index = ImageIndex(read_sheet_images(archive, sheet_name))
+            if not len(image_index):
+                continue
+            print(f"Found {len(image_index)} images ({len(image_index.multi_row())} spanning several rows)")
+            
+            # Identifiers (SKU and name) of each product row
+            row_identifiers = {}
+            for row in range(first_row, n_rows):
+                if name_column is not None or sku_column is not None:
+                    identifiers = [grid_text(grid, row, col) for col in (sku_column, name_column) if col is not None]
                 else:
-                    row = anchor_cell._from.row
-                    col = anchor_cell._from.col
-                
-                # Try to find the product name or SKU in nearby cells
-                product_identifier = None
-                
-                # Check the cell itself
-                if 0 <= row < df.shape[0] and 0 <= col < df.shape[1]:
-                    cell_value = str(df.iloc[row, col]).strip() if not pd.isna(df.iloc[row, col]) else ""
-                    if cell_value:
-                        product_identifier = cell_value
-                
-                # If no identifier found, check nearby cells
-                if not product_identifier:
-                    # Check cells in the same row
-                    for c in range(df.shape[1]):
-                        if 0 <= row < df.shape[0]:
-                            cell_value = str(df.iloc[row, c]).strip() if not pd.isna(df.iloc[row, c]) else ""
-                            if cell_value and c != col:
-                                product_identifier = cell_value
-                                break
-                
-                # If still no identifier, use the image filename
-                if not product_identifier:
-                    product_identifier = image_filename
-                
-                # Add to extracted images
-                extracted_images[product_identifier] = image_path
-                print(f"Extracted image for '{product_identifier}': {image_path}")
-                
-            except Exception as e:
-                print(f"Error extracting image: {e}")
+                    # No header found: use the first filled cell of the row
+                    identifiers = [next((grid_text(grid, row, col) for col in range(n_cols)
+                                         if col != image_column and grid_text(grid, row, col)), "")]
+                identifiers = [identifier for identifier in identifiers if identifier]
+                if identifiers:
+                    row_identifiers[row] = identifiers
+            
+            for row, image in image_index.row_images(row_identifiers, image_column).items():
+                image_started = time.perf_counter()
+                try:
+                    image_path = saved.get(image['media'])
+                    if not image_path:
+                        image_data = archive.read(image['media'])
+                        
+                        # Name the extracted file after its content so repeated
+                        # pictures are written once
+                        file_ext = os.path.splitext(image['media'])[1].lower() or '.png'
+                        image_path = os.path.join(temp_dir, f"excel_image_{content_digest(image_data)}{file_ext}")
+                        
+                        # Save the image
+                        if not os.path.exists(image_path):
+                            with open(image_path, 'wb') as f:
+                                f.write(image_data)
+                        saved[image['media']] = image_path
+                    
+                    # Add to extracted images
+                    for identifier in row_identifiers[row]:
+                        extracted_images[identifier] = image_path
+                    metrics.debug(f"Extracted image for '{row_identifiers[row][-1]}' from {cell_range(image)}: {image_path}")
+                    
+                except Exception as e:
+                    metrics.info(f"Error extracting image at {cell_range(image)}: {e}")
+                metrics.add_time('image', time.perf_counter() - image_started)
+    finally:
+        archive.close()
+        workbook.close()
     
     print(f"Extracted {len(extracted_images)} images from Excel")
     return extracted_images
 
-def fix_product_images(excel_file=DEFAULT_EXCEL_FILE):
+def fix_product_images(excel_file=DEFAULT_EXCEL_FILE, debug=False, metrics_file=None):
     """Fix product images by extracting from Excel and updating database"""
     print("Starting product image fix process...")
     
@@ -273,7 +212,7 @@ def fix_product_images(excel_file=DEFAULT_EXCEL_FILE):
     
     # Connect to the database
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = connect(DB_FILE)
         cursor = conn.cursor()
         print(f"Connected to database: {DB_FILE}")
     except Exception as e:
@@ -307,42 +246,45 @@ def fix_product_images(excel_file=DEFAULT_EXCEL_FILE):
         conn.close()
         return
     
+    metrics = RunMetrics('fix_excel_images', total=len(products_to_fix), debug=debug, metrics_file=metrics_file)
+    
     # Get all image files in the current directory and subdirectories
-    image_files = get_image_files()
+    with metrics.phase('resolve'):
+        image_files = get_image_files()
     
     # Try to extract images from Excel
-    excel_images = extract_images_from_excel(excel_file)
+    excel_images = extract_images_from_excel(excel_file, metrics)
     
     # Process each product
     fixed_count = 0
     for product_id, name, sku in products_to_fix:
-        print(f"\nProcessing product: {name} (SKU: {sku})")
+        metrics.advance()
+        metrics.debug(f"Processing product: {name} (SKU: {sku})")
         
         # Generate a sanitized filename
         safe_name = sanitize_filename(name)
-        image_path = os.path.join(UPLOADS_FOLDER, f"{product_id}.jpg")
-        db_image_path = f"/uploads/products/{product_id}.jpg"
         
         # Try to find an image by SKU or name
         found_image = None
+        resolve_started = time.perf_counter()
         
         # First, check Excel extracted images
         if sku in excel_images:
             found_image = excel_images[sku]
-            print(f"Found image in Excel by SKU: {found_image}")
+            metrics.debug(f"Found image in Excel by SKU: {found_image}")
         elif name in excel_images:
             found_image = excel_images[name]
-            print(f"Found image in Excel by name: {found_image}")
+            metrics.debug(f"Found image in Excel by name: {found_image}")
         else:
             # Try to find partial matches in Excel images
             for key, path in excel_images.items():
                 if sku and sku in key:
                     found_image = path
-                    print(f"Found image in Excel by partial SKU match: {found_image}")
+                    metrics.debug(f"Found image in Excel by partial SKU match: {found_image}")
                     break
                 elif name and name.lower() in key.lower():
                     found_image = path
-                    print(f"Found image in Excel by partial name match: {found_image}")
+                    metrics.debug(f"Found image in Excel by partial name match: {found_image}")
                     break
         
         # If not found in Excel, try to find in filesystem
@@ -351,49 +293,63 @@ def fix_product_images(excel_file=DEFAULT_EXCEL_FILE):
             if sku:
                 found_image = find_image_by_name(sku, image_files)
                 if found_image:
-                    print(f"Found image by SKU: {found_image}")
+                    metrics.debug(f"Found image by SKU: {found_image}")
             
             # If not found by SKU, try by name
             if not found_image and name:
                 found_image = find_image_by_name(name, image_files)
                 if found_image:
-                    print(f"Found image by name: {found_image}")
+                    metrics.debug(f"Found image by name: {found_image}")
+        metrics.add_time('resolve', time.perf_counter() - resolve_started)
         
-        # If an image was found, copy it
+        # If an image was found, store it (shared with any product using the same picture)
         if found_image:
-            if copy_file_with_retry(found_image, image_path, name):
+            with metrics.phase('image'):
+                stored_image_path = copy_file_with_retry(found_image, name, metrics=metrics)
+            if stored_image_path:
                 # Update the database
+                with metrics.phase('insert'):
+                    cursor.execute(
+                        "UPDATE products SET image_path = ? WHERE product_id = ?",
+                        (stored_image_path, product_id)
+                    )
+                with metrics.phase('commit'):
+                    conn.commit()
+                fixed_count += 1
+                metrics.count('images_found')
+                metrics.debug(f"Updated database with image path: {stored_image_path}")
+        else:
+            # Use the shared placeholder for this name (rendered once per name)
+            metrics.debug(f"No image found for {name}, using placeholder")
+            with metrics.phase('image'):
+                db_image_path = create_placeholder(name or '', style='color', uploads_folder=UPLOADS_FOLDER)
+            
+            # Update the database
+            with metrics.phase('insert'):
                 cursor.execute(
                     "UPDATE products SET image_path = ? WHERE product_id = ?",
                     (db_image_path, product_id)
                 )
+            with metrics.phase('commit'):
                 conn.commit()
-                fixed_count += 1
-                print(f"Updated database with image path: {db_image_path}")
-        else:
-            # Create a placeholder image
-            print(f"No image found for {name}, creating placeholder")
-            create_placeholder_image(name, image_path)
-            
-            # Update the database
-            cursor.execute(
-                "UPDATE products SET image_path = ? WHERE product_id = ?",
-                (db_image_path, product_id)
-            )
-            conn.commit()
             fixed_count += 1
-            print(f"Updated database with placeholder image: {db_image_path}")
+            metrics.count('placeholders')
+            metrics.debug(f"Updated database with placeholder image: {db_image_path}")
     
     print(f"\nFixed images for {fixed_count} products")
     conn.close()
+    metrics.finish(file=excel_file, fixed=fixed_count)
 
 def main():
     """Main function to process command line arguments"""
     parser = argparse.ArgumentParser(description='Fix product images')
     parser.add_argument('--excel_file', help='Path to the Excel file', default=DEFAULT_EXCEL_FILE)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    
-    fix_product_images(args.excel_file)
+
+    with profiled('fix_excel_images', args.profile, args.profile_top):
+        fix_product_images(args.excel_file, debug=args.debug, metrics_file=args.metrics_file)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,13 +1,15 @@
 import os
-import sqlite3
 import shutil
-import uuid
-from PIL import Image, ImageDraw, ImageFont
+import argparse
+from placeholder_images import create_placeholders
+from image_audit import scan_uploads
+from import_metrics import RunMetrics, add_metrics_arguments
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
 
 # Constants
-DB_FILE = 'arper_inventory.db'
 UPLOADS_FOLDER = 'uploads/products'
-PLACEHOLDER_COLOR = (200, 200, 200)  # Light gray
+PLACEHOLDER_WORKERS = None  # Processes used to render placeholders (None = one per CPU)
 
 def ensure_uploads_folder():
     """Ensure the uploads folder exists"""
@@ -17,40 +19,7 @@ def ensure_uploads_folder():
     else:
         print(f"Uploads folder exists: {UPLOADS_FOLDER}")
 
-def create_placeholder_image(product_name, target_path, size=(300, 300)):
-    """Create a placeholder image with the product name"""
-    try:
-        # Create a new image with a light gray background
-        img = Image.new('RGB', size, PLACEHOLDER_COLOR)
-        draw = ImageDraw.Draw(img)
-        
-        # Try to use a default font
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
-        
-        # Draw the product name
-        text = product_name
-        if len(text) > 30:
-            text = text[:27] + "..."
-        
-        # Calculate text position to center it
-        text_width = draw.textlength(text, font=font)
-        text_position = ((size[0] - text_width) / 2, size[1] / 2 - 10)
-        
-        # Draw the text
-        draw.text(text_position, text, fill=(0, 0, 0), font=font)
-        
-        # Save the image
-        img.save(target_path)
-        print(f"Created placeholder image for {product_name} at {target_path}")
-        return True
-    except Exception as e:
-        print(f"Error creating placeholder image: {e}")
-        return False
-
-def fix_image_paths():
+def fix_image_paths(debug=False, metrics_file=None):
     """Fix all product image paths in the database"""
     ensure_uploads_folder()
     
@@ -60,7 +29,7 @@ def fix_image_paths():
         return
     
     # Connect to database
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cursor = conn.cursor()
     
     # Get all products
@@ -72,43 +41,45 @@ def fix_image_paths():
     
     products = cursor.fetchall()
     print(f"Found {len(products)} products in database")
+    metrics = RunMetrics('fix_image_paths', total=len(products), debug=debug, metrics_file=metrics_file)
     
     # Track statistics
     updated_count = 0
     placeholder_count = 0
     
+    # Render the placeholders up front: one file per distinct name, in parallel
+    with metrics.phase('image'):
+        image_paths = create_placeholders([name or '' for _, name, _ in products], style='caption',
+                                          uploads_folder=UPLOADS_FOLDER, workers=PLACEHOLDER_WORKERS)
+    
+    # List the uploads folder once instead of a stat call per product
+    with metrics.phase('resolve'):
+        file_sizes = scan_uploads(UPLOADS_FOLDER)
+    
     # Process each product
-    for i, product in enumerate(products):
+    for i, (product, db_image_path) in enumerate(zip(products, image_paths)):
         product_id, name, current_image = product
+        metrics.advance()
         
-        print(f"\nProcessing product {i+1}/{len(products)}: {name}")
-        
-        # Generate a simple filename using a UUID
-        new_filename = f"product_{uuid.uuid4()}.jpg"
-        target_path = os.path.join(UPLOADS_FOLDER, new_filename)
-        
-        # Create a placeholder image for this product
-        create_placeholder_image(name, target_path)
-        
-        # Update the database with the new image path
-        db_image_path = f"/uploads/products/{new_filename}"
+        target_path = os.path.join(UPLOADS_FOLDER, os.path.basename(db_image_path))
         
         # Log the path being stored
-        print(f"Updating product {product_id} ({name}) with image path: {db_image_path}")
+        metrics.debug(f"Updating product {i+1}/{len(products)} {product_id} ({name}) with image path: {db_image_path}")
         
         try:
-            # Use parameterized query to avoid any string formatting issues
-            cursor.execute(
-                "UPDATE products SET image_path = ? WHERE product_id = ?",
-                (db_image_path, product_id)
-            )
-            
-            # Verify the update
-            cursor.execute("SELECT image_path FROM products WHERE product_id = ?", (product_id,))
-            stored_path = cursor.fetchone()[0]
+            with metrics.phase('insert'):
+                # Use parameterized query to avoid any string formatting issues
+                cursor.execute(
+                    "UPDATE products SET image_path = ? WHERE product_id = ?",
+                    (db_image_path, product_id)
+                )
+                
+                # Verify the update
+                cursor.execute("SELECT image_path FROM products WHERE product_id = ?", (product_id,))
+                stored_path = cursor.fetchone()[0]
             
             if stored_path != db_image_path:
-                print(f"WARNING: Path mismatch for product {product_id}. Expected: {db_image_path}, Stored: {stored_path}")
+                metrics.info(f"WARNING: Path mismatch for product {product_id}. Expected: {db_image_path}, Stored: {stored_path}")
                 # Try to fix it with a direct update
                 cursor.execute("UPDATE products SET image_path = ? WHERE product_id = ?", (db_image_path, product_id))
                 conn.commit()  # Commit immediately after the fix
@@ -116,17 +87,20 @@ def fix_image_paths():
             updated_count += 1
             
             # Verify the image file exists
-            if os.path.exists(target_path) and os.path.getsize(target_path) > 0:
-                print(f"Image file verified: {target_path}")
+            verified = file_sizes.get(os.path.basename(target_path), 0) > 0
+            if verified:
+                metrics.debug(f"Image file verified: {target_path}")
             else:
-                print(f"WARNING: Image file does not exist or is empty: {target_path}")
+                metrics.info(f"WARNING: Image file does not exist or is empty: {target_path}")
                 placeholder_count += 1
                 
         except Exception as e:
-            print(f"Error updating database for product {product_id}: {e}")
+            metrics.count('failed')
+            metrics.info(f"Error updating database for product {product_id}: {e}")
         
         # Commit after each product to ensure changes are saved
-        conn.commit()
+        with metrics.phase('commit'):
+            conn.commit()
     
     # Final commit
     conn.commit()
@@ -135,6 +109,15 @@ def fix_image_paths():
     print(f"\nResults:")
     print(f"- {updated_count} products updated with images")
     print(f"- {placeholder_count} products had issues and received placeholders")
+    metrics.count('updated', updated_count)
+    metrics.count('missing_files', placeholder_count)
+    metrics.finish()
 
 if __name__ == "__main__":
-    fix_image_paths()
+    parser = argparse.ArgumentParser(description='Point every product at its placeholder image')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('fix_image_paths', args.profile, args.profile_top):
+        fix_image_paths(debug=args.debug, metrics_file=args.metrics_file)
@@ -1,13 +1,13 @@
 import os
-import sqlite3
-import requests
 import random
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
+from placeholder_images import create_placeholder
+from image_downloader import download_images, DEFAULT_WORKERS
+from db_connection import DB_FILE, connect
+from profiling import profile_from_argv
 
 # Configuration
-DB_FILE = "./arper_inventory.db"  # Main database file
 UPLOADS_FOLDER = "uploads/products"
+DOWNLOAD_WORKERS = DEFAULT_WORKERS  # Concurrent image downloads
 
 # Furniture image sources by category
 CHAIR_IMAGES = [
@@ -59,75 +59,6 @@ def ensure_uploads_folder():
         os.makedirs(UPLOADS_FOLDER, exist_ok=True)
         print(f"Created directory: {UPLOADS_FOLDER}")
 
-def create_color_image(product_name, save_path, width=400, height=300):
-    """Create a colored image with product text when no real image is available"""
-    # Generate a color based on the product name
-    name_hash = sum(ord(c) for c in product_name)
-    r = (name_hash * 33) % 200 + 55  # Keep colors not too dark (55-255)
-    g = (name_hash * 89) % 200 + 55
-    b = (name_hash * 144) % 200 + 55
-    
-    # Create image
-    img = Image.new('RGB', (width, height), color=(r, g, b))
-    draw = ImageDraw.Draw(img)
-    
-    # Add text
-    try:
-        # Try to use a default font
-        font = ImageFont.truetype("arial.ttf", 20)
-    except IOError:
-        font = ImageFont.load_default()
-    
-    # Format product name
-    product_name = product_name[:50]  # Limit length
-    words = product_name.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        # Estimate text width
-        text_width = len(test_line) * 10  # Rough estimate
-        
-        if text_width <= width - 40:  # Leave margin
-            current_line.append(word)
-        else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
-    
-    # Draw text lines
-    y_position = (height - len(lines) * 24) // 2
-    for line in lines:
-        # Center text
-        text_width = len(line) * 10  # Approximate width
-        x_position = (width - text_width) // 2
-        draw.text((x_position, y_position), line, fill=(255, 255, 255), font=font)
-        y_position += 24
-    
-    # Save image
-    img.save(save_path)
-    print(f"Created color image for {product_name}")
-    return True
-
-def download_image(url, save_path, product_name):
-    """Download an image from URL and save it to the specified path"""
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        img = Image.open(BytesIO(response.content))
-        img.save(save_path)
-        print(f"Downloaded image from {url}")
-        return True
-    except Exception as e:
-        print(f"Error downloading image {url}: {e}")
-        # Create a colored placeholder instead
-        return create_color_image(product_name, save_path)
-
 def fix_product_images():
     """Fix images for all products in the database"""
     ensure_uploads_folder()
@@ -139,7 +70,7 @@ def fix_product_images():
     
     try:
         # Connect to SQLite database
-        conn = sqlite3.connect(DB_FILE)
+        conn = connect(DB_FILE)
         cursor = conn.cursor()
         
         # Check if products table exists
@@ -159,8 +90,8 @@ def fix_product_images():
         products = cursor.fetchall()
         print(f"Found {len(products)} products in database")
         
-        # Process each product
-        updated_count = 0
+        # Choose an image for each product
+        chosen_images = []
         for product in products:
             product_id = product[0]
             product_name = product[1]
@@ -191,28 +122,21 @@ def fix_product_images():
             
             # Select random image from category
             image_url = random.choice(image_list)
-            
-            # Generate unique filename with proper extension
-            file_ext = os.path.splitext(image_url.split('/')[-1])[1]
-            if not file_ext:
-                file_ext = ".jpg"  # Default to jpg if no extension found
-                
-            image_filename = f"product_{product_id}{file_ext}"
-            image_path = os.path.join(UPLOADS_FOLDER, image_filename)
-            
-            # Download the image
-            try:
-                if download_image(image_url, image_path, product_name):
-                    # Update product in database with new image path
-                    db_image_path = f"/uploads/products/{image_filename}"
-                    cursor.execute(
-                        "UPDATE products SET image_path = ? WHERE product_id = ?",
-                        (db_image_path, product_id)
-                    )
-                    updated_count += 1
-                    print(f"Updated product {product_name} with image: {db_image_path}")
-            except Exception as e:
-                print(f"Error processing {product_name}: {e}")
+            chosen_images.append((product_id, product_name, image_url))
+        
+        # Download each distinct URL once, concurrently; failed downloads fall
+        # back to a colored placeholder
+        downloaded = download_images([url for _, _, url in chosen_images], UPLOADS_FOLDER, DOWNLOAD_WORKERS)
+        updated_count = 0
+        for product_id, product_name, image_url in chosen_images:
+            db_image_path = downloaded.get(image_url) or create_placeholder(
+                product_name or '', style='color', uploads_folder=UPLOADS_FOLDER)
+            cursor.execute(
+                "UPDATE products SET image_path = ? WHERE product_id = ?",
+                (db_image_path, product_id)
+            )
+            updated_count += 1
+            print(f"Updated product {product_name} with image: {db_image_path}")
         
         # Commit changes
         conn.commit()
@@ -225,4 +149,5 @@ def fix_product_images():
             conn.close()
 
 if __name__ == "__main__":
-    fix_product_images() 
\ No newline at end of file
+    with profile_from_argv('fix_product_images'):
+        fix_product_images()
@@ -1,8 +1,6 @@
 import os
-import sqlite3
 import pandas as pd
 import openpyxl
-from PIL import Image, ImageDraw, ImageFont
 import glob
 import shutil
 import uuid
@@ -10,12 +8,15 @@ import sys
 import time
 import random
 import re
+from placeholder_images import create_placeholders
+from db_connection import DB_FILE, connect
+from profiling import profile_from_argv
 
 # Configuration
-DB_FILE = "./data/inventory.db"
 EXCEL_FILE = "PL- ARPER.xlsx"
 UPLOADS_FOLDER = "./uploads/products"
 IMAGES_FOLDER = "./images"  # Folder containing external images if available
+PLACEHOLDER_WORKERS = None  # Processes used to render placeholders (None = one per CPU)
 
 def ensure_folders_exist():
     """Ensure all required folders exist"""
@@ -34,42 +35,6 @@ def find_images_in_directory():
     print(f"Found {len(image_files)} image files in {IMAGES_FOLDER}")
     return image_files
 
-def create_placeholder_image(text, product_id):
-    """Create a placeholder image with the given text"""
-    width, height = 400, 400
-    background_color = (240, 240, 240)
-    text_color = (100, 100, 100)
-    
-    # Create a new image with the given background color
-    image = Image.new('RGB', (width, height), background_color)
-    draw = ImageDraw.Draw(image)
-    
-    # Try to load a font, use default if not available
-    try:
-        font = ImageFont.truetype("arial.ttf", 40)
-    except IOError:
-        font = ImageFont.load_default()
-    
-    # Draw the text in the center of the image
-    text_width, text_height = 200, 40  # Approximate values
-    position = ((width - text_width) // 2, (height - text_height) // 2)
-    
-    # Limit text length to avoid overflow
-    display_text = text[:20] if len(text) > 20 else text
-    draw.text(position, display_text, fill=text_color, font=font)
-    
-    # Save the image
-    filename = f"product_{product_id}.jpg"
-    filepath = os.path.join(UPLOADS_FOLDER, filename)
-    
-    try:
-        image.save(filepath)
-        print(f"Created placeholder image: {filepath}")
-        return f"/uploads/products/{filename}"
-    except Exception as e:
-        print(f"Error creating placeholder image: {e}")
-        return None
-
 def fix_product_images():
     """Create images for all products in the database"""
     ensure_folders_exist()
@@ -83,7 +48,7 @@ def fix_product_images():
     image_files = find_images_in_directory()
     
     # Connect to database
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cursor = conn.cursor()
     
     try:
@@ -99,25 +64,13 @@ def fix_product_images():
         products = cursor.fetchall()
         print(f"Found {len(products)} products in database")
         
-        # Track statistics
-        updated_count = 0
-        
-        # Process each product
-        for i, product in enumerate(products):
-            product_id, name, sku, current_image, rack_number = product if len(product) == 5 else (*product, None)
-            
-            print(f"\nProcessing product {i+1}/{len(products)}: {name} (SKU: {sku}, Rack: {rack_number})")
-            
-            # Create a placeholder image for the product
-            image_path = create_placeholder_image(name, product_id)
-            
-            if image_path:
-                # Update the database with the image path
-                cursor.execute(
-                    "UPDATE products SET image_path = ? WHERE product_id = ?",
-                    (image_path, product_id)
-                )
-                updated_count += 1
+        # Render each distinct placeholder once, in parallel; products with
+        # the same name share one file
+        image_paths = create_placeholders([name or '' for _, name, *_ in products], style='plain',
+                                          uploads_folder=UPLOADS_FOLDER, workers=PLACEHOLDER_WORKERS)
+        updates = [(image_path, product[0]) for product, image_path in zip(products, image_paths)]
+        cursor.executemany("UPDATE products SET image_path = ? WHERE product_id = ?", updates)
+        updated_count = len(updates)
         
         # Commit changes
         conn.commit()
@@ -130,4 +83,5 @@ def fix_product_images():
         conn.close()
 
 if __name__ == "__main__":
-    fix_product_images()
+    with profile_from_argv('fix_product_images_robust'):
+        fix_product_images()
@@ -0,0 +1,237 @@
+"""Audit of products.image_path against the files in uploads/products.
+
+Checking the references one product at a time costs a stat call per product,
+which on a network share is the whole run time. The audit lists the uploads
+folder once with os.scandir, loads every image_path in one query, and finds
+the problems with set operations:
+  missing   referenced by a product, no file
+  empty     a zero-byte file (referenced or not)
+  orphaned  a file no product references
+Paths outside the uploads folder (URLs, bare image names) are counted
+separately. The report is written as JSON; with --repair-plan it lists the
+fixes (point products with a missing or empty image at their placeholder,
+remove empty files), and --apply carries them out.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from image_store import UPLOADS_FOLDER, URL_PREFIX
+from placeholder_images import create_placeholders, placeholder_filename
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+REPORT_FOLDER = "./data/reports"
+PLACEHOLDER_STYLE = 'caption'  # The style fix_image_paths gives products without a picture
+EXAMPLES = 10  # Entries of each list printed on the console
+
+def scan_folder(folder):
+    """Return {file name: stat result} of the files directly in a folder, from one listing"""
+    files = {}
+    if not os.path.isdir(folder):
+        return files
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith('.tmp') or entry.name.startswith('.incoming-') \
+                    or not entry.is_file(follow_symlinks=False):
+                continue  # Subfolders (variants) and files still being written
+            files[entry.name] = entry.stat(follow_symlinks=False)
+    return files
+
+def scan_uploads(folder=UPLOADS_FOLDER):
+    """Return {file name: size in bytes} of the files directly in the uploads folder"""
+    return {name: stat.st_size for name, stat in scan_folder(folder).items()}
+
+def uploads_name(image_path):
+    """Return the file name behind an image_path in the uploads folder, or None for other paths"""
+    if not image_path or not image_path.startswith(URL_PREFIX + '/'):
+        return None
+    name = image_path[len(URL_PREFIX) + 1:]
+    return None if '/' in name else name
+
+def load_references(conn):
+    """Return ({file name: [product ids]}, [(product id, image_path)] outside the uploads folder)"""
+    references = {}
+    outside = []
+    for product_id, image_path in conn.execute(
+            "SELECT product_id, image_path FROM products WHERE image_path IS NOT NULL AND image_path != ''"):
+        name = uploads_name(image_path)
+        if name is None:
+            outside.append((product_id, image_path))
+        else:
+            references.setdefault(name, []).append(product_id)
+    return references, outside
+
+def audit_images(conn, uploads_folder=UPLOADS_FOLDER):
+    """Compare the references with the files on disk; returns a dict of sets and timings"""
+    started = time.perf_counter()
+    files = scan_uploads(uploads_folder)
+    scanned = time.perf_counter()
+    references, outside = load_references(conn)
+    loaded = time.perf_counter()
+
+    on_disk = set(files)
+    referenced = set(references)
+    empty = {name for name, size in files.items() if size == 0}
+    return {
+        'files': files,
+        'references': references,
+        'outside': outside,
+        'missing': referenced - on_disk,
+        'empty': empty,
+        'empty_referenced': empty & referenced,
+        'orphaned': on_disk - referenced,
+        'timings': {'scan': round(scanned - started, 3), 'query': round(loaded - scanned, 3),
+                    'compare': round(time.perf_counter() - loaded, 3)},
+    }
+
+def repair_plan(conn, audit):
+    """Return the actions that fix the missing and empty references and remove the empty files"""
+    broken = audit['missing'] | audit['empty_referenced']
+    broken_products = {product_id for name in broken for product_id in audit['references'][name]}
+    names = {}
+    if broken_products:
+        for product_id, name in conn.execute("SELECT product_id, name FROM products"):
+            if product_id in broken_products:
+                names[product_id] = name or ''
+
+    plan = []
+    usable = {name for name, size in audit['files'].items() if size > 0}
+    for image_name in sorted(broken):
+        for product_id in audit['references'][image_name]:
+            placeholder = placeholder_filename(names.get(product_id, ''), PLACEHOLDER_STYLE)
+            plan.append({
+                'action': 'repoint',
+                'product_id': product_id,
+                'image_path': f"{URL_PREFIX}/{image_name}",
+                'new_image_path': f"{URL_PREFIX}/{placeholder}",
+                'name': names.get(product_id, ''),
+                'render': placeholder not in usable,
+            })
+    for image_name in sorted(audit['empty']):
+        plan.append({'action': 'remove', 'file': image_name, 'bytes': 0})
+    return plan
+
+def apply_plan(conn, plan, uploads_folder=UPLOADS_FOLDER):
+    """Remove the empty files, render the placeholders the plan needs and repoint the products"""
+    # Empty files first, so a placeholder that is itself empty gets rendered again
+    removed = 0
+    for action in plan:
+        if action['action'] != 'remove':
+            continue
+        path = os.path.join(uploads_folder, action['file'])
+        try:
+            if os.path.getsize(path) == 0:  # Still empty: not rewritten since the scan
+                os.remove(path)
+                removed += 1
+        except OSError as e:
+            print(f"Could not remove {path}: {e}")
+
+    repoints = [action for action in plan if action['action'] == 'repoint']
+    to_render = [action for action in repoints if action['render']]
+    if to_render:
+        rendered = create_placeholders([action['name'] for action in to_render], style=PLACEHOLDER_STYLE,
+                                       uploads_folder=uploads_folder)
+        for action, image_path in zip(to_render, rendered):
+            action['new_image_path'] = image_path
+    conn.executemany("UPDATE products SET image_path = ? WHERE product_id = ?",
+                     [(action['new_image_path'], action['product_id']) for action in repoints])
+    conn.commit()
+
+    print(f"Repointed {len(repoints)} products ({len(to_render)} placeholders rendered), "
+          f"removed {removed} empty files")
+
+def build_report(audit, uploads_folder, plan=None):
+    """Return the JSON report of an audit"""
+    files = audit['files']
+    references = audit['references']
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'uploads_folder': uploads_folder,
+        'timings': audit['timings'],
+        'counts': {
+            'files': len(files),
+            'referenced_files': len(references),
+            'products_with_image': sum(len(ids) for ids in references.values()) + len(audit['outside']),
+            'missing': len(audit['missing']),
+            'empty': len(audit['empty']),
+            'empty_referenced': len(audit['empty_referenced']),
+            'orphaned': len(audit['orphaned']),
+            'orphaned_bytes': sum(files[name] for name in audit['orphaned']),
+            'outside_uploads': len(audit['outside']),
+        },
+        'missing': [{'file': name, 'product_ids': references[name]} for name in sorted(audit['missing'])],
+        'empty': [{'file': name, 'product_ids': references.get(name, [])} for name in sorted(audit['empty'])],
+        'orphaned': [{'file': name, 'bytes': files[name]} for name in sorted(audit['orphaned'])],
+        'outside_uploads': [{'product_id': product_id, 'image_path': image_path}
+                            for product_id, image_path in audit['outside']],
+    }
+    if plan is not None:
+        report['repair_plan'] = plan
+    return report
+
+def write_report(report, report_file=None):
+    """Write the report as JSON and return its path"""
+    if not report_file:
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        report_file = os.path.join(REPORT_FOLDER, f"image_audit-{stamp}.json")
+    if os.path.dirname(report_file):
+        os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    return report_file
+
+def print_summary(report):
+    """Print the counts of a report and a few entries of each problem list"""
+    counts = report['counts']
+    timings = report['timings']
+    print(f"Audited {counts['products_with_image']} image references against {counts['files']} files "
+          f"in {report['uploads_folder']} (scan {timings['scan']:.2f}s, query {timings['query']:.2f}s)")
+    print(f"- {counts['missing']} referenced files are missing")
+    print(f"- {counts['empty']} files are empty ({counts['empty_referenced']} of them referenced)")
+    print(f"- {counts['orphaned']} files are not referenced ({counts['orphaned_bytes'] / 1024 / 1024:.1f} MB)")
+    print(f"- {counts['outside_uploads']} image paths point outside the uploads folder")
+    for key in ('missing', 'empty', 'orphaned'):
+        for entry in report[key][:EXAMPLES]:
+            print(f"  {key}: {entry['file']}")
+    if 'repair_plan' in report:
+        actions = {}
+        for action in report['repair_plan']:
+            actions[action['action']] = actions.get(action['action'], 0) + 1
+        print(f"Repair plan: {', '.join(f'{count} {name}' for name, count in sorted(actions.items())) or 'nothing to do'}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Check products.image_path against the files in the uploads folder')
+    parser.add_argument('db_file', nargs='?', default=DB_FILE, help='Path to the SQLite database')
+    parser.add_argument('--uploads-folder', default=UPLOADS_FOLDER, help='Folder the image paths point into')
+    parser.add_argument('--report', default=None, help=f'JSON report file (default: a new file in {REPORT_FOLDER})')
+    parser.add_argument('--repair-plan', action='store_true', help='Add the fixes for the problems to the report')
+    parser.add_argument('--apply', action='store_true', help='Carry out the repair plan')
+    parser.add_argument('--strict', action='store_true', help='Exit 1 when references are missing or empty')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('image_audit', args.profile, args.profile_top):
+        if not os.path.exists(args.db_file):
+            print(f"Error: Database file '{args.db_file}' not found!")
+            sys.exit(2)
+
+        conn = connect(args.db_file, profile='default' if args.apply else 'readonly')
+        try:
+            audit = audit_images(conn, args.uploads_folder)
+            plan = repair_plan(conn, audit) if args.repair_plan or args.apply else None
+            report = build_report(audit, args.uploads_folder, plan)
+            print_summary(report)
+            print(f"Report written to {write_report(report, args.report)}")
+            if args.apply:
+                apply_plan(conn, plan, args.uploads_folder)
+        finally:
+            conn.close()
+
+    if args.strict and not args.apply and (audit['missing'] or audit['empty_referenced']):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Concurrent image downloads for the product image scripts.
+
+download_images fetches a set of URLs through one pooled requests.Session
+using a thread pool. Each host gets its own concurrency limit, so a slow
+host cannot use up every worker. Response bodies are streamed straight
+into the content-addressed image store.
+
+Results are remembered in a JSON cache keyed by URL, which stores the ETag
+and Last-Modified headers. Later runs revalidate with a conditional request
+and reuse the stored file on 304 Not Modified.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from image_store import UPLOADS_FOLDER, normalize_extension, store_image_stream
+
+DEFAULT_WORKERS = 8
+PER_HOST_LIMIT = 4
+TIMEOUT = 10  # Seconds to wait for a connection or the next chunk of data
+DOWNLOAD_CACHE = "./data/image_download_cache.json"
+
+def make_session(pool_size=DEFAULT_WORKERS, retries=2):
+    """Create a session whose connection pool can serve pool_size threads at once"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def load_cache(cache_file):
+    """Load the URL -> {image_path, etag, last_modified} cache, or an empty one"""
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable download cache {cache_file}: {e}")
+        return {}
+
+def save_cache(cache_file, cache):
+    """Write the download cache, replacing the previous file atomically"""
+    if not cache_file:
+        return
+    if os.path.dirname(cache_file):
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    temp_file = f"{cache_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(temp_file, cache_file)
+
+def url_extension(url):
+    """Return the image extension of a URL path, .jpg when it has none"""
+    return normalize_extension(os.path.splitext(urlsplit(url).path)[1] or '.jpg')
+
+def verify_image(path):
+    """Raise when a file is not a readable image"""
+    with Image.open(path) as img:
+        img.verify()
+
+def stored_file(image_path, uploads_folder):
+    """Return the local file of an image path returned by the image store"""
+    return os.path.join(uploads_folder, os.path.basename(image_path))
+
+class Downloader:
+    """Download URLs into the image store with per-host limits and revalidation"""
+
+    def __init__(self, session, uploads_folder, cache, per_host=PER_HOST_LIMIT, timeout=TIMEOUT):
+        self.session = session
+        self.uploads_folder = uploads_folder
+        self.cache = cache
+        self.per_host = per_host
+        self.timeout = timeout
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'failed': 0}
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url):
+        """Return the semaphore limiting concurrent requests to the URL's host"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def fetch(self, url):
+        """Download one URL and return its image path, or None on failure"""
+        with self._lock:
+            cached = self.cache.get(url)
+        headers = {}
+        if cached and os.path.exists(stored_file(cached['image_path'], self.uploads_folder)):
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        else:
+            cached = None
+
+        try:
+            with self._slot(url):
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 304 and cached:
+                        self._count('not_modified')
+                        return cached['image_path']
+                    response.raise_for_status()
+                    content_type = response.headers.get('Content-Type', 'image/')
+                    if not content_type.startswith('image/'):
+                        raise ValueError(f"unexpected content type {content_type}")
+                    response.raw.decode_content = True
+                    # The payload is checked before it becomes a blob, so an
+                    # error page served as image/* never lands in the store
+                    image_path = store_image_stream(response.raw, url_extension(url), self.uploads_folder,
+                                                    verify=verify_image)
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+        except Exception as e:
+            print(f"Error downloading image {url}: {e}")
+            self._count('failed')
+            return None
+
+        with self._lock:
+            self.cache[url] = {'image_path': image_path, 'etag': etag, 'last_modified': last_modified}
+        self._count('downloaded')
+        return image_path
+
+def download_images(urls, uploads_folder=UPLOADS_FOLDER, workers=DEFAULT_WORKERS, per_host=PER_HOST_LIMIT,
+                    cache_file=DOWNLOAD_CACHE, session=None, timeout=TIMEOUT):
+    """Download every distinct URL concurrently and return {url: image path or None}.
+
+    session can be passed in to reuse an existing session or to point the
+    downloader at a local test server.
+    """
+    unique_urls = list(dict.fromkeys(url for url in urls if url))
+    if not unique_urls:
+        return {}
+    os.makedirs(uploads_folder, exist_ok=True)
+
+    cache = load_cache(cache_file)
+    own_session = session is None
+    if own_session:
+        session = make_session(workers)
+    downloader = Downloader(session, uploads_folder, cache, per_host, timeout)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip(unique_urls, pool.map(downloader.fetch, unique_urls)))
+    finally:
+        if own_session:
+            session.close()
+        save_cache(cache_file, cache)
+
+    stats = downloader.stats
+    print(f"Downloads: {len(unique_urls)} URLs, {stats['downloaded']} downloaded, "
+          f"{stats['not_modified']} not modified, {stats['failed']} failed")
+    return results
@@ -0,0 +1,228 @@
+"""Garbage collection of unreferenced files in uploads/products.
+
+The image scripts write new files and never remove the ones they replace,
+so the uploads folder keeps growing. This command lists the folder (and its
+variants subfolder) once, loads every products.image_path and
+product_image_variants row in one query each, and treats a file as garbage
+when nothing references it:
+  uploads/products/<name>           no product has it as image_path
+  uploads/products/variants/<name>  no variant row of a referenced image
+Files modified within the grace period are kept, so uploads and imports that
+have written a file but not yet committed the product are safe; image_store
+refreshes the modification time of a blob it reuses for the same reason.
+Placeholders are collected like any other file: they are rendered again when
+needed.
+
+The default is a dry run that reports the files and the bytes they take.
+--quarantine moves them to data/image_quarantine/<time> (with a manifest;
+--restore moves a batch back), --delete removes them. Both re-read the
+references just before acting and work on the files in parallel.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from image_store import UPLOADS_FOLDER
+from image_variants import VARIANTS_SUBFOLDER
+from image_audit import REPORT_FOLDER, scan_folder, load_references, uploads_name
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+QUARANTINE_FOLDER = "./data/image_quarantine"
+MANIFEST_FILE = "manifest.json"
+GRACE_HOURS = 24.0  # Files younger than this are never collected
+DEFAULT_WORKERS = 8  # Threads moving or deleting files (I/O bound, helps on network shares)
+
+def table_exists(conn, table):
+    """Return True when the database has the table"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def live_files(conn):
+    """Return the set of file paths (relative to the uploads folder) that are referenced"""
+    references, _ = load_references(conn)
+    live = set(references)
+    if table_exists(conn, 'product_image_variants'):
+        for image_path, variant_path in conn.execute("SELECT image_path, variant_path FROM product_image_variants"):
+            if uploads_name(image_path) in live:
+                live.add(f"{VARIANTS_SUBFOLDER}/{os.path.basename(variant_path)}")
+    return live
+
+def find_garbage(conn, uploads_folder=UPLOADS_FOLDER, grace_hours=GRACE_HOURS):
+    """Return (garbage, recent): lists of (relative path, bytes) of unreferenced files, past and within the grace period"""
+    files = scan_folder(uploads_folder)
+    for name, stat in scan_folder(os.path.join(uploads_folder, VARIANTS_SUBFOLDER)).items():
+        files[f"{VARIANTS_SUBFOLDER}/{name}"] = stat
+    live = live_files(conn)
+
+    cutoff = time.time() - grace_hours * 3600
+    garbage = []
+    recent = []
+    for name in sorted(set(files) - live):
+        stat = files[name]
+        (garbage if stat.st_mtime < cutoff else recent).append((name, stat.st_size))
+    return garbage, recent
+
+def _move(source, target):
+    """Move a file, across file systems if needed"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.replace(source, target)
+    except OSError:
+        shutil.move(source, target)
+
+def _collect(job):
+    """Quarantine or delete one file (runs in a worker thread); returns an error message or None"""
+    name, source, target = job
+    try:
+        if target:
+            _move(source, target)
+        else:
+            os.remove(source)
+    except FileNotFoundError:
+        return None  # Already gone
+    except OSError as e:
+        return f"{name}: {e}"
+    return None
+
+def collect_garbage(conn, garbage, uploads_folder=UPLOADS_FOLDER, quarantine_batch=None, workers=DEFAULT_WORKERS):
+    """Quarantine (when quarantine_batch is a folder) or delete the garbage files; returns (count, bytes, errors)"""
+    # A product may have picked up one of the files since the scan
+    live = live_files(conn)
+    garbage = [(name, size) for name, size in garbage if name not in live]
+
+    jobs = [(name, os.path.join(uploads_folder, name),
+             os.path.join(quarantine_batch, name) if quarantine_batch else None)
+            for name, _ in garbage]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_collect, jobs))
+    errors = [error for error in results if error]
+    collected = [(name, size) for (name, size), error in zip(garbage, results) if not error]
+
+    if quarantine_batch and collected:
+        with open(os.path.join(quarantine_batch, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'uploads_folder': os.path.abspath(uploads_folder),
+                       'files': [{'file': name, 'bytes': size} for name, size in collected]}, f, indent=1)
+    return len(collected), sum(size for _, size in collected), errors
+
+def restore_batch(quarantine_batch, workers=DEFAULT_WORKERS):
+    """Move the files of a quarantine batch back where they came from; existing files are not overwritten"""
+    with open(os.path.join(quarantine_batch, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+    jobs = []
+    skipped = 0
+    for entry in manifest['files']:
+        target = os.path.join(manifest['uploads_folder'], entry['file'])
+        if os.path.exists(target):
+            skipped += 1
+            continue
+        jobs.append((entry['file'], os.path.join(quarantine_batch, entry['file']), target))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = [error for error in executor.map(_collect, jobs) if error]
+    print(f"Restored {len(jobs) - len(errors)} files to {manifest['uploads_folder']}, "
+          f"{skipped} skipped (a file with that name exists), {len(errors)} failed")
+    for error in errors:
+        print(f"  {error}")
+    return not errors
+
+def new_quarantine_batch(quarantine_folder=QUARANTINE_FOLDER):
+    """Create and return a new batch folder named after the current time (_<n> added when it exists)"""
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    os.makedirs(quarantine_folder, exist_ok=True)
+    batch = os.path.join(quarantine_folder, stamp)
+    suffix = 1
+    while True:
+        try:
+            os.makedirs(batch, exist_ok=False)
+            return batch
+        except FileExistsError:
+            batch = os.path.join(quarantine_folder, f"{stamp}_{suffix}")
+            suffix += 1
+
+def write_report(report, report_file=None):
+    """Write the GC report as JSON and return its path; default names never overwrite an earlier report"""
+    if report_file:
+        if os.path.dirname(report_file):
+            os.makedirs(os.path.dirname(report_file), exist_ok=True)
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        return report_file
+
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    os.makedirs(REPORT_FOLDER, exist_ok=True)
+    report_file = os.path.join(REPORT_FOLDER, f"image_gc-{stamp}.json")
+    suffix = 1
+    while True:
+        try:
+            with open(report_file, 'x', encoding='utf-8') as f:
+                json.dump(report, f, indent=1)
+            return report_file
+        except FileExistsError:
+            report_file = os.path.join(REPORT_FOLDER, f"image_gc-{stamp}_{suffix}.json")
+            suffix += 1
+
+def main():
+    parser = argparse.ArgumentParser(description='Remove files in the uploads folder that no product references')
+    parser.add_argument('db_file', nargs='?', default=DB_FILE, help='Path to the SQLite database')
+    parser.add_argument('--uploads-folder', default=UPLOADS_FOLDER, help='Folder the image paths point into')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--quarantine', action='store_true',
+                        help=f'Move the unreferenced files to a new folder in {QUARANTINE_FOLDER}')
+    action.add_argument('--delete', action='store_true', help='Delete the unreferenced files')
+    action.add_argument('--restore', metavar='BATCH', help='Move the files of a quarantine folder back')
+    parser.add_argument('--grace-hours', type=float, default=GRACE_HOURS,
+                        help='Keep files modified within this many hours')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads moving or deleting files')
+    parser.add_argument('--report', default=None, help=f'JSON report file (default: a new file in {REPORT_FOLDER})')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('image_gc', args.profile, args.profile_top):
+        if args.restore:
+            sys.exit(0 if restore_batch(args.restore, args.workers) else 1)
+        if not os.path.exists(args.db_file):
+            print(f"Error: Database file '{args.db_file}' not found!")
+            sys.exit(2)
+
+        conn = connect(args.db_file, profile='readonly')
+        try:
+            garbage, recent = find_garbage(conn, args.uploads_folder, args.grace_hours)
+            garbage_bytes = sum(size for _, size in garbage)
+            print(f"{len(garbage)} unreferenced files ({garbage_bytes / 1024 / 1024:.1f} MB) in {args.uploads_folder}; "
+                  f"{len(recent)} more ({sum(size for _, size in recent) / 1024 / 1024:.1f} MB) "
+                  f"are younger than {args.grace_hours:g} hours and kept")
+
+            report = {
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'uploads_folder': args.uploads_folder,
+                'mode': 'quarantine' if args.quarantine else 'delete' if args.delete else 'dry-run',
+                'grace_hours': args.grace_hours,
+                'reclaimable_files': len(garbage),
+                'reclaimable_bytes': garbage_bytes,
+                'kept_recent_files': len(recent),
+                'files': [{'file': name, 'bytes': size} for name, size in garbage],
+            }
+            if (args.quarantine or args.delete) and garbage:
+                batch = None
+                if args.quarantine:
+                    batch = new_quarantine_batch()
+                    report['quarantine_folder'] = batch
+                count, reclaimed, errors = collect_garbage(conn, garbage, args.uploads_folder, batch, args.workers)
+                report.update({'collected_files': count, 'reclaimed_bytes': reclaimed, 'errors': errors})
+                verb = f"Moved to {batch}" if batch else "Deleted"
+                print(f"{verb}: {count} files ({reclaimed / 1024 / 1024:.1f} MB), {len(errors)} failed")
+                for error in errors[:10]:
+                    print(f"  {error}")
+            elif garbage:
+                print("Dry run: pass --quarantine or --delete to reclaim the space")
+            print(f"Report written to {write_report(report, args.report)}")
+        finally:
+            conn.close()
+        if report.get('errors'):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
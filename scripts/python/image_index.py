@@ -0,0 +1,176 @@
+"""One-time index of image files for the import scripts.
+
+find_image_file and find_existing_image used to walk the image folders for
+every product row. build_image_index scans a folder once and maps file
+names, lowercase stems and IMG_#### tokens to paths, so lookups are dict
+hits. Numbers written as IMG_#### rank above bare numbers that follow
+them, so "excel_img_200_IMG_7201.jpg" is found for IMG_7201 before
+"excel_img_125_ROUND TABLE DELL-7201.png". The index can be persisted
+to a JSON cache that is reused until the modification time of any indexed
+directory changes.
+"""
+import json
+import os
+import re
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+IMG_TOKEN_PATTERN = re.compile(r'IMG[_\- ]?(\d+)', re.IGNORECASE)
+# Trailing numbers in names like "IMG_8544_8545 DA.jpg" also identify images
+NUMBER_PATTERN = re.compile(r'\d{3,}')
+
+# Indexes already built in this process, keyed by (absolute folder path, recursive)
+_indexes = {}
+
+def image_tokens(name):
+    """Return the normalised tokens of the numbers written as IMG_#### in a file name or image number"""
+    return {f"img_{number}" for number in IMG_TOKEN_PATTERN.findall(name)}
+
+def secondary_tokens(name):
+    """Return the tokens of bare numbers after the first IMG_#### (weaker matches than image_tokens)"""
+    match = IMG_TOKEN_PATTERN.search(name)
+    if not match:
+        return set()
+    # Names like IMG_8544_8545 cover several consecutive photos
+    return {f"img_{number}" for number in NUMBER_PATTERN.findall(name[match.end():])} - image_tokens(name)
+
+def scan_image_files(folder, recursive=True):
+    """List image files under folder and the mtime of every directory visited"""
+    files = []
+    dir_mtimes = {}
+    pending = [folder]
+    while pending:
+        directory = pending.pop()
+        try:
+            dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    pending.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(entry.path)
+    files.sort()
+    return files, dir_mtimes
+
+def index_files(files):
+    """Build the lookup tables for a list of image paths"""
+    by_name = {}
+    by_stem = {}
+    by_token = {}
+    by_secondary_token = {}
+    for path in files:
+        name = os.path.basename(path).lower()
+        stem = os.path.splitext(name)[0]
+        by_name.setdefault(name, path)
+        by_stem.setdefault(stem, path)
+        for token in image_tokens(name):
+            by_token.setdefault(token, path)
+        for token in secondary_tokens(name):
+            by_secondary_token.setdefault(token, path)
+    return {
+        'files': files,
+        'names': [os.path.basename(path).lower() for path in files],
+        'by_name': by_name,
+        'by_stem': by_stem,
+        'by_token': by_token,
+        'by_secondary_token': by_secondary_token,
+        'lookups': {},
+    }
+
+def cache_is_fresh(cache):
+    """Check that none of the directories recorded in the cache has changed"""
+    for directory, mtime in cache.get('dir_mtimes', {}).items():
+        try:
+            if os.stat(directory).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+def build_image_index(folder, cache_file=None, recursive=True):
+    """Scan folder once and return an image index.
+
+    When cache_file is given the scan result is stored there and reused by
+    later runs until one of the indexed directories is modified.
+    """
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if (cache.get('folder') == os.path.abspath(folder)
+                    and cache.get('recursive') == recursive and cache_is_fresh(cache)):
+                print(f"Loaded image index from cache: {cache_file} ({len(cache['files'])} files)")
+                return index_files(cache['files'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable image index cache {cache_file}: {e}")
+
+    if not os.path.isdir(folder):
+        return index_files([])
+
+    files, dir_mtimes = scan_image_files(folder, recursive)
+    print(f"Indexed {len(files)} image files in {folder}")
+
+    if cache_file:
+        if os.path.dirname(cache_file):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        cache = {
+            'folder': os.path.abspath(folder),
+            'recursive': recursive,
+            'dir_mtimes': dir_mtimes,
+            'files': files,
+        }
+        try:
+            created = not os.path.exists(cache_file)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            # Creating the cache inside an indexed folder bumps that folder's
+            # mtime; record the new value (rewriting in place does not change it)
+            cache_dir = os.path.dirname(cache_file) or '.'
+            if created and cache_dir in dir_mtimes:
+                dir_mtimes[cache_dir] = os.stat(cache_dir).st_mtime_ns
+                with open(cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(cache, f)
+        except OSError as e:
+            print(f"Could not write image index cache {cache_file}: {e}")
+
+    return index_files(files)
+
+def get_image_index(folder, cache_file=None, recursive=True):
+    """Return the index for folder, building it on first use in this process"""
+    key = (os.path.abspath(folder), recursive)
+    if key not in _indexes:
+        _indexes[key] = build_image_index(folder, cache_file, recursive)
+    return _indexes[key]
+
+def find_image(index, image_no):
+    """Find the image file for an image number or file name, or None.
+
+    Exact file names, stems, IMG_#### tokens and then the bare numbers that
+    follow an IMG_#### in a name are dict lookups, in that order; anything
+    else falls back to a case-insensitive substring match over the indexed
+    names (in memory, no disk access). Results are memoised per image_no.
+    """
+    if not image_no:
+        return None
+    key = str(image_no).strip().lower()
+    if not key:
+        return None
+    lookups = index['lookups']
+    if key in lookups:
+        return lookups[key]
+
+    path = index['by_name'].get(key) or index['by_stem'].get(key)
+    tokens = sorted(image_tokens(key))
+    for table in ('by_token', 'by_secondary_token'):
+        for token in tokens:
+            path = path or index[table].get(token)
+    if not path:
+        for name, candidate in zip(index['names'], index['files']):
+            if key in name:
+                path = candidate
+                break
+
+    lookups[key] = path
+    return path
@@ -0,0 +1,137 @@
+"""Content-addressed storage for product images.
+
+Images are stored once under uploads/products as <sha256>.<ext>, and every
+product showing the same picture points at the same file. Storing bytes that
+are already present costs no write, so re-running an import only writes
+pictures that are new.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+UPLOADS_FOLDER = "uploads/products"
+URL_PREFIX = "/uploads/products"
+CHUNK_SIZE = 1024 * 1024
+FILE_MODE = 0o644  # Temporary files are created private; stored blobs must be readable by the web server
+
+# Digests of source files already hashed in this process, keyed by (path, size, mtime)
+_file_digests = {}
+
+def normalize_extension(ext):
+    """Return a lowercase extension with a leading dot; .jpeg becomes .jpg"""
+    ext = (ext or '.jpg').lower()
+    if not ext.startswith('.'):
+        ext = '.' + ext
+    return '.jpg' if ext == '.jpeg' else ext
+
+def blob_name(digest, ext):
+    """Return the file name of a stored blob"""
+    return f"{digest}{normalize_extension(ext)}"
+
+def image_url(filename):
+    """Return the path stored in products.image_path for a file in the uploads folder"""
+    return f"{URL_PREFIX}/{filename}"
+
+def content_digest(data):
+    """Return the SHA-256 hex digest of image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+def store_image_bytes(data, ext, uploads_folder=UPLOADS_FOLDER):
+    """Store image bytes and return their image path; nothing is written if the blob exists"""
+    filename = blob_name(content_digest(data), ext)
+    target_path = os.path.join(uploads_folder, filename)
+    if not os.path.exists(target_path):
+        os.makedirs(uploads_folder, exist_ok=True)
+        _write_atomic(target_path, lambda f: f.write(data))
+    else:
+        _touch(target_path)
+    return image_url(filename)
+
+def store_image_stream(stream, ext, uploads_folder=UPLOADS_FOLDER, verify=None):
+    """Store a binary stream without holding it in memory and return its image path.
+
+    The stream is hashed while it is spooled to a temporary file in the
+    uploads folder; the file is renamed into place, or discarded when the
+    blob is already stored. verify, if given, is called with the path of the
+    spooled file and raises to reject it; nothing is stored then.
+    """
+    os.makedirs(uploads_folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=uploads_folder, prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                temp_file.write(chunk)
+        if verify:
+            verify(temp_path)
+        filename = blob_name(digest.hexdigest(), ext)
+        target_path = os.path.join(uploads_folder, filename)
+        if os.path.exists(target_path):
+            os.remove(temp_path)
+            _touch(target_path)
+        else:
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return image_url(filename)
+
+def file_digest(path):
+    """Return the SHA-256 of a file, hashing each (path, size, mtime) only once per process"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+def store_image_file(source_path, uploads_folder=UPLOADS_FOLDER):
+    """Store an image file and return its image path; already stored content is not copied"""
+    ext = os.path.splitext(source_path)[1]
+    filename = blob_name(file_digest(source_path), ext)
+    target_path = os.path.join(uploads_folder, filename)
+    if not os.path.exists(target_path):
+        os.makedirs(uploads_folder, exist_ok=True)
+        with open(source_path, 'rb') as source:
+            _write_atomic(target_path, lambda f: shutil.copyfileobj(source, f, CHUNK_SIZE))
+    else:
+        _touch(target_path)
+    return image_url(filename)
+
+def store_pil_image(img, ext='.jpg', uploads_folder=UPLOADS_FOLDER):
+    """Encode a PIL image and store it; identical renderings share one file"""
+    ext = normalize_extension(ext)
+    image_format = {'.jpg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.webp': 'WEBP'}.get(ext)
+    if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buffer = BytesIO()
+    img.save(buffer, format=image_format)
+    return store_image_bytes(buffer.getvalue(), ext, uploads_folder)
+
+def _touch(path):
+    """Mark a reused blob as recently used, so image_gc leaves it alone for its grace period"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _write_atomic(target_path, write):
+    """Call write(file) on a temporary file next to target_path and rename it into place"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or '.', prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.chmod(temp_path, FILE_MODE)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,245 @@
+"""Thumbnails and compressed variants of the product images.
+
+The images in uploads/products are full-size originals. This stage renders
+each one at a few fixed widths (WebP by default, AVIF or JPEG on request)
+into uploads/products/variants, so list pages can load a small image
+instead. Each variant is recorded in product_image_variants, keyed by the
+products.image_path it was made from, together with the hash of that
+source. A rerun only renders sources that are new or whose hash changed.
+
+JPEG sources are decoded with Image.draft, which lets libjpeg scale down by
+up to 8x while decoding. Large reductions go through Image.reduce before
+the final resize. Rendering runs in a process pool.
+"""
+import argparse
+import datetime
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from image_store import UPLOADS_FOLDER, URL_PREFIX, FILE_MODE, file_digest
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+# Configuration
+VARIANTS_SUBFOLDER = "variants"
+VARIANT_WIDTHS = (160, 320, 640)  # Pixel widths rendered for every image
+VARIANT_FORMATS = ('webp',)
+FORMAT_OPTIONS = {
+    'webp': ('.webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'avif': ('.avif', 'AVIF', {'quality': 60}),
+    'jpg': ('.jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DEFAULT_WORKERS = None  # Render processes (None = one per CPU)
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}$')  # Blob names from image_store are their own hash
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS product_image_variants (
+    image_path TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    variant_path TEXT NOT NULL,
+    variant_width INTEGER,
+    variant_height INTEGER,
+    bytes INTEGER,
+    source_hash TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (image_path, width, format)
+)
+"""
+
+def ensure_variant_table(conn):
+    """Create the variant table if it does not exist"""
+    conn.execute(CREATE_TABLE)
+
+def source_file(image_path, uploads_folder=UPLOADS_FOLDER):
+    """Return the file behind a products.image_path, or None for paths outside the uploads folder"""
+    if not image_path or not image_path.startswith(URL_PREFIX + '/'):
+        return None
+    name = image_path[len(URL_PREFIX) + 1:]
+    if '/' in name:
+        return None
+    return os.path.join(uploads_folder, name)
+
+def source_hash(path):
+    """Return the content hash of a source image; content-addressed blobs are named after it"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem if CONTENT_ADDRESSED.match(stem) else file_digest(path)
+
+def variant_name(path, width, image_format):
+    """Return the file name of one variant of a source file"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}_w{width}{FORMAT_OPTIONS[image_format][0]}"
+
+def open_for_width(path, width):
+    """Open an image decoded at no less than width pixels (JPEG sources are scaled while decoding).
+
+    Palette, 1-bit, 16-bit and other modes are converted to RGB/RGBA (L stays
+    L), the modes Image.reduce and the resampling filters work on.
+    """
+    img = Image.open(path)
+    if img.format == 'JPEG' and img.width > width:
+        img.draft('RGB', (width, max(1, img.height * width // img.width)))
+    img = ImageOps.exif_transpose(img)
+    img.load()
+    if img.mode.startswith('I;16'):
+        # 16-bit greyscale: scale to 8 bits instead of clipping at 255
+        converted = img.convert('I').point(lambda value: value / 256).convert('L')
+        img.close()
+        img = converted
+    elif img.mode not in ('RGB', 'RGBA', 'L'):
+        has_alpha = img.mode in ('LA', 'PA', 'RGBa', 'La') or 'transparency' in img.info
+        converted = img.convert('RGBA' if has_alpha else 'RGB')
+        img.close()
+        img = converted
+    return img
+
+def scale_to_width(img, width):
+    """Downscale img to width pixels (never upscales)"""
+    if img.width <= width:
+        return img
+    height = max(1, round(img.height * width / img.width))
+    # Integer box reduction first, leaving a factor below 2 for the resampling filter
+    factor = img.width // (width * 2)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.resize((width, height), Image.LANCZOS)
+
+def _save_variant(img, target_path, image_format):
+    """Encode img into target_path atomically; returns the file size"""
+    _, pil_format, options = FORMAT_OPTIONS[image_format]
+    if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA', 'L'):
+        img = img.convert('RGBA')
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, format=pil_format, **options)
+        os.chmod(temp_path, FILE_MODE)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return os.path.getsize(target_path)
+
+def render_variants(job):
+    """Render every width and format of one source image (runs in a worker process).
+
+    Returns (image_path, source hash, [(width, format, variant path, width, height, bytes)]).
+    """
+    image_path, path, digest, widths, formats, variants_folder = job
+    rendered = []
+    img = open_for_width(path, max(widths))
+    try:
+        # Largest first; each smaller width is scaled from the previous one
+        current = img
+        for width in sorted(widths, reverse=True):
+            current = scale_to_width(current, width)
+            for image_format in formats:
+                name = variant_name(path, width, image_format)
+                size = _save_variant(current, os.path.join(variants_folder, name), image_format)
+                rendered.append((width, image_format, f"{URL_PREFIX}/{VARIANTS_SUBFOLDER}/{name}",
+                                 current.width, current.height, size))
+    finally:
+        img.close()
+    return image_path, digest, rendered
+
+def pending_jobs(conn, uploads_folder, widths, formats, force=False):
+    """Return render jobs for the product images whose variants are missing or out of date"""
+    variants_folder = os.path.join(uploads_folder, VARIANTS_SUBFOLDER)
+    existing = {}
+    for image_path, width, image_format, variant_path, digest in conn.execute(
+            "SELECT image_path, width, format, variant_path, source_hash FROM product_image_variants"):
+        existing.setdefault(image_path, {})[(width, image_format)] = (variant_path, digest)
+
+    wanted = {(width, image_format) for width in widths for image_format in formats}
+    jobs = []
+    missing = 0
+    for (image_path,) in conn.execute(
+            "SELECT DISTINCT image_path FROM products WHERE image_path IS NOT NULL AND image_path != ''"):
+        path = source_file(image_path, uploads_folder)
+        if not path or not os.path.isfile(path):
+            missing += 1
+            continue
+        digest = source_hash(path)
+        current = existing.get(image_path, {})
+        up_to_date = all(
+            key in current and current[key][1] == digest
+            and os.path.exists(os.path.join(variants_folder, os.path.basename(current[key][0])))
+            for key in wanted
+        )
+        if force or not up_to_date:
+            jobs.append((image_path, path, digest, tuple(widths), tuple(formats), variants_folder))
+    if missing:
+        print(f"Skipping {missing} image paths without a file in {uploads_folder}")
+    return jobs
+
+def save_variants(conn, image_path, digest, rendered):
+    """Replace the recorded variants of one source image"""
+    now = datetime.datetime.now()
+    conn.execute("DELETE FROM product_image_variants WHERE image_path = ?", (image_path,))
+    conn.executemany(
+        """
+        INSERT INTO product_image_variants (
+            image_path, width, format, variant_path, variant_width, variant_height, bytes, source_hash, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(image_path, width, image_format, variant_path, variant_width, variant_height, size, digest, now)
+         for width, image_format, variant_path, variant_width, variant_height, size in rendered]
+    )
+
+def generate_variants(uploads_folder=UPLOADS_FOLDER, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS,
+                      workers=DEFAULT_WORKERS, force=False):
+    """Render the missing or outdated variants of every product image; returns the number of sources rendered"""
+    if not os.path.exists(DB_FILE):
+        print(f"Error: Database file '{DB_FILE}' not found!")
+        return 0
+    os.makedirs(os.path.join(uploads_folder, VARIANTS_SUBFOLDER), exist_ok=True)
+
+    conn = connect(DB_FILE)
+    try:
+        ensure_variant_table(conn)
+        conn.commit()
+        jobs = pending_jobs(conn, uploads_folder, widths, formats, force)
+        print(f"Rendering variants for {len(jobs)} images ({', '.join(map(str, widths))} px; {', '.join(formats)})")
+        if not jobs:
+            return 0
+
+        rendered_count = 0
+        failed_count = 0
+        variant_bytes = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_variants, job) for job in jobs]
+            for job, future in zip(jobs, futures):
+                try:
+                    image_path, digest, rendered = future.result()
+                except Exception as e:
+                    print(f"Error rendering variants of {job[0]}: {e}")
+                    failed_count += 1
+                    continue
+                save_variants(conn, image_path, digest, rendered)
+                rendered_count += 1
+                variant_bytes += sum(entry[-1] for entry in rendered)
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"Rendered variants for {rendered_count} images ({variant_bytes / 1024 / 1024:.1f} MB), "
+          f"{failed_count} failed")
+    return rendered_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render thumbnails and compressed variants of product images')
+    parser.add_argument('--widths', type=int, nargs='+', default=list(VARIANT_WIDTHS), help='Variant widths in pixels')
+    parser.add_argument('--formats', nargs='+', choices=sorted(FORMAT_OPTIONS), default=list(VARIANT_FORMATS),
+                        help='Variant formats')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Render processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='Render every image again')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('image_variants', args.profile, args.profile_top):
+        generate_variants(widths=args.widths, formats=args.formats, workers=args.workers, force=args.force)
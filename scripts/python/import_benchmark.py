@@ -0,0 +1,289 @@
+"""Benchmark the importers on synthetic packing lists.
+
+Generates workbooks with the layout of the PL sheet (a title row, then
+SR No, DESCRIPTION, QTY, IMAGE NO, IMAGE, RACK NO, REMARKS) at the requested
+sizes, with a picture anchored in the IMAGE column of a configurable share
+of the rows. Each importer then runs end to end as its own process, in a
+scratch folder with a scratch database (schema, users and categories copied
+from the real one), so the runs do not disturb each other or the real data.
+
+Per run the harness records wall time, rows/s, the peak RSS of the importer
+process and the time of each phase (generate, setup, import, plus the parse,
+resolve, image, insert and commit phases the importer reports through its
+metrics summary), prints a table and appends the results to a JSON file for
+comparing optimisations. A run that exits with an error or ends with fewer
+products than rows is marked as failed or incomplete, gets no rows/s, and
+makes the benchmark exit non-zero.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import openpyxl
+from openpyxl.drawing.image import Image as ExcelImage
+from PIL import Image
+from import_metrics import METRICS_FILE_ENV
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+# Configuration
+BENCHMARK_FOLDER = "./benchmark"
+RESULTS_FILE = "./benchmark/results.json"
+DEFAULT_SIZES = (1000, 10000)
+MAX_ROWS = 1000000
+DEFAULT_IMAGE_DENSITY = 0.1  # Share of rows with an embedded picture
+GENERATOR_VERSION = 2  # Part of the workbook file name: bump when generated rows change
+SCRIPTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+WORKBOOK_NAME = "PL- ARPER.xlsx"  # The importers read this file from their working folder
+SHEET_NAME = "PL"
+HEADER = ['SR No', 'DESCRIPTION', 'QTY', 'IMAGE NO', 'IMAGE', 'RACK NO', 'REMARKS']
+SEED_TABLES = ('users', 'categories')  # Copied into every scratch database
+IMAGE_SIZE = (96, 72)
+PRODUCT_WORDS = ('CHAIR', 'TABLE', 'STOOL', 'SOFA', 'BENCH', 'LOUNGE CHAIR', 'SIDE TABLE', 'ARMCHAIR', 'POUF')
+FINISHES = ('OAK', 'WALNUT', 'BLACK', 'WHITE', 'GREY', 'RED', 'CHROME')
+
+# name: (script and arguments, whether products must be imported first)
+IMPORTERS = {
+    'import': (['import_excel_data.py'], False),
+    'import-batch': (['import_excel_data.py', '--batch'], False),
+    'import-incremental': (['import_excel_data.py', '--incremental'], False),
+    'import-unique': (['import_excel_data_unique.py'], False),
+    'pipeline': (['import_pipeline.py', WORKBOOK_NAME, '--workers', '2'], False),
+    'rack-locations': (['update_rack_locations.py'], True),
+    'extract-images': (['extract_excel_images.py'], True),
+}
+SETUP_IMPORTER = 'import-batch'
+
+def workbook_path(rows, image_density, seed, folder=BENCHMARK_FOLDER):
+    """Path of the generated workbook for one size and image density"""
+    return os.path.join(folder, "workbooks", f"pl_{rows}_{image_density:g}_{seed}_v{GENERATOR_VERSION}.xlsx")
+
+def _picture(rng):
+    """Return PNG bytes of a small product picture (content differs per picture)"""
+    img = Image.new('RGB', IMAGE_SIZE, tuple(rng.randrange(256) for _ in range(3)))
+    img.paste(tuple(rng.randrange(256) for _ in range(3)), (8, 8, IMAGE_SIZE[0] - 8, IMAGE_SIZE[1] // 2))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def generate_workbook(path, rows, image_density=DEFAULT_IMAGE_DENSITY, seed=0):
+    """Write a synthetic packing list with rows product rows (streamed, so 1M rows stay in bounded memory)"""
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_NAME)
+    sheet.append(['ARPER PACKING LIST'])
+    sheet.append(HEADER)
+    for sr in range(1, rows + 1):
+        excel_row = sr + 2
+        # The importers derive the SKU from the first 8 letters and digits of
+        # the name, so the row number goes first to keep every SKU unique
+        name = f"P{sr:07d} {rng.choice(PRODUCT_WORDS)} {rng.choice(FINISHES)}"
+        rack = f"R{rng.randint(1, 12)} E{rng.randint(1, 6)}"
+        remarks = f"#{rng.randint(1, 40)}  {rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2023"
+        sheet.append([sr, name, rng.randint(1, 50), f"IMG_{8000 + sr}", None, rack, remarks])
+        if rng.random() < image_density:
+            picture = ExcelImage(io.BytesIO(_picture(rng)))
+            picture.anchor = f"E{excel_row}"
+            sheet.add_image(picture)
+    temp_path = f"{path}.tmp"
+    workbook.save(temp_path)
+    os.replace(temp_path, path)
+
+def create_scratch_database(db_file, template=DB_FILE):
+    """Create db_file with the schema of the template database and its users and categories"""
+    source = connect(template, profile='readonly')
+    target = connect(db_file, profile='bulk')
+    try:
+        objects = source.execute(
+            "SELECT type, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        # Tables first, indexes, views and triggers after them
+        for _, sql in sorted(objects, key=lambda item: item[0] != 'table'):
+            target.execute(sql)
+        for table in SEED_TABLES:
+            cursor = source.execute(f"SELECT * FROM {table}")
+            columns = [column[0] for column in cursor.description]
+            target.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                cursor.fetchall()
+            )
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+
+def run_script(arguments, work_folder, db_file, log_file, metrics_file=''):
+    """Run one script in work_folder against db_file; returns (seconds, peak RSS in MB or None, exit code)"""
+    env = dict(os.environ, DB_FILENAME=db_file)
+    env[METRICS_FILE_ENV] = metrics_file  # Empty: no summary file
+    command = [sys.executable, os.path.join(SCRIPTS_FOLDER, arguments[0]), *arguments[1:]]
+    with open(log_file, 'a', encoding='utf-8') as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=work_folder, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, 'wait4'):
+            # The rusage of the waited-for child holds its peak RSS (in KB on Linux)
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak_rss = usage.ru_maxrss / 1024
+        else:
+            process.wait()
+            peak_rss = None
+        elapsed = time.perf_counter() - started
+    return elapsed, peak_rss, process.returncode
+
+def count_products(db_file):
+    """Return the number of products in a scratch database"""
+    conn = connect(db_file, profile='readonly')
+    try:
+        return conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    finally:
+        conn.close()
+
+def benchmark_importer(name, source_workbook, rows, scratch_folder, template=DB_FILE):
+    """Run one importer on one workbook in a fresh scratch folder; returns its result record"""
+    arguments, needs_products = IMPORTERS[name]
+    if os.path.exists(scratch_folder):
+        shutil.rmtree(scratch_folder)
+    os.makedirs(os.path.join(scratch_folder, 'data'))
+    db_file = os.path.abspath(os.path.join(scratch_folder, 'data', 'inventory.db'))
+    log_file = os.path.join(scratch_folder, 'output.log')
+
+    setup_started = time.perf_counter()
+    try:
+        os.link(source_workbook, os.path.join(scratch_folder, WORKBOOK_NAME))
+    except OSError:
+        shutil.copyfile(source_workbook, os.path.join(scratch_folder, WORKBOOK_NAME))
+    create_scratch_database(db_file, template)
+    setup_products = None
+    if needs_products:
+        run_script(IMPORTERS[SETUP_IMPORTER][0], scratch_folder, db_file, log_file)
+        setup_products = count_products(db_file)
+    setup_time = time.perf_counter() - setup_started
+
+    metrics_file = os.path.abspath(os.path.join(scratch_folder, 'metrics.json'))
+    elapsed, peak_rss, exit_code = run_script(arguments, scratch_folder, db_file, log_file, metrics_file)
+    phases = {'setup': round(setup_time, 3), 'import': round(elapsed, 3)}
+    if os.path.exists(metrics_file):
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            reported = json.load(f)['phases']
+        phases.update({f"import.{phase_name}": phase['seconds'] for phase_name, phase in reported.items()})
+
+    # Throughput only counts when every row made it into the database (for the
+    # importers that need products first: into the setup import)
+    products = count_products(db_file)
+    if exit_code != 0:
+        status = 'failed'
+    elif products < rows or (setup_products is not None and setup_products < rows):
+        status = 'incomplete'
+    else:
+        status = 'ok'
+    return {
+        'importer': name,
+        'rows': rows,
+        'status': status,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 and status == 'ok' else None,
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+        'products': products,
+        'setup_products': setup_products,
+        'exit_code': exit_code,
+        'phases': phases,
+        'log': log_file,
+    }
+
+def run_benchmarks(sizes=DEFAULT_SIZES, importers=tuple(IMPORTERS), image_density=DEFAULT_IMAGE_DENSITY, seed=0,
+                   folder=BENCHMARK_FOLDER, results_file=RESULTS_FILE, template=DB_FILE, keep=False):
+    """Generate the workbooks, run every importer on every size and record the results"""
+    if not os.path.exists(template):
+        print(f"Error: Database file '{template}' not found!")
+        return []
+    results = []
+    for rows in sizes:
+        source_workbook = workbook_path(rows, image_density, seed, folder)
+        generate_time = 0.0
+        if not os.path.exists(source_workbook):
+            print(f"Generating {rows} rows ({image_density:.0%} with images): {source_workbook}")
+            started = time.perf_counter()
+            generate_workbook(source_workbook, rows, image_density, seed)
+            generate_time = time.perf_counter() - started
+
+        for name in importers:
+            print(f"Running {name} on {rows} rows...")
+            scratch_folder = os.path.join(folder, 'runs', f"{name}_{rows}")
+            result = benchmark_importer(name, source_workbook, rows, scratch_folder, template)
+            result['phases'] = {'generate': round(generate_time, 3), **result['phases']}
+            result['image_density'] = image_density
+            result['run_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+            if result['status'] == 'failed':
+                print(f"  {name} exited with code {result['exit_code']}, see {result['log']}")
+            elif result['status'] == 'incomplete':
+                imported = result['setup_products'] if result['setup_products'] is not None else result['products']
+                print(f"  {name}: only {imported} of {rows} rows were imported, see {result['log']}")
+            if not keep:
+                shutil.rmtree(scratch_folder, ignore_errors=True)
+                result['log'] = None
+            results.append(result)
+
+    print_results(results)
+    if results_file:
+        save_results(results, results_file)
+    return results
+
+def save_results(results, results_file=RESULTS_FILE):
+    """Append results to the JSON results file"""
+    history = []
+    if os.path.exists(results_file):
+        with open(results_file, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    os.makedirs(os.path.dirname(results_file) or '.', exist_ok=True)
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(history + results, f, indent=1)
+    print(f"Results appended to {results_file}")
+
+def print_results(results):
+    """Print one line per importer and size"""
+    print(f"\n{'Importer':<28} {'Rows':>9} {'Seconds':>9} {'Rows/s':>9} {'Peak MB':>8} {'Products':>9} "
+          f"{'Setup s':>8} {'Generate s':>10}  Import phases (s)")
+    for result in results:
+        rate = f"{result['rows_per_second']:.0f}" if result['rows_per_second'] else '-'
+        rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else '-'
+        failed = f" ({result['status']})" if result['status'] != 'ok' else ''
+        reported = ' '.join(f"{name[len('import.'):]} {seconds:.2f}" for name, seconds in result['phases'].items()
+                            if name.startswith('import.'))
+        print(f"{result['importer'] + failed:<28} {result['rows']:>9} {result['seconds']:>9.2f} {rate:>9} {rss:>8} "
+              f"{result['products']:>9} {result['phases']['setup']:>8.2f} {result['phases']['generate']:>10.2f}  "
+              f"{reported or '-'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the importers on synthetic packing lists')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help=f'Rows per generated workbook (up to {MAX_ROWS})')
+    parser.add_argument('--importers', nargs='+', choices=list(IMPORTERS), default=list(IMPORTERS),
+                        help='Importers to run (default: all)')
+    parser.add_argument('--image-density', type=float, default=DEFAULT_IMAGE_DENSITY,
+                        help='Share of rows with an embedded picture (0 to 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the generated data')
+    parser.add_argument('--folder', default=BENCHMARK_FOLDER, help='Folder for workbooks and scratch runs')
+    parser.add_argument('--results', default=RESULTS_FILE, help='JSON file the results are appended to')
+    parser.add_argument('--template-db', default=DB_FILE, help='Database whose schema and users are copied')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch folders and logs of every run')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('import_benchmark', args.profile, args.profile_top):
+        if any(size < 1 or size > MAX_ROWS for size in args.sizes):
+            parser.error(f"sizes must be between 1 and {MAX_ROWS}")
+        if not 0 <= args.image_density <= 1:
+            parser.error("image density must be between 0 and 1")
+        results = run_benchmarks(sizes=args.sizes, importers=args.importers, image_density=args.image_density,
+                                 seed=args.seed, folder=args.folder, results_file=args.results,
+                                 template=args.template_db, keep=args.keep)
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
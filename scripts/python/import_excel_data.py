@@ -1,19 +1,51 @@
-import pandas as pd
-import sqlite3
 import os
 import uuid
 import shutil
-from PIL import Image, ImageDraw, ImageFont
 from pathlib import Path
 import datetime
 import sys
+import time
 import argparse
+from itertools import islice
+from excel_reader import cell_text, cell_number
+from image_index import get_image_index, find_image
+from placeholder_images import create_placeholder
+from rack_codes import rack_key, ensure_rack_keys, load_rack_ids
+from row_fingerprints import (ensure_fingerprint_table, row_fingerprint, load_fingerprints,
+                              save_fingerprints, retire_fingerprints, sheet_key, sheet_sku_tag,
+                              adopt_legacy_fingerprints)
+from db_connection import DB_FILE, connect
+from layout_cache import open_layout, LayoutChanged, PRODUCT_FIELDS
+from import_metrics import RunMetrics, quiet_metrics, add_metrics_arguments
+from profiling import profiled, add_profile_arguments
 
 # Configuration
 DEFAULT_EXCEL_FILE = "PL- ARPER.xlsx"
-DB_FILE = "./data/arper_inventory.db"  # Updated to match the actual database name
 IMAGES_FOLDER = "PL- ARPER_files"  # Folder containing the Excel images
+IMAGE_INDEX_CACHE = None  # Optional JSON file to persist the image index between runs
 UPLOADS_FOLDER = "uploads/products"  # Target folder for product images
+DEFAULT_CHUNK_SIZE = None  # Rows per transaction in batch mode (None = one transaction)
+
+# Statements of the batch mode
+PRODUCT_INSERT = """
+    INSERT INTO products (
+        product_id, name, description, sku, price, cost, 
+        category_id, image_path, created_at, updated_at, created_by
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+LOCATION_INSERT = """
+    INSERT INTO locations (
+        location_id, name, description, type, rack_key, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+INVENTORY_INSERT = """
+    INSERT INTO inventory (
+        inventory_id, product_id, location_id, quantity, 
+        created_at, updated_at, created_by
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_reported_missing_folders = set()
 
 def create_uploads_folder():
     """Create the uploads folder if it doesn't exist"""
@@ -21,8 +53,17 @@ def create_uploads_folder():
         os.makedirs(UPLOADS_FOLDER, exist_ok=True)
         print(f"Created directory: {UPLOADS_FOLDER}")
 
-def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
-    """Import data from Excel into SQLite database"""
+def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None, batch=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                      incremental=False, relearn_layout=False, debug=False, metrics_file=None):
+    """Import data from Excel into SQLite database
+
+    The sheet is streamed row by row. With batch=True the rows are written
+    with executemany, committing once per chunk_size rows (or once in total).
+    With incremental=True only rows that are new, changed or removed since
+    the previous incremental import are written. The column layout is taken
+    from the layout cache; relearn_layout detects it again. Progress and
+    phase times are reported through RunMetrics; debug prints every row.
+    """
     # Check if the Excel file exists
     if not os.path.exists(excel_file):
         print(f"Error: Excel file '{excel_file}' not found.")
@@ -35,55 +76,22 @@ def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
 
     # Read the Excel file
     print(f"Reading Excel file: {excel_file}")
+    mode = 'incremental' if incremental else 'batch' if batch else 'row'
+    metrics = RunMetrics('import_excel_data', debug=debug, metrics_file=metrics_file)
     try:
-        # First, read the file to identify the header row
-        df = pd.read_excel(excel_file, header=None, engine='openpyxl')
-        
-        # Find the header row by looking for "SR No" or "DESCRIPTION"
-        header_row = None
-        for i in range(min(10, len(df))):
-            row = df.iloc[i]
-            for cell in row:
-                if isinstance(cell, str) and ('SR No' in cell or 'DESCRIPTION' in cell):
-                    header_row = i
-                    break
-            if header_row is not None:
-                break
-                
-        if header_row is None:
-            print("Could not find header row, assuming first row")
-            header_row = 0
-        
-        # Now read with the correct header
-        df = pd.read_excel(excel_file, header=header_row, engine='openpyxl')
-        
-        # Clean column names
-        df.columns = [str(col).strip() for col in df.columns]
+        # Open the sheet once with the column layout of its format (detected
+        # and cached on the first import, checked against the header after that)
+        layout, rows = open_layout(excel_file, with_row_numbers=incremental, relearn=relearn_layout)
+        columns = layout['columns']
+        header_row = layout['header_row']
+        sheet_name = layout['sheet']
         
         # Print column names for debugging
-        print(f"Columns in Excel: {df.columns.tolist()}")
-        
-        # Sample data
-        print("\nSample data:")
-        print(df.head(5))
+        print(f"Header row: {header_row}{' (cached layout)' if layout['cached'] else ''}")
+        print(f"Columns in Excel: {columns}")
         
         # Identify the correct columns for product data
-        name_col = next((col for col in df.columns if 'DESCRIPTION' in col), None)
-        qty_col = next((col for col in df.columns if 'QTY' in col), None)
-        image_col = next((col for col in df.columns if 'IMAGE NO' in col), None)
-        rack_col = next((col for col in df.columns if 'RACK' in col), None)
-        remarks_col = next((col for col in df.columns if 'REMARKS' in col), None)
-        
-        if not name_col:
-            name_col = 'Unnamed: 1'  # Fallback based on observation
-        if not qty_col:
-            qty_col = 'Unnamed: 2'   # Fallback based on observation
-        if not image_col:
-            image_col = 'Unnamed: 3' # Fallback based on observation
-        if not rack_col:
-            rack_col = 'Unnamed: 5' # Fallback based on observation
-        if not remarks_col:
-            remarks_col = 'Unnamed: 6' # Fallback based on observation
+        name_col, qty_col, image_col, rack_col, remarks_col = (layout['mapping'][field] for field in PRODUCT_FIELDS)
             
         print(f"\nUsing columns:")
         print(f"  Product Name: {name_col}")
@@ -94,23 +102,11 @@ def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
         
         # Connect to SQLite database
         print(f"\nConnecting to database: {DB_FILE}")
-        conn = sqlite3.connect(DB_FILE)
+        conn = connect(DB_FILE, profile='bulk')
         cursor = conn.cursor()
         
         # Create 'Office Supplies' category if it doesn't exist
-        category_id = str(uuid.uuid4())
-        cursor.execute("SELECT category_id FROM categories WHERE name = 'Office Supplies'")
-        category = cursor.fetchone()
-        
-        if not category:
-            print("Creating 'Office Supplies' category")
-            cursor.execute(
-                "INSERT INTO categories (category_id, name, description, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-                (category_id, 'Office Supplies', 'Imported office supplies from Excel', datetime.datetime.now(), datetime.datetime.now())
-            )
-            conn.commit()
-        else:
-            category_id = category[0]
+        category_id = get_import_category_id(conn)
             
         # Get admin user ID if not provided
         if not user_id:
@@ -124,51 +120,48 @@ def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
         # Create uploads folder if it doesn't exist
         create_uploads_folder()
         
+        if incremental:
+            selected_columns = (name_col, qty_col, image_col, rack_col, remarks_col)
+            sr_col = layout['mapping']['sr']
+            # Same key and SKU tag as import_pipeline, so both paths share the fingerprints
+            key = sheet_key(excel_file, sheet_name)
+            if adopt_legacy_fingerprints(conn, excel_file, sheet_name):
+                print(f"Moved the fingerprints of {os.path.basename(excel_file)}:{sheet_name} to {key}")
+            changed_count = import_rows_incremental(conn, rows, selected_columns, sr_col, key, category_id, user_id,
+                                                    sku_tag=sheet_sku_tag(key), metrics=metrics)
+            conn.close()
+            metrics.finish(file=excel_file, mode=mode, changed=changed_count)
+            return changed_count
+        
+        if batch:
+            selected_columns = (name_col, qty_col, image_col, rack_col, remarks_col)
+            imported_count = import_rows_batch(conn, rows, selected_columns, category_id, user_id, chunk_size,
+                                               metrics=metrics)
+            conn.close()
+            metrics.finish(file=excel_file, mode=mode, imported=imported_count)
+            return imported_count
+        
+        # Rack locations are matched on their canonical rack code ("R3 E1" == "R3E1")
+        ensure_rack_keys(conn)
+        conn.commit()
+        rack_ids = load_rack_ids(conn)
+        
         # Process each row
         imported_count = 0
-        for _, row in df.iterrows():
+        for row in metrics.timed(rows):
             # Skip rows without a product name
-            product_name = row.get(name_col)
-            if not product_name or pd.isna(product_name) or str(product_name).strip() == '':
+            product_name = cell_text(row.get(name_col))
+            if not product_name:
                 continue
-                
-            product_name = str(product_name).strip()
+            metrics.advance()
             
-            # Get quantity
-            quantity = row.get(qty_col, 0)
-            if pd.isna(quantity):
-                quantity = 0
-            try:
-                quantity = float(quantity)
-            except (ValueError, TypeError):
-                quantity = 0
+            quantity = cell_number(row.get(qty_col))
+            image_no = cell_text(row.get(image_col))
+            rack_location = cell_text(row.get(rack_col))
+            remarks = cell_text(row.get(remarks_col))
                 
-            # Get image number
-            image_no = row.get(image_col)
-            if pd.isna(image_no):
-                image_no = None
-            else:
-                image_no = str(image_no).strip()
-                
-            # Get rack location
-            rack_location = row.get(rack_col)
-            if pd.isna(rack_location):
-                rack_location = None
-            else:
-                rack_location = str(rack_location).strip()
-                
-            # Get remarks
-            remarks = row.get(remarks_col)
-            if pd.isna(remarks):
-                remarks = None
-            else:
-                remarks = str(remarks).strip()
-                
-            print(f"\nProcessing product: {product_name}")
-            print(f"  Quantity: {quantity}")
-            print(f"  Image: {image_no}")
-            print(f"  Rack: {rack_location}")
-            print(f"  Remarks: {remarks}")
+            metrics.debug(f"Processing product: {product_name} (quantity {quantity}, image {image_no}, "
+                          f"rack {rack_location}, remarks {remarks})")
             
             # Generate a product ID
             product_id = str(uuid.uuid4())
@@ -179,26 +172,29 @@ def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
             # Find or create image
             image_path = None
             if image_no:
-                # Try to find the image file
-                image_file = find_image_file(image_no)
-                if image_file:
-                    # Copy to uploads folder
-                    dest_path = os.path.join(UPLOADS_FOLDER, f"{product_id}.jpg")
-                    try:
-                        shutil.copy2(image_file, dest_path)
-                        image_path = f"/uploads/products/{product_id}.jpg"
-                        print(f"  Copied image to {dest_path}")
-                    except Exception as e:
-                        print(f"  Error copying image: {e}")
-                else:
-                    # Create a placeholder image
-                    dest_path = os.path.join(UPLOADS_FOLDER, f"{product_id}.jpg")
-                    create_placeholder_image(image_no, dest_path)
-                    image_path = f"/uploads/products/{product_id}.jpg"
-                    print(f"  Created placeholder image at {dest_path}")
+                with metrics.phase('image'):
+                    # Try to find the image file
+                    image_file = find_image_file(image_no)
+                    if image_file:
+                        # Copy to uploads folder
+                        dest_path = os.path.join(UPLOADS_FOLDER, f"{product_id}.jpg")
+                        try:
+                            shutil.copy2(image_file, dest_path)
+                            image_path = f"/uploads/products/{product_id}.jpg"
+                            metrics.count('images_copied')
+                            metrics.debug(f"  Copied image to {dest_path}")
+                        except Exception as e:
+                            metrics.count('image_errors')
+                            metrics.info(f"  Error copying image for {product_name}: {e}")
+                    else:
+                        # Use the shared placeholder for this image number
+                        image_path = create_placeholder(image_no, style='label', uploads_folder=UPLOADS_FOLDER)
+                        metrics.count('placeholders')
+                        metrics.debug(f"  Using placeholder image {image_path}")
             
             # Insert product into database
             try:
+                insert_started = time.perf_counter()
                 cursor.execute(
                     """
                     INSERT INTO products (
@@ -222,30 +218,33 @@ def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
                 )
                 
                 # Find or create rack location
+                resolve_started = time.perf_counter()
                 location_id = None
                 if rack_location:
-                    cursor.execute("SELECT location_id FROM locations WHERE name = ? AND type = 'Rack'", (rack_location,))
-                    location = cursor.fetchone()
+                    location_id = rack_ids.get(rack_key(rack_location))
                     
-                    if location:
-                        location_id = location[0]
-                    else:
+                    if not location_id:
                         location_id = str(uuid.uuid4())
                         cursor.execute(
                             """
                             INSERT INTO locations (
-                                location_id, name, description, type, created_at, updated_at
-                            ) VALUES (?, ?, ?, ?, ?, ?)
+                                location_id, name, description, type, rack_key, created_at, updated_at
+                            ) VALUES (?, ?, ?, ?, ?, ?, ?)
                             """,
                             (
                                 location_id,
                                 rack_location,
                                 f"Rack location imported from Excel",
                                 'Rack',
+                                rack_key(rack_location),
                                 datetime.datetime.now(),
                                 datetime.datetime.now()
                             )
                         )
+                        rack_ids[rack_key(rack_location)] = location_id
+                        metrics.count('locations_created')
+                resolve_time = time.perf_counter() - resolve_started
+                metrics.add_time('resolve', resolve_time)
                 
                 # Add inventory entry if quantity > 0 and location exists
                 if quantity > 0 and location_id:
@@ -267,23 +266,394 @@ def import_excel_data(excel_file=DEFAULT_EXCEL_FILE, user_id=None):
                             user_id
                         )
                     )
+                metrics.add_time('insert', time.perf_counter() - insert_started - resolve_time)
                 
-                conn.commit()
+                with metrics.phase('commit'):
+                    conn.commit()
                 imported_count += 1
-                print(f"  Successfully imported product: {product_name}")
+                metrics.debug(f"  Successfully imported product: {product_name}")
                 
             except Exception as e:
                 conn.rollback()
-                print(f"  Error importing product: {e}")
+                rack_ids = load_rack_ids(conn)  # Forget racks created by the rolled back row
+                metrics.count('failed')
+                metrics.info(f"  Error importing product {product_name}: {e}")
                 
         print(f"\nSuccessfully imported {imported_count} products.")
         conn.close()
+        metrics.finish(file=excel_file, mode=mode, imported=imported_count)
         return imported_count
         
+    except LayoutChanged as e:
+        print(f"Error: {e}")
+        print("Nothing was imported. Check the file, or run again with --relearn-layout if the new layout is expected.")
+        return 0
     except Exception as e:
         print(f"Error processing Excel file: {e}")
         return 0
 
+def get_import_category_id(conn):
+    """Return the id of the 'Office Supplies' category, creating it if it doesn't exist"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT category_id FROM categories WHERE name = 'Office Supplies'")
+    category = cursor.fetchone()
+    if category:
+        return category[0]
+    
+    print("Creating 'Office Supplies' category")
+    category_id = str(uuid.uuid4())
+    cursor.execute(
+        "INSERT INTO categories (category_id, name, description, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (category_id, 'Office Supplies', 'Imported office supplies from Excel', datetime.datetime.now(), datetime.datetime.now())
+    )
+    conn.commit()
+    return category_id
+
+def prepare_batch_rows(rows, columns):
+    """Yield (name, quantity, image_no, rack, remarks) tuples for every row that has a product name"""
+    name_col, qty_col, image_col, rack_col, remarks_col = columns
+    for row in rows:
+        product_name = cell_text(row.get(name_col))
+        if not product_name:
+            continue
+        yield (
+            product_name,
+            cell_number(row.get(qty_col)),
+            cell_text(row.get(image_col)),
+            cell_text(row.get(rack_col)),
+            cell_text(row.get(remarks_col)),
+        )
+
+def resolve_product_image(product_id, image_no):
+    """Copy the source image for image_no into the uploads folder (or render a placeholder)"""
+    if not image_no:
+        return None
+    image_file = find_image_file(image_no)
+    if not image_file:
+        return create_placeholder(image_no, style='label', uploads_folder=UPLOADS_FOLDER)
+    dest_path = os.path.join(UPLOADS_FOLDER, f"{product_id}.jpg")
+    try:
+        shutil.copy2(image_file, dest_path)
+    except Exception as e:
+        print(f"  Error copying image for {image_no}: {e}")
+        return None
+    return f"/uploads/products/{product_id}.jpg"
+
+def unique_sku(base, used_skus):
+    """Return base, or base with a -2, -3, ... suffix when another product already has it"""
+    sku = base
+    suffix = 1
+    while sku in used_skus:
+        suffix += 1
+        sku = f"{base}-{suffix}"
+    used_skus.add(sku)
+    return sku
+
+def _insert_rows_one_by_one(conn, product_rows, location_rows, inventory_rows, metrics):
+    """Insert a chunk that failed as a whole row by row, so one bad row only loses itself.
+
+    Returns (products imported, set of rack keys created).
+    """
+    cursor = conn.cursor()
+    created_racks = set()
+    for location_row in location_rows:
+        try:
+            cursor.execute(LOCATION_INSERT, location_row)
+            conn.commit()
+            created_racks.add(location_row[4])
+        except Exception as e:
+            conn.rollback()
+            metrics.info(f"  Error creating rack location {location_row[1]}: {e}")
+
+    inventory_by_product = {row[1]: row for row in inventory_rows}
+    imported = 0
+    for product_row in product_rows:
+        try:
+            cursor.execute(PRODUCT_INSERT, product_row)
+            if product_row[0] in inventory_by_product:
+                cursor.execute(INVENTORY_INSERT, inventory_by_product[product_row[0]])
+            conn.commit()
+            imported += 1
+        except Exception as e:
+            conn.rollback()
+            metrics.count('failed')
+            metrics.info(f"  Error importing product {product_row[1]}: {e}")
+    return imported, created_racks
+
+def import_rows_batch(conn, rows, columns, category_id, user_id, chunk_size=DEFAULT_CHUNK_SIZE, metrics=None):
+    """Insert products, rack locations and inventory with executemany.
+
+    rows is the record stream from read_sheet; only one chunk is held in
+    memory at a time. Rows are committed in chunks of chunk_size (a single
+    transaction when chunk_size is None). SKUs are made unique against the
+    database and the rows before them, and a chunk that still fails is
+    rolled back and inserted again row by row, so only the bad rows are lost.
+    """
+    metrics = metrics or quiet_metrics('import_rows_batch')
+    cursor = conn.cursor()
+    started = time.perf_counter()
+
+    # Load every existing rack once instead of querying per row; racks are
+    # matched on their canonical rack code ("R3 E1" == "R3E1")
+    ensure_rack_keys(conn)
+    conn.commit()
+    rack_ids = load_rack_ids(conn)
+    # SKUs are the first 8 letters and digits of the name, so different
+    # names often share one; later products get a -2, -3, ... suffix
+    used_skus = {sku for (sku,) in conn.execute("SELECT sku FROM products WHERE sku IS NOT NULL")}
+
+    if not chunk_size or chunk_size <= 0:
+        chunk_size = None
+
+    product_rows_iter = metrics.timed(prepare_batch_rows(rows, columns))
+    rows_read = 0
+    imported_count = 0
+    failed_count = 0
+    while True:
+        chunk = list(islice(product_rows_iter, chunk_size))
+        if not chunk:
+            break
+        start = rows_read
+        rows_read += len(chunk)
+        now = datetime.datetime.now()
+        product_rows = []
+        location_rows = []
+        inventory_rows = []
+        new_racks = {}
+
+        for product_name, quantity, image_no, rack_location, remarks in chunk:
+            product_id = str(uuid.uuid4())
+            sku = unique_sku(''.join(c for c in product_name if c.isalnum())[:8].upper(), used_skus)
+            with metrics.phase('image'):
+                image_path = resolve_product_image(product_id, image_no)
+            product_rows.append((
+                product_id, product_name, remarks or f"Imported from Excel: {product_name}", sku,
+                0.0, 0.0, category_id, image_path, now, now, user_id
+            ))
+            metrics.debug(f"Prepared product: {product_name} (quantity {quantity}, image {image_path}, "
+                          f"rack {rack_location})")
+
+            location_id = None
+            if rack_location:
+                with metrics.phase('resolve'):
+                    key = rack_key(rack_location)
+                    location_id = rack_ids.get(key) or new_racks.get(key)
+                    if not location_id:
+                        location_id = str(uuid.uuid4())
+                        new_racks[key] = location_id
+                        location_rows.append((
+                            location_id, rack_location, "Rack location imported from Excel", 'Rack', key, now, now
+                        ))
+
+            if quantity > 0 and location_id:
+                inventory_rows.append((str(uuid.uuid4()), product_id, location_id, quantity, now, now, user_id))
+            metrics.advance()
+
+        try:
+            with metrics.phase('insert'):
+                cursor.executemany(PRODUCT_INSERT, product_rows)
+                cursor.executemany(LOCATION_INSERT, location_rows)
+                cursor.executemany(INVENTORY_INSERT, inventory_rows)
+            with metrics.phase('commit'):
+                conn.commit()
+            rack_ids.update(new_racks)
+            imported_count += len(product_rows)
+            metrics.count('locations_created', len(location_rows))
+        except Exception as e:
+            conn.rollback()
+            metrics.info(f"  Error importing rows {start + 1}-{start + len(chunk)}: {e}; retrying them one by one")
+            with metrics.phase('insert'):
+                imported, created_racks = _insert_rows_one_by_one(conn, product_rows, location_rows,
+                                                                  inventory_rows, metrics)
+            rack_ids.update({key: location_id for key, location_id in new_racks.items() if key in created_racks})
+            imported_count += imported
+            failed_count += len(product_rows) - imported
+            metrics.count('locations_created', len(created_racks))
+
+    elapsed = time.perf_counter() - started
+    rate = imported_count / elapsed if elapsed > 0 else 0.0
+    print(f"\nBatch import report:")
+    print(f"  Rows read:         {rows_read}")
+    print(f"  Products imported: {imported_count}")
+    print(f"  Rows failed:       {failed_count}")
+    print(f"  Chunk size:        {chunk_size or 'single transaction'}")
+    print(f"  Elapsed:           {elapsed:.2f}s ({rate:.0f} rows/s)")
+    return imported_count
+
+def import_rows_incremental(conn, rows, columns, sr_col, sheet, category_id, user_id, sku_tag=None, metrics=None):
+    """Apply only the differences between the sheet and the previous incremental import.
+
+    rows yields (Excel row number, record) pairs and sheet is the key from
+    row_fingerprints.sheet_key. Each row is identified by its SR No (by
+    its row number when SR No is blank or repeated) and compared with the
+    stored fingerprint: new rows are inserted, changed
+    rows update their product and inventory entry, and rows that are gone
+    are retired by setting their stock to 0. Everything is written with
+    executemany in one transaction. sku_tag is added to new SKUs to keep
+    them unique when several workbooks share SR numbers. Returns the number
+    of rows changed.
+    """
+    metrics = metrics or quiet_metrics('import_rows_incremental')
+    cursor = conn.cursor()
+    started = time.perf_counter()
+
+    ensure_fingerprint_table(conn)
+    ensure_rack_keys(conn)
+    conn.commit()
+    rack_ids = load_rack_ids(conn)
+    known = load_fingerprints(conn, sheet)
+
+    name_col, qty_col, image_col, rack_col, remarks_col = columns
+    now = datetime.datetime.now()
+    seen = set()
+    unchanged_count = 0
+    product_inserts = []
+    product_updates = []
+    location_rows = []
+    inventory_inserts = []
+    inventory_updates = []
+    fingerprints = []
+
+    for row_number, row in metrics.timed(rows):
+        product_name = cell_text(row.get(name_col))
+        if not product_name:
+            continue
+        metrics.advance()
+        resolve_started = time.perf_counter()
+        values = (
+            product_name,
+            cell_number(row.get(qty_col)),
+            cell_text(row.get(image_col)),
+            cell_text(row.get(rack_col)),
+            cell_text(row.get(remarks_col)),
+        )
+        _, quantity, image_no, rack_location, remarks = values
+
+        sr_no = cell_text(row.get(sr_col)) if sr_col else None
+        row_key = sr_no if sr_no and sr_no not in seen else f"row:{row_number}"
+        seen.add(row_key)
+
+        row_hash = row_fingerprint(values)
+        previous = known.get(row_key)
+        if previous and previous['hash'] == row_hash and not previous['retired']:
+            unchanged_count += 1
+            metrics.add_time('resolve', time.perf_counter() - resolve_started)
+            continue
+
+        location_id = None
+        if rack_location:
+            key = rack_key(rack_location)
+            location_id = rack_ids.get(key)
+            if not location_id:
+                location_id = str(uuid.uuid4())
+                rack_ids[key] = location_id
+                location_rows.append((
+                    location_id, rack_location, "Rack location imported from Excel", 'Rack', key, now, now
+                ))
+        metrics.add_time('resolve', time.perf_counter() - resolve_started)
+
+        description = remarks or f"Imported from Excel: {product_name}"
+        if previous and previous['product_id']:
+            product_id = previous['product_id']
+            inventory_id = previous['inventory_id']
+            with metrics.phase('image'):
+                image_path = resolve_product_image(product_id, image_no)
+            metrics.debug(f"Updating row {row_key}: {product_name}")
+            product_updates.append((product_name, description, image_path, now, product_id))
+            if inventory_id:
+                # Stock without a rack stays where it was
+                inventory_updates.append((location_id, quantity, now, inventory_id))
+        else:
+            product_id = str(uuid.uuid4())
+            inventory_id = None
+            # SR No keeps the SKU unique where the same product name repeats
+            sku = ''.join(c for c in product_name if c.isalnum())[:8].upper()
+            if sku_tag:
+                sku = f"{sku}-{sku_tag}"
+            sku = f"{sku}-{''.join(c for c in row_key if c.isalnum()).upper()}"
+            with metrics.phase('image'):
+                image_path = resolve_product_image(product_id, image_no)
+            metrics.debug(f"Inserting row {row_key}: {product_name}")
+            product_inserts.append((
+                product_id, product_name, description, sku,
+                0.0, 0.0, category_id, image_path, now, now, user_id
+            ))
+
+        if not inventory_id and quantity > 0 and location_id:
+            inventory_id = str(uuid.uuid4())
+            inventory_inserts.append((inventory_id, product_id, location_id, quantity, now, now, user_id))
+
+        fingerprints.append((row_key, row_hash, product_id, inventory_id))
+
+    retired = [row_key for row_key, previous in known.items()
+               if row_key not in seen and not previous['retired']]
+    retired_inventory = [(now, known[row_key]['inventory_id']) for row_key in retired
+                         if known[row_key]['inventory_id']]
+
+    try:
+        with metrics.phase('insert'):
+            cursor.executemany(
+                """
+                INSERT INTO locations (
+                    location_id, name, description, type, rack_key, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                location_rows
+            )
+            cursor.executemany(
+                """
+                INSERT INTO products (
+                    product_id, name, description, sku, price, cost, 
+                    category_id, image_path, created_at, updated_at, created_by
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                product_inserts
+            )
+            cursor.executemany(
+                "UPDATE products SET name = ?, description = ?, image_path = ?, updated_at = ? WHERE product_id = ?",
+                product_updates
+            )
+            cursor.executemany(
+                """
+                UPDATE inventory SET location_id = COALESCE(?, location_id), quantity = ?, updated_at = ?
+                WHERE inventory_id = ?
+                """,
+                inventory_updates
+            )
+            cursor.executemany(
+                """
+                INSERT INTO inventory (
+                    inventory_id, product_id, location_id, quantity, 
+                    created_at, updated_at, created_by
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                inventory_inserts
+            )
+            cursor.executemany("UPDATE inventory SET quantity = 0, updated_at = ? WHERE inventory_id = ?",
+                               retired_inventory)
+            save_fingerprints(conn, sheet, fingerprints)
+            retire_fingerprints(conn, sheet, retired)
+        with metrics.phase('commit'):
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        metrics.info(f"  Error applying incremental import, nothing was changed: {e}")
+        return 0
+
+    metrics.count('unchanged', unchanged_count)
+    metrics.count('inserted', len(product_inserts))
+    metrics.count('updated', len(product_updates))
+    metrics.count('retired', len(retired))
+
+    elapsed = time.perf_counter() - started
+    print(f"\nIncremental import report ({sheet}):")
+    print(f"  Rows unchanged:    {unchanged_count}")
+    print(f"  Rows inserted:     {len(product_inserts)}")
+    print(f"  Rows updated:      {len(product_updates)}")
+    print(f"  Rows retired:      {len(retired)}")
+    print(f"  Elapsed:           {elapsed:.2f}s")
+    return len(product_inserts) + len(product_updates) + len(retired)
+
 def find_image_file(image_no):
     """Find an image file based on image_no in the IMAGES_FOLDER"""
     if not image_no:
@@ -292,70 +662,27 @@ def find_image_file(image_no):
     # Clean the image number
     image_no = image_no.strip()
     
-    # Check if IMAGES_FOLDER exists
+    # Check if IMAGES_FOLDER exists (reported once per run, not for every row)
     if not os.path.exists(IMAGES_FOLDER):
-        print(f"Images folder '{IMAGES_FOLDER}' not found.")
+        if IMAGES_FOLDER not in _reported_missing_folders:
+            _reported_missing_folders.add(IMAGES_FOLDER)
+            print(f"Images folder '{IMAGES_FOLDER}' not found.")
         return None
         
-    # Look for image files with the image number in the name
-    for root, _, files in os.walk(IMAGES_FOLDER):
-        for file in files:
-            if image_no.lower() in file.lower() and file.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                return os.path.join(root, file)
+    # Look up the image number in the folder index (built once per run)
+    image_file = find_image(get_image_index(IMAGES_FOLDER, IMAGE_INDEX_CACHE), image_no)
+    if image_file:
+        return image_file
                 
     # If not found in IMAGES_FOLDER, look in the current directory
+    current_dir_names = get_image_index('.', recursive=False)['by_name']
     for ext in ['.jpg', '.jpeg', '.png', '.gif']:
-        potential_file = f"{image_no}{ext}"
-        if os.path.exists(potential_file):
+        potential_file = current_dir_names.get(f"{image_no}{ext}".lower())
+        if potential_file:
             return potential_file
             
     return None
 
-def create_placeholder_image(image_no, output_path, width=400, height=300):
-    """Create a placeholder image with the image number as text"""
-    try:
-        # Generate a color based on the image number
-        if image_no:
-            # Use a hash of the image number to generate a color
-            hash_val = sum(ord(c) for c in image_no)
-            r = (hash_val * 13) % 200 + 55  # Keep colors not too dark (55-255)
-            g = (hash_val * 17) % 200 + 55
-            b = (hash_val * 19) % 200 + 55
-        else:
-            # Default color if no image number
-            r, g, b = 200, 200, 200
-            
-        # Create a new image with the generated color
-        img = Image.new('RGB', (width, height), color=(r, g, b))
-        draw = ImageDraw.Draw(img)
-        
-        # Add text
-        try:
-            # Try to use a font
-            font = ImageFont.load_default()
-            
-            # Draw the image number
-            text = f"Image: {image_no}" if image_no else "No Image"
-            text_width = draw.textlength(text, font=font)
-            text_position = ((width - text_width) // 2, height // 2)
-            
-            draw.text(
-                text_position,
-                text,
-                fill=(255, 255, 255),
-                font=font
-            )
-        except Exception as e:
-            print(f"Error adding text to placeholder image: {e}")
-            
-        # Save the image
-        img.save(output_path)
-        print(f"Created placeholder image: {output_path}")
-        return True
-    except Exception as e:
-        print(f"Error creating placeholder image: {e}")
-        return False
-
 def get_admin_user_id(cursor):
     """Get the admin user ID from the database"""
     cursor.execute("SELECT user_id FROM users WHERE role = 'admin' LIMIT 1")
@@ -366,11 +693,27 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Import Excel data into SQLite database')
     parser.add_argument('excel_file', nargs='?', help='Path to the Excel file', default=DEFAULT_EXCEL_FILE)
     parser.add_argument('user_id', nargs='?', help='User ID for the import operation', default=None)
+    parser.add_argument('--image-index-cache', default=IMAGE_INDEX_CACHE,
+                        help='JSON file used to cache the image folder index between runs')
+    parser.add_argument('--batch', action='store_true', help='Write rows with executemany in chunked transactions')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Rows per transaction in batch mode (default: one transaction)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only insert, update or retire rows that changed since the last incremental import')
+    parser.add_argument('--relearn-layout', action='store_true',
+                        help='Detect the column layout again instead of using the cached one')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+
+    with profiled('import_excel_data', args.profile, args.profile_top):
+        IMAGE_INDEX_CACHE = args.image_index_cache
     
-    # Print arguments for debugging
-    print(f"Excel file: {args.excel_file}")
-    print(f"User ID: {args.user_id}")
+        # Print arguments for debugging
+        print(f"Excel file: {args.excel_file}")
+        print(f"User ID: {args.user_id}")
     
-    # Run the import
-    import_excel_data(excel_file=args.excel_file, user_id=args.user_id)
\ No newline at end of file
+        # Run the import
+        import_excel_data(excel_file=args.excel_file, user_id=args.user_id,
+                          batch=args.batch, chunk_size=args.chunk_size, incremental=args.incremental,
+                          relearn_layout=args.relearn_layout, debug=args.debug, metrics_file=args.metrics_file)
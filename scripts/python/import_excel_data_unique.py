@@ -1,17 +1,25 @@
 import os
-import sqlite3
-import pandas as pd
+import time
 import uuid
 import shutil
-from PIL import Image, ImageDraw, ImageFont
+import argparse
+from excel_reader import cell_text
+from layout_cache import open_layout, PRODUCT_FIELDS
+from image_index import get_image_index, find_image
+from placeholder_images import create_placeholder
+from name_resolver import rack_resolver
+from import_metrics import RunMetrics, add_metrics_arguments
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
 
 # Configuration
 EXCEL_FILE = "PL- ARPER.xlsx"
-DB_FILE = "./data/inventory.db"
 IMAGES_FOLDER = "./images"
+IMAGE_INDEX_CACHE = None  # Optional JSON file to persist the image index between runs
 UPLOADS_FOLDER = "./uploads/products"
+FLUSH_ROWS = 1000  # Queued product rows written per executemany batch
 
-def import_excel_data():
+def import_excel_data(debug=False, metrics_file=None):
     """Import data from Excel file into SQLite database"""
     print(f"Importing data from Excel file: {EXCEL_FILE}")
     
@@ -28,35 +36,17 @@ def import_excel_data():
         os.makedirs(UPLOADS_FOLDER, exist_ok=True)
         print(f"Created uploads folder: {UPLOADS_FOLDER}")
     
+    metrics = RunMetrics('import_excel_data_unique', debug=debug, metrics_file=metrics_file)
     try:
-        # Read Excel file
-        df = pd.read_excel(EXCEL_FILE)
-        print(f"Read {len(df)} rows from Excel file")
+        # Stream the Excel file; the header row and columns come from the cached layout of its format
+        layout, rows = open_layout(EXCEL_FILE)
         
         # Print column names for debugging
-        print(f"Columns in Excel: {df.columns.tolist()}")
-        
-        # Sample data
-        print("\nSample data:")
-        print(df.head(5))
+        print(f"Header row: {layout['header_row']}{' (cached layout)' if layout['cached'] else ''}")
+        print(f"Columns in Excel: {layout['columns']}")
         
         # Identify the correct columns for product data
-        name_col = next((col for col in df.columns if 'DESCRIPTION' in str(col)), None)
-        qty_col = next((col for col in df.columns if 'QTY' in str(col)), None)
-        image_col = next((col for col in df.columns if 'IMAGE NO' in str(col)), None)
-        rack_col = next((col for col in df.columns if 'RACK' in str(col)), None)
-        remarks_col = next((col for col in df.columns if 'REMARKS' in str(col)), None)
-        
-        if not name_col:
-            name_col = 'Unnamed: 1'  # Fallback based on observation
-        if not qty_col:
-            qty_col = 'Unnamed: 2'   # Fallback based on observation
-        if not image_col:
-            image_col = 'Unnamed: 3' # Fallback based on observation
-        if not rack_col:
-            rack_col = 'Unnamed: 5' # Fallback based on observation
-        if not remarks_col:
-            remarks_col = 'Unnamed: 6' # Fallback based on observation
+        name_col, qty_col, image_col, rack_col, remarks_col = (layout['mapping'][field] for field in PRODUCT_FIELDS)
             
         print(f"\nUsing columns:")
         print(f"  Product Name: {name_col}")
@@ -67,7 +57,7 @@ def import_excel_data():
         
         # Connect to SQLite database
         print(f"\nConnecting to database: {DB_FILE}")
-        conn = sqlite3.connect(DB_FILE)
+        conn = connect(DB_FILE, profile='bulk')
         cursor = conn.cursor()
         
         # Create 'Office Supplies' category if it doesn't exist
@@ -102,6 +92,29 @@ def import_excel_data():
             conn.commit()
             print("Created 'Main Warehouse' location")
         
+        # Rack name -> id map, loaded once; new racks are inserted in batches
+        racks = rack_resolver(conn)
+        product_rows = []
+        inventory_rows = []
+        
+        def flush_rows():
+            """Write the queued racks, products and inventory entries (in that order)"""
+            racks.flush()
+            cursor.executemany(
+                """INSERT INTO products 
+                   (product_id, name, description, sku, price, cost, image_path, category_id) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                product_rows
+            )
+            cursor.executemany(
+                """INSERT INTO inventory 
+                   (inventory_id, product_id, location_id, quantity) 
+                   VALUES (?, ?, ?, ?)""",
+                inventory_rows
+            )
+            product_rows.clear()
+            inventory_rows.clear()
+        
         # Process each row in the Excel file
         products_added = 0
         products_updated = 0
@@ -109,30 +122,29 @@ def import_excel_data():
         # Keep track of duplicate product names
         product_name_count = {}
         
-        for _, row in df.iterrows():
+        for row in metrics.timed(rows):
             # Skip rows with no product name
-            if pd.isna(row[name_col]):
+            product_name = cell_text(row.get(name_col))
+            if not product_name:
                 continue
             
             # Generate a unique ID for this product
             product_id = str(uuid.uuid4())
             inventory_id = str(uuid.uuid4())
             
-            # Get product data
-            product_name = str(row[name_col]).strip()
-            
             # Skip the header row if it exists
             if product_name.lower() == 'description':
                 continue
-                
+            metrics.advance()
+            
             try:
-                quantity = int(row[qty_col])
+                quantity = int(row.get(qty_col))
             except (ValueError, TypeError):
                 quantity = 1  # Default quantity if invalid
                 
-            image_no = str(row[image_col]).strip() if not pd.isna(row[image_col]) else ''
-            rack_location = str(row[rack_col]).strip() if not pd.isna(row[rack_col]) else ''
-            description = str(row[remarks_col]).strip() if not pd.isna(row[remarks_col]) else ''
+            image_no = cell_text(row.get(image_col)) or ''
+            rack_location = cell_text(row.get(rack_col)) or ''
+            description = cell_text(row.get(remarks_col)) or ''
             
             # Handle duplicate product names by adding a suffix
             if product_name in product_name_count:
@@ -144,22 +156,26 @@ def import_excel_data():
             
             # Handle image file
             image_path = None
-            if image_no and not pd.isna(image_no):
-                # Look for the image file with this ID
-                source_image_path = find_image_file(image_no)
-                if source_image_path:
-                    # Copy and rename to the uploads folder
-                    image_filename = f"product_{product_id}{os.path.splitext(source_image_path)[1]}"
-                    destination_path = os.path.join(UPLOADS_FOLDER, image_filename)
-                    try:
-                        shutil.copy2(source_image_path, destination_path)
-                        print(f"Copied image: {source_image_path} -> {destination_path}")
-                        image_path = f"/uploads/products/{image_filename}"
-                    except Exception as e:
-                        print(f"Error copying image: {e}")
-                else:
-                    # Create a placeholder image with the image number
-                    image_path = create_placeholder_image(image_no, product_id)
+            if image_no:
+                with metrics.phase('image'):
+                    # Look for the image file with this ID
+                    source_image_path = find_image_file(image_no)
+                    if source_image_path:
+                        # Copy and rename to the uploads folder
+                        image_filename = f"product_{product_id}{os.path.splitext(source_image_path)[1]}"
+                        destination_path = os.path.join(UPLOADS_FOLDER, image_filename)
+                        try:
+                            shutil.copy2(source_image_path, destination_path)
+                            metrics.count('images_copied')
+                            metrics.debug(f"Copied image: {source_image_path} -> {destination_path}")
+                            image_path = f"/uploads/products/{image_filename}"
+                        except Exception as e:
+                            metrics.count('image_errors')
+                            metrics.info(f"Error copying image for {product_name}: {e}")
+                    else:
+                        # Use the shared placeholder for this image number
+                        image_path = create_placeholder(image_no, style='plain', uploads_folder=UPLOADS_FOLDER)
+                        metrics.count('placeholders')
             
             # Set fallback image path if still none
             if not image_path:
@@ -168,50 +184,34 @@ def import_excel_data():
             # Handle rack location - create or get rack location ID
             location_id = warehouse_id  # Default to main warehouse
             if rack_location and rack_location.strip():
-                # Check if this rack location exists
-                cursor.execute("SELECT location_id FROM locations WHERE name = ? AND type = 'Rack'", (rack_location,))
-                rack = cursor.fetchone()
-                if rack:
-                    location_id = rack[0]
-                else:
-                    # Create new rack location
-                    location_id = str(uuid.uuid4())
-                    cursor.execute(
-                        """INSERT INTO locations 
-                           (location_id, name, description, type) 
-                           VALUES (?, ?, ?, ?)""",
-                        (location_id, rack_location, f'Rack location {rack_location}', 'Rack')
-                    )
-                    conn.commit()
-                    print(f"Created rack location: {rack_location}")
+                with metrics.phase('resolve'):
+                    location_id = racks.get_or_create(rack_location, description=f'Rack location {rack_location}')
             
             # Generate a SKU
-            sku = f"ARPER-{products_added + 1:03d}-{int(pd.Timestamp.now().timestamp())}"
-            
-            # Insert new product
-            cursor.execute(
-                """INSERT INTO products 
-                   (product_id, name, description, sku, price, cost, image_path, category_id) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (product_id, product_name, description, sku, 0.0, 0.0, image_path, category_id)
-            )
+            sku = f"ARPER-{products_added + 1:03d}-{int(time.time())}"
             
-            # Insert inventory entry
-            cursor.execute(
-                """INSERT INTO inventory 
-                   (inventory_id, product_id, location_id, quantity) 
-                   VALUES (?, ?, ?, ?)""",
-                (inventory_id, product_id, location_id, quantity)
-            )
+            # Queue the product and its inventory entry
+            product_rows.append((product_id, product_name, description, sku, 0.0, 0.0, image_path, category_id))
+            inventory_rows.append((inventory_id, product_id, location_id, quantity))
+            if len(product_rows) >= FLUSH_ROWS:
+                with metrics.phase('insert'):
+                    flush_rows()
             
             products_added += 1
-            print(f"Added product: {product_name} (Rack: {rack_location}, Image: {image_no})")
+            metrics.debug(f"Added product: {product_name} (Rack: {rack_location}, Image: {image_no})")
             
-        conn.commit()
-        print(f"\nImport completed: {products_added} products added, {products_updated} products updated")
+        with metrics.phase('insert'):
+            flush_rows()
+        with metrics.phase('commit'):
+            conn.commit()
+        print(f"\nImport completed: {products_added} products added, {products_updated} products updated, "
+              f"{racks.created} rack locations created")
+        metrics.count('imported', products_added)
+        metrics.count('locations_created', racks.created)
+        metrics.finish(file=EXCEL_FILE)
         
     except Exception as e:
-        print(f"Error importing data: {e}")
+        metrics.info(f"Error importing data: {e}")
     finally:
         if 'conn' in locals():
             conn.close()
@@ -224,53 +224,14 @@ def find_image_file(image_no):
     # Clean the image number
     image_no = str(image_no).strip()
     
-    # Look for files with the image number in the name
-    for root, dirs, files in os.walk(IMAGES_FOLDER):
-        for file in files:
-            if image_no in file and file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                return os.path.join(root, file)
-    
-    # If not found, check if there's a file with this exact name
-    potential_files = [
-        os.path.join(IMAGES_FOLDER, f"{image_no}.png"),
-        os.path.join(IMAGES_FOLDER, f"{image_no}.jpg"),
-        os.path.join(IMAGES_FOLDER, f"{image_no}.jpeg")
-    ]
-    
-    for file in potential_files:
-        if os.path.exists(file):
-            return file
-    
-    return None
-
-def create_placeholder_image(text, product_id):
-    """Create a placeholder image with the given text"""
-    width, height = 400, 400
-    background_color = (240, 240, 240)
-    text_color = (100, 100, 100)
-    
-    # Create a new image with the given background color
-    image = Image.new('RGB', (width, height), background_color)
-    draw = ImageDraw.Draw(image)
-    
-    # Try to load a font, use default if not available
-    try:
-        font = ImageFont.truetype("arial.ttf", 40)
-    except IOError:
-        font = ImageFont.load_default()
-    
-    # Draw the text in the center of the image
-    text_width, text_height = draw.textsize(text, font=font) if hasattr(draw, 'textsize') else (200, 40)
-    position = ((width - text_width) // 2, (height - text_height) // 2)
-    draw.text(position, text, fill=text_color, font=font)
-    
-    # Save the image
-    filename = f"product_{product_id}.png"
-    filepath = os.path.join(UPLOADS_FOLDER, filename)
-    image.save(filepath)
-    
-    print(f"Created placeholder image: {filepath}")
-    return f"/uploads/products/{filename}"
+    # Look up the image number in the folder index (built once per run)
+    return find_image(get_image_index(IMAGES_FOLDER, IMAGE_INDEX_CACHE), image_no)
 
 if __name__ == "__main__":
-    import_excel_data()
+    parser = argparse.ArgumentParser(description='Import the Excel file as new products, renaming duplicate names')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('import_excel_data_unique', args.profile, args.profile_top):
+        import_excel_data(debug=args.debug, metrics_file=args.metrics_file)
@@ -0,0 +1,168 @@
+"""Progress and metrics of import and maintenance runs.
+
+The scripts used to print several lines per row, which on large sheets cost
+a noticeable share of the run time and gave nothing to monitor. A
+RunMetrics object keeps counters and per-phase timers (parse, resolve,
+image, insert, commit), shows one throttled progress line, and at the end
+writes a JSON summary of the run to data/metrics (or to the file named in
+IMPORT_METRICS_FILE). Per-row messages go through debug() and are only
+printed with --debug.
+"""
+import datetime
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from profiling import phase_started, phase_finished, active_report
+
+METRICS_FOLDER = "./data/metrics"
+METRICS_FILE_ENV = "IMPORT_METRICS_FILE"  # Set by import_benchmark to collect the summary of a run
+PROGRESS_INTERVAL = 0.5  # Seconds between progress updates on a terminal
+LOG_PROGRESS_INTERVAL = 10.0  # Seconds between progress lines when output goes to a file
+
+class RunMetrics:
+    """Counters, phase timers and the progress line of one run"""
+
+    def __init__(self, script, total=None, debug=False, metrics_file=None, progress=True):
+        self.script = script
+        self.total = total
+        self.debug_enabled = debug
+        # None: default file; False or '': no summary file
+        self.metrics_file = os.environ.get(METRICS_FILE_ENV) if metrics_file is None else metrics_file
+        if self.metrics_file is None:
+            stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+            self.metrics_file = os.path.join(METRICS_FOLDER, f"{script}-{stamp}-{os.getpid()}.json")
+        self.progress_enabled = progress
+        self.interactive = sys.stdout.isatty()
+        self.interval = PROGRESS_INTERVAL if self.interactive else LOG_PROGRESS_INTERVAL
+        self.started_at = datetime.datetime.now()
+        self.started = time.perf_counter()
+        self.last_progress = self.started
+        self.progress_shown = False
+        self.rows = 0
+        self.counters = {}
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block under a phase name"""
+        phase_started(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+            phase_finished(name)
+
+    def add_time(self, name, seconds, calls=1):
+        """Add time measured elsewhere (e.g. in a worker process) to a phase"""
+        phase = self.phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += calls
+
+    def timed(self, iterable, name='parse'):
+        """Yield from iterable, timing each step under a phase (for streamed rows)"""
+        iterator = iter(iterable)
+        while True:
+            phase_started(name)
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - started, 0)
+                return
+            finally:
+                phase_finished(name)
+            self.add_time(name, time.perf_counter() - started)
+            yield item
+
+    def count(self, name, amount=1):
+        """Increase a counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def advance(self, rows=1):
+        """Mark rows as processed and refresh the progress line at most once per interval"""
+        self.rows += rows
+        if not self.progress_enabled:
+            return
+        now = time.perf_counter()
+        if now - self.last_progress >= self.interval:
+            self.last_progress = now
+            self._show_progress(now)
+
+    def _show_progress(self, now):
+        elapsed = now - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            eta = (self.total - self.rows) / rate if rate > 0 else 0.0
+            line = f"{self.script}: {self.rows}/{self.total} rows ({self.rows / self.total:.0%}), {rate:.0f} rows/s, ETA {eta:.0f}s"
+        else:
+            line = f"{self.script}: {self.rows} rows, {rate:.0f} rows/s"
+        if self.interactive:
+            sys.stdout.write(f"\r{line:<79}")
+            sys.stdout.flush()
+            self.progress_shown = True
+        else:
+            print(line, flush=True)
+
+    def _clear_progress(self):
+        if self.progress_shown:
+            sys.stdout.write('\r' + ' ' * 79 + '\r')
+            self.progress_shown = False
+
+    def info(self, message):
+        """Print a message without mangling the progress line"""
+        self._clear_progress()
+        print(message)
+
+    def debug(self, message):
+        """Print a per-row message, only with --debug"""
+        if self.debug_enabled:
+            self.info(message)
+
+    def summary(self, **extra):
+        """Return the metrics of the run as a dict"""
+        elapsed = time.perf_counter() - self.started
+        return {
+            'script': self.script,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'elapsed': round(elapsed, 3),
+            'rows': self.rows,
+            'total': self.total,
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            'counters': dict(self.counters),
+            'phases': {name: {'seconds': round(seconds, 3), 'calls': calls}
+                       for name, (seconds, calls) in self.phases.items()},
+            'profile_report': active_report(),
+            **extra,
+        }
+
+    def finish(self, **extra):
+        """Print the phase times, write the JSON summary and return it"""
+        summary = self.summary(**extra)
+        self._clear_progress()
+        phases = ', '.join(f"{name} {phase['seconds']:.2f}s" for name, phase in summary['phases'].items())
+        print(f"{self.script}: {summary['rows']} rows in {summary['elapsed']:.2f}s"
+              f"{f' ({phases})' if phases else ''}")
+        if self.metrics_file:
+            try:
+                if os.path.dirname(self.metrics_file):
+                    os.makedirs(os.path.dirname(self.metrics_file), exist_ok=True)
+                with open(self.metrics_file, 'w', encoding='utf-8') as f:
+                    json.dump(summary, f, indent=1, default=str)
+                print(f"Metrics written to {self.metrics_file}")
+            except OSError as e:
+                print(f"Could not write metrics to {self.metrics_file}: {e}")
+        return summary
+
+def quiet_metrics(script):
+    """RunMetrics for functions called without one: no progress line and no summary file"""
+    return RunMetrics(script, progress=False, metrics_file=False)
+
+def add_metrics_arguments(parser):
+    """Add the --debug and --metrics-file options shared by the scripts"""
+    parser.add_argument('--debug', action='store_true', help='Print a message for every row')
+    parser.add_argument('--metrics-file', default=None,
+                        help=f'JSON file for the run metrics (default: a new file in {METRICS_FOLDER})')
+    return parser
@@ -0,0 +1,185 @@
+"""Import many packing-list workbooks in one run.
+
+Takes files, directories and glob patterns. Every sheet of every workbook is
+parsed in a pool of worker processes (openpyxl parsing is CPU bound). The
+parsed rows come back to this process, which is the only SQLite writer, and
+each sheet is applied as an incremental import as soon as it is ready. So
+parsing and writing overlap, and the database never has competing writers.
+Rows are tracked per workbook path and sheet, so running the pipeline again
+on the same files only writes what changed, and workbooks that share a file
+name in different folders do not touch each other's rows.
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from excel_reader import sheet_names
+from import_excel_data import get_import_category_id, get_admin_user_id, import_rows_incremental, create_uploads_folder
+from row_fingerprints import workbook_key, sheet_key, sheet_sku_tag, adopt_legacy_fingerprints
+from layout_cache import open_layout, LayoutChanged, PRODUCT_FIELDS
+from import_metrics import RunMetrics, add_metrics_arguments
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
+
+# Configuration
+WORKBOOK_PATTERNS = ('*.xlsx', '*.xlsm')
+DEFAULT_WORKERS = None  # Parse processes (None = one per CPU)
+
+def collect_workbooks(inputs):
+    """Expand files, directories and glob patterns into a sorted list of workbook paths"""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = [path for pattern in WORKBOOK_PATTERNS for path in glob.glob(os.path.join(item, pattern))]
+        elif os.path.isfile(item):
+            paths = [item]
+        else:
+            paths = glob.glob(item)
+            if not paths:
+                print(f"No workbooks match: {item}")
+        for path in paths:
+            if not os.path.basename(path).startswith('~$'):  # Lock files of workbooks open in Excel
+                found.add(os.path.abspath(path))
+    return sorted(found)
+
+def parse_sheet(job):
+    """Read one sheet into (row number, record) pairs holding only the product columns (runs in a worker)"""
+    excel_file, sheet = job
+    started = time.perf_counter()
+    result = {'file': excel_file, 'sheet': sheet, 'rows': [], 'skipped': None}
+    try:
+        layout, records = open_layout(excel_file, sheet_name=sheet, with_row_numbers=True)
+    except LayoutChanged as e:
+        # Caught before any row is read: the sheet is left out instead of imported with shifted columns
+        result['skipped'] = str(e)
+        result['parse_time'] = time.perf_counter() - started
+        return result
+    if 'name' in layout['fallbacks']:
+        records.close()
+        result['skipped'] = "no packing-list header"
+    else:
+        result['columns'] = tuple(layout['mapping'][field] for field in PRODUCT_FIELDS)
+        result['sr_col'] = layout['mapping']['sr']
+        # Only the needed cells are sent back to the writer
+        keep = [col for col in (*result['columns'], result['sr_col']) if col]
+        result['rows'] = [(row_number, {col: record.get(col) for col in keep}) for row_number, record in records]
+    result['parse_time'] = time.perf_counter() - started
+    return result
+
+def import_workbooks(inputs, user_id=None, workers=DEFAULT_WORKERS, debug=False, metrics_file=None):
+    """Parse every sheet of the given workbooks in parallel and apply them to the database.
+
+    Returns the per-file statistics.
+    """
+    workbooks = collect_workbooks(inputs)
+    if not workbooks:
+        print("No workbooks to import")
+        return {}
+    if not os.path.exists(DB_FILE):
+        print(f"Error: Database file '{DB_FILE}' not found.")
+        return {}
+    keys = {}
+    for path in workbooks:
+        keys.setdefault(workbook_key(path), []).append(path)
+    duplicates = [paths for paths in keys.values() if len(paths) > 1]
+    if duplicates:
+        print(f"Error: these workbooks would share their row fingerprints: {', '.join(duplicates[0])}")
+        return {}
+    # Fingerprints stored under the old file-name keys go to the first
+    # workbook of each name, so reruns always resolve them the same way
+    legacy_owners = {}
+    for path in workbooks:
+        legacy_owners.setdefault(os.path.basename(path), path)
+
+    conn = connect(DB_FILE, profile='bulk')
+    try:
+        category_id = get_import_category_id(conn)
+        user_id = user_id or get_admin_user_id(conn.cursor())
+        if not user_id:
+            print("Error: Could not find an admin user.")
+            return {}
+        create_uploads_folder()
+
+        print(f"Importing {len(workbooks)} workbooks with {workers or os.cpu_count()} parse workers")
+        metrics = RunMetrics('import_pipeline', debug=debug, metrics_file=metrics_file)
+        stats = {path: {'sheets': 0, 'rows': 0, 'changed': 0, 'failed': 0, 'parse_time': 0.0, 'write_time': 0.0}
+                 for path in workbooks}
+        started = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Sheet listings come first; each finished listing queues one parse job per sheet
+            pending = {pool.submit(sheet_names, path): (path, None) for path in workbooks}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, sheet = pending.pop(future)
+                    file_stats = stats[path]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Error reading {sheet_key(path, sheet) if sheet else path}: {e}")
+                        file_stats['failed'] += 1
+                        continue
+
+                    if sheet is None:
+                        for name in result:
+                            pending[pool.submit(parse_sheet, (path, name))] = (path, name)
+                        continue
+
+                    file_stats['parse_time'] += result['parse_time']
+                    metrics.add_time('parse', result['parse_time'])
+                    key = sheet_key(path, sheet)
+                    if result['skipped']:
+                        print(f"Skipping {key}: {result['skipped']}")
+                        continue
+
+                    write_started = time.perf_counter()
+                    if legacy_owners[os.path.basename(path)] == path and adopt_legacy_fingerprints(conn, path, sheet):
+                        print(f"Moved the fingerprints of {os.path.basename(path)}:{sheet} to {key}")
+                    sku_tag = sheet_sku_tag(key)
+                    changed = import_rows_incremental(conn, result['rows'], result['columns'], result['sr_col'],
+                                                      key, category_id, user_id, sku_tag=sku_tag, metrics=metrics)
+                    file_stats['write_time'] += time.perf_counter() - write_started
+                    file_stats['sheets'] += 1
+                    file_stats['rows'] += len(result['rows'])
+                    file_stats['changed'] += changed
+
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    print_report(stats, elapsed)
+    metrics.finish(workbooks=len(workbooks), changed=sum(file_stats['changed'] for file_stats in stats.values()))
+    return stats
+
+def print_report(stats, elapsed):
+    """Print rows and throughput per workbook and for the whole run"""
+    print(f"\nPipeline report:")
+    print(f"  {'Workbook':<40} {'Sheets':>6} {'Rows':>8} {'Changed':>8} {'Parse s':>8} {'Write s':>8} {'Rows/s':>8}")
+    for path, file_stats in stats.items():
+        busy = file_stats['parse_time'] + file_stats['write_time']
+        rate = file_stats['rows'] / busy if busy > 0 else 0.0
+        name = os.path.relpath(path)  # Workbooks in different folders may share a file name
+        if file_stats['failed']:
+            name += f" ({file_stats['failed']} failed)"
+        print(f"  {name[:40]:<40} {file_stats['sheets']:>6} {file_stats['rows']:>8} {file_stats['changed']:>8} "
+              f"{file_stats['parse_time']:>8.2f} {file_stats['write_time']:>8.2f} {rate:>8.0f}")
+    rows = sum(file_stats['rows'] for file_stats in stats.values())
+    changed = sum(file_stats['changed'] for file_stats in stats.values())
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"  Total: {len(stats)} workbooks, {rows} rows, {changed} changed in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import a batch of packing-list workbooks in parallel')
+    parser.add_argument('inputs', nargs='+', help='Workbook files, directories or glob patterns')
+    parser.add_argument('--user-id', default=None, help='User ID for the import (default: first admin)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Worker processes parsing sheets (default: one per CPU)')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('import_pipeline', args.profile, args.profile_top):
+        import_workbooks(args.inputs, user_id=args.user_id, workers=args.workers, debug=args.debug,
+                         metrics_file=args.metrics_file)
@@ -1,16 +1,17 @@
 import os
-import sqlite3
-import requests
 import random
-import shutil
-import glob
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
+from image_index import get_image_index, find_image
+from image_store import store_image_file
+from image_audit import scan_uploads, uploads_name
+from image_downloader import download_images, DEFAULT_WORKERS
+from placeholder_images import create_placeholder
+from db_connection import DB_FILE, connect
+from profiling import profile_from_argv
 
 # Configuration
-DB_FILE = "./arper_inventory.db"  # Main database file
 UPLOADS_FOLDER = "uploads/products"
 EXCEL_IMAGES_FOLDER = "PL- ARPER_files"  # Folder containing the Excel images
+DOWNLOAD_WORKERS = DEFAULT_WORKERS  # Concurrent image downloads
 IMAGE_SOURCES = [
     # More reliable furniture image sources
     "https://images.pexels.com/photos/1350789/pexels-photo-1350789.jpeg",  # Office chair
@@ -50,114 +51,17 @@ def ensure_uploads_folder():
         os.makedirs(UPLOADS_FOLDER, exist_ok=True)
         print(f"Created directory: {UPLOADS_FOLDER}")
 
-def create_color_image(product_name, save_path, width=400, height=300):
-    """Create a colored image with product text when no real image is available"""
-    # Generate a color based on the product name
-    name_hash = sum(ord(c) for c in product_name)
-    r = (name_hash * 33) % 200 + 55  # Keep colors not too dark (55-255)
-    g = (name_hash * 89) % 200 + 55
-    b = (name_hash * 144) % 200 + 55
-    
-    # Create image
-    img = Image.new('RGB', (width, height), color=(r, g, b))
-    draw = ImageDraw.Draw(img)
-    
-    # Add text
-    try:
-        # Try to use a default font
-        font = ImageFont.truetype("arial.ttf", 20)
-    except IOError:
-        font = ImageFont.load_default()
-    
-    # Draw product name (wrapped to fit)
-    words = product_name.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        # Estimate text width
-        text_width = len(test_line) * 10  # Rough estimate
-        
-        if text_width <= width - 40:  # Leave margin
-            current_line.append(word)
-        else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
-    
-    # Draw text lines
-    y_position = (height - len(lines) * 24) // 2
-    for line in lines:
-        # Center text
-        text_width = len(line) * 10  # Approximate width
-        x_position = (width - text_width) // 2
-        draw.text((x_position, y_position), line, fill=(255, 255, 255), font=font)
-        y_position += 24
-    
-    # Save image
-    img.save(save_path)
-    print(f"Created color image for {product_name}: {save_path}")
-    return True
-
 def find_existing_image(image_no):
-    """Find an image file using more robust search methods"""
-    image_paths = []
-    
-    # Check in the EXCEL_IMAGES_FOLDER first
-    if os.path.exists(EXCEL_IMAGES_FOLDER):
-        # Try direct match
-        direct_matches = glob.glob(os.path.join(EXCEL_IMAGES_FOLDER, f"*{image_no}*.*"))
-        if direct_matches:
-            image_paths.extend(direct_matches)
-        
-        # Try case-insensitive match
-        for file in os.listdir(EXCEL_IMAGES_FOLDER):
-            if image_no.lower() in file.lower() and os.path.join(EXCEL_IMAGES_FOLDER, file) not in image_paths:
-                image_paths.append(os.path.join(EXCEL_IMAGES_FOLDER, file))
-    
-    # Check in the current directory
-    direct_matches = glob.glob(f"*{image_no}*.*")
-    if direct_matches:
-        image_paths.extend(direct_matches)
-    
-    # Look for any supported image extensions
-    for ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-        # Check with exact name
-        exact_path = f"{image_no}{ext}"
-        if os.path.exists(exact_path) and exact_path not in image_paths:
-            image_paths.append(exact_path)
-        
-        # Check with case-insensitive match in current directory
-        for file in os.listdir('.'):
-            if file.lower().endswith(ext) and image_no.lower() in file.lower() and file not in image_paths:
-                image_paths.append(file)
-    
-    # If we found images, return the first one
-    if image_paths:
-        print(f"Found image for {image_no}: {image_paths[0]}")
-        return image_paths[0]
+    """Find an image file using the prebuilt image indexes"""
+    # Check in the EXCEL_IMAGES_FOLDER first, then in the current directory
+    for folder in (EXCEL_IMAGES_FOLDER, '.'):
+        image_path = find_image(get_image_index(folder, recursive=False), image_no)
+        if image_path:
+            print(f"Found image for {image_no}: {image_path}")
+            return image_path
     
     return None
 
-def download_image(url, save_path, product_name):
-    """Download an image from URL and save it to the specified path"""
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        img = Image.open(BytesIO(response.content))
-        img.save(save_path)
-        print(f"Downloaded image to {save_path}")
-        return True
-    except Exception as e:
-        print(f"Error downloading image {url}: {e}")
-        # Create a colored placeholder instead
-        return create_color_image(product_name, save_path)
-
 def assign_product_images():
     """Assign images to products in the database"""
     ensure_uploads_folder()
@@ -168,7 +72,7 @@ def assign_product_images():
         return
     
     # Connect to SQLite database
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cursor = conn.cursor()
     
     # Check if the products table exists
@@ -188,8 +92,13 @@ def assign_product_images():
     products = cursor.fetchall()
     print(f"Found {len(products)} products in database")
     
-    # Process each product
+    # List the uploads folder once to check the existing image paths against
+    uploaded_files = scan_uploads(UPLOADS_FOLDER)
+    
+    # Process each product; downloads are only queued here and fetched
+    # concurrently once every URL is known
     updated_count = 0
+    pending_downloads = []
     for product in products:
         product_id = product[0]
         product_name = product[1]
@@ -204,39 +113,16 @@ def assign_product_images():
                 print(f"Converting image path for {product_name}: {current_image} -> {image_path}")
                 
                 # Try to find the physical image for this name and copy it to uploads folder
-                image_file = None
-                
-                # Look in the Excel images folder first
-                if os.path.exists(EXCEL_IMAGES_FOLDER):
-                    for file in os.listdir(EXCEL_IMAGES_FOLDER):
-                        if current_image in file:
-                            image_file = os.path.join(EXCEL_IMAGES_FOLDER, file)
-                            break
-                
-                # Look in current directory
-                if not image_file:
-                    for file in os.listdir('.'):
-                        if os.path.isfile(file) and current_image in file:
-                            image_file = file
-                            break
+                # (Excel images folder first, then the current directory)
+                image_file = find_existing_image(current_image)
                 
-                # If image found, copy it to uploads folder
+                # If image found, store it in the uploads folder (once per distinct picture)
                 if image_file:
-                    # Ensure uploads folder exists
-                    ensure_uploads_folder()
-                    
-                    # Create target filename
-                    file_ext = os.path.splitext(image_file)[1] or '.jpg'
-                    target_filename = f"{current_image}{file_ext}"
-                    target_path = os.path.join(UPLOADS_FOLDER, target_filename)
-                    
                     try:
-                        # Copy the file
-                        shutil.copy2(image_file, target_path)
-                        print(f"Copied image: {image_file} -> {target_path}")
+                        image_path = store_image_file(image_file, UPLOADS_FOLDER)
+                        print(f"Stored image: {image_file} -> {image_path}")
                         
                         # Update database with proper path
-                        image_path = f"/uploads/products/{target_filename}"
                         cursor.execute(
                             "UPDATE products SET image_path = ? WHERE product_id = ?",
                             (image_path, product_id)
@@ -251,7 +137,9 @@ def assign_product_images():
                 # Image already has a proper path - check if it points to a real file
                 if current_image and current_image.startswith('/uploads/'):
                     physical_path = current_image[1:]  # Remove leading slash
-                    if not os.path.exists(physical_path):
+                    name = uploads_name(current_image)
+                    exists = name in uploaded_files if name else os.path.exists(physical_path)
+                    if not exists:
                         print(f"Warning: Image {current_image} referenced in database does not exist at {physical_path}")
                         # Could add logic here to create/download the image
         else:
@@ -277,24 +165,19 @@ def assign_product_images():
             category_images = image_sources.get(category, IMAGE_SOURCES)
             if category_images:
                 image_url = random.choice(category_images)
-                
-                # Generate filename
-                file_ext = os.path.splitext(image_url.split('/')[-1])[1]
-                if not file_ext:
-                    file_ext = ".jpg"  # Default to jpg if no extension found
-                    
-                image_filename = f"product_{product_id}{file_ext}"
-                image_path_full = os.path.join(UPLOADS_FOLDER, image_filename)
-                
-                # Download the image or create placeholder
-                if download_image(image_url, image_path_full, product_name):
-                    image_path = f"/uploads/products/{image_filename}"
-                    cursor.execute(
-                        "UPDATE products SET image_path = ? WHERE product_id = ?",
-                        (image_path, product_id)
-                    )
-                    updated_count += 1
-                    print(f"Downloaded image for {product_name}: {image_path}")
+                pending_downloads.append((product_id, product_name, image_url))
+    
+    # Download each distinct URL once; failed downloads fall back to a colored placeholder
+    downloaded = download_images([url for _, _, url in pending_downloads], UPLOADS_FOLDER, DOWNLOAD_WORKERS)
+    for product_id, product_name, image_url in pending_downloads:
+        image_path = downloaded.get(image_url) or create_placeholder(
+            product_name or '', style='color', uploads_folder=UPLOADS_FOLDER)
+        cursor.execute(
+            "UPDATE products SET image_path = ? WHERE product_id = ?",
+            (image_path, product_id)
+        )
+        updated_count += 1
+        print(f"Assigned image for {product_name}: {image_path}")
     
     # Commit changes and close connection
     conn.commit()
@@ -303,4 +186,5 @@ def assign_product_images():
     print(f"\nSuccessfully updated {updated_count} products with images.")
 
 if __name__ == "__main__":
-    assign_product_images() 
\ No newline at end of file
+    with profile_from_argv('import_product_images'):
+        assign_product_images()
@@ -0,0 +1,161 @@
+"""Column layouts of packing-list sheets, detected once per supplier format.
+
+The importers used to find the header row and the product columns of every
+sheet themselves ('DESCRIPTION' in col, with fallbacks like 'Unnamed: 1').
+open_layout() does this once per format. It stores the header offset, a
+fingerprint of the header cells and the resolved field -> column mapping in
+a JSON sidecar, under a key made from the file name (digits removed, so
+weekly lists of the same supplier share it) and the sheet name.
+
+The next import of that format reads the header at the cached offset
+directly. If the cells there no longer match the fingerprint, LayoutChanged
+is raised before any data row is read, so nothing is written with shifted
+columns.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import zipfile
+from excel_reader import read_sheet, HEADER_SCAN_ROWS
+from xlsx_media import active_sheet_name
+from profiling import profiled, add_profile_arguments
+
+LAYOUT_CACHE = "./data/column_layouts.json"
+
+# (field, how the header cell is matched, marker, column used when no header matches)
+FIELD_RULES = (
+    ('name', 'contains', 'DESCRIPTION', 'Unnamed: 1'),
+    ('quantity', 'contains', 'QTY', 'Unnamed: 2'),
+    ('image_no', 'contains', 'IMAGE NO', 'Unnamed: 3'),
+    ('image', 'equals', 'IMAGE', 'Unnamed: 4'),
+    ('rack', 'contains', 'RACK', 'Unnamed: 5'),
+    ('remarks', 'contains', 'REMARKS', 'Unnamed: 6'),
+    ('sr', 'prefix', 'SR', None),
+)
+# Fields the importers read, in the order they unpack them
+PRODUCT_FIELDS = ('name', 'quantity', 'image_no', 'rack', 'remarks')
+
+class LayoutChanged(Exception):
+    """The header of a sheet no longer matches the cached layout of its format"""
+
+def _matches(column, how, marker):
+    if how == 'equals':
+        return column == marker
+    if how == 'prefix':
+        return column.upper().startswith(marker)
+    return marker in column
+
+def detect_mapping(columns):
+    """Resolve every field to a column; returns (mapping, fields that fell back to a default)"""
+    mapping = {}
+    fallbacks = []
+    for field, how, marker, default in FIELD_RULES:
+        column = next((col for col in columns if _matches(col, how, marker)), None)
+        if column is None:
+            column = default
+            fallbacks.append(field)
+        mapping[field] = column
+    return mapping, fallbacks
+
+def header_fingerprint(columns):
+    """Hash the cleaned header cells of a sheet"""
+    return hashlib.sha1(json.dumps(list(columns)).encode('utf-8')).hexdigest()
+
+def layout_key(excel_file, sheet_name):
+    """Key of a workbook's format: file name without digits and extension, plus the sheet name"""
+    stem = os.path.splitext(os.path.basename(excel_file))[0].lower()
+    stem = re.sub(r'[\d_.\-\s]+', ' ', stem).strip()
+    return f"{stem}:{sheet_name}"
+
+def load_layouts(cache_file=LAYOUT_CACHE):
+    """Load the cached layouts, or an empty dict"""
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable layout cache {cache_file}: {e}")
+        return {}
+
+def save_layout(key, layout, cache_file=LAYOUT_CACHE):
+    """Store one layout, re-reading the file first so layouts saved meanwhile are kept"""
+    if not cache_file:
+        return
+    if os.path.dirname(cache_file):
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    layouts = load_layouts(cache_file)
+    layouts[key] = layout
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(layouts, f, indent=1, sort_keys=True)
+    os.replace(temp_file, cache_file)
+
+def open_layout(excel_file, sheet_name=None, key=None, cache_file=LAYOUT_CACHE, relearn=False,
+                scan_rows=HEADER_SCAN_ROWS, with_row_numbers=False):
+    """Open a sheet for streaming with its column layout.
+
+    Returns (layout, rows). layout is a dict with the sheet name, header
+    offset, columns, field -> column mapping, the fields that fell back to
+    defaults and whether it came from the cache. rows is read_sheet's record
+    generator. Raises LayoutChanged when the header differs from the cached
+    layout of the format; relearn detects and caches the layout again.
+    """
+    if sheet_name is None:
+        with zipfile.ZipFile(excel_file) as archive:
+            sheet_name = active_sheet_name(archive)
+    key = key or layout_key(excel_file, sheet_name)
+    cached = None if relearn else load_layouts(cache_file).get(key)
+
+    if cached:
+        columns, header_row, rows = read_sheet(excel_file, sheet_name=sheet_name, header_row=cached['header_row'],
+                                               with_row_numbers=with_row_numbers)
+        if header_fingerprint(columns) != cached['fingerprint']:
+            rows.close()
+            raise LayoutChanged(
+                f"Layout of '{os.path.basename(excel_file)}' ({sheet_name}) differs from the cached layout '{key}': "
+                f"expected columns {cached['columns']} in row {cached['header_row'] + 1}, found {columns}"
+            )
+        return {'key': key, 'sheet': sheet_name, 'header_row': header_row, 'columns': columns,
+                'mapping': cached['mapping'], 'fallbacks': cached.get('fallbacks', []), 'cached': True}, rows
+
+    columns, header_row, rows = read_sheet(excel_file, sheet_name=sheet_name, scan_rows=scan_rows,
+                                           with_row_numbers=with_row_numbers)
+    mapping, fallbacks = detect_mapping(columns)
+    layout = {'key': key, 'sheet': sheet_name, 'header_row': header_row, 'columns': columns,
+              'mapping': mapping, 'fallbacks': fallbacks, 'cached': False}
+    # Only formats whose header was recognised are worth remembering
+    if 'name' not in fallbacks:
+        save_layout(key, {
+            'header_row': header_row,
+            'fingerprint': header_fingerprint(columns),
+            'columns': columns,
+            'mapping': mapping,
+            'fallbacks': fallbacks,
+            'updated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }, cache_file)
+    return layout, rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='List or forget cached packing-list layouts')
+    parser.add_argument('--forget', metavar='KEY', help='Remove a cached layout so it is detected again')
+    parser.add_argument('--cache-file', default=LAYOUT_CACHE, help='Layout cache file')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('layout_cache', args.profile, args.profile_top):
+        layouts = load_layouts(args.cache_file)
+        if args.forget:
+            if layouts.pop(args.forget, None) is None:
+                print(f"No cached layout '{args.forget}'")
+            else:
+                with open(args.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(layouts, f, indent=1, sort_keys=True)
+                print(f"Forgot layout '{args.forget}'")
+        else:
+            for key, layout in sorted(layouts.items()):
+                print(f"{key}: header row {layout['header_row'] + 1}, "
+                      f"{', '.join(f'{field}={column}' for field, column in layout['mapping'].items())}")
@@ -0,0 +1,84 @@
+"""In-memory name -> id resolution for the import scripts.
+
+The importers used to run a SELECT for every row to find the rack location
+or product by name, and committed right after creating each new rack.
+A NameResolver loads the name -> id map of a table once. Names it has not
+seen get a new id straight away; the rows for them are queued and written
+with one executemany when flush() is called, inside the caller's
+transaction.
+"""
+import uuid
+from rack_codes import rack_key, ensure_rack_keys
+
+class NameResolver:
+    """Resolve names of one table (optionally restricted by fixed column values) to ids"""
+
+    def __init__(self, conn, table, id_column, fixed=None, key=None, key_column=None):
+        self.conn = conn
+        self.table = table
+        self.id_column = id_column
+        self.fixed = dict(fixed or {})  # e.g. {'type': 'Rack'}: rows must match, new rows get these values
+        self.key = key or (lambda name: name)  # Names with the same key resolve to the same row
+        self.key_column = key_column  # Column new rows store their key in
+        self.pending = []
+        self.created = 0
+
+        where = ' AND '.join(f"{column} = ?" for column in self.fixed) or '1'
+        rows = conn.execute(
+            f"SELECT name, {id_column} FROM {table} WHERE {where} ORDER BY rowid",
+            tuple(self.fixed.values())
+        )
+        # Keep the oldest row when a name occurs more than once
+        self.ids = {}
+        for name, row_id in rows:
+            self.ids.setdefault(self.key(name), row_id)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, name):
+        """Return the id for name, or None if there is no such row"""
+        return self.ids.get(self.key(name))
+
+    def get_or_create(self, name, **values):
+        """Return the id for name, queueing a new row (with values) if it does not exist yet"""
+        key = self.key(name)
+        row_id = self.ids.get(key)
+        if row_id is None:
+            row_id = str(uuid.uuid4())
+            self.ids[key] = row_id
+            row = {self.id_column: row_id, 'name': name, **self.fixed, **values}
+            if self.key_column:
+                row[self.key_column] = key
+            self.pending.append(row)
+            self.created += 1
+        return row_id
+
+    def flush(self):
+        """Insert the queued rows; returns how many were written. The caller commits."""
+        if not self.pending:
+            return 0
+        # Rows created with the same columns are inserted with one statement
+        groups = {}
+        for row in self.pending:
+            groups.setdefault(tuple(row), []).append(tuple(row.values()))
+        for columns, rows in groups.items():
+            self.conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows
+            )
+        written = len(self.pending)
+        self.pending = []
+        return written
+
+def rack_resolver(conn):
+    """Resolver for rack locations (locations with type 'Rack'), matched on their canonical rack code.
+
+    Makes sure the locations.rack_key column and its unique index exist first.
+    """
+    ensure_rack_keys(conn)
+    return NameResolver(conn, 'locations', 'location_id', {'type': 'Rack'}, key=rack_key, key_column='rack_key')
+
+def product_resolver(conn):
+    """Resolver for products by name"""
+    return NameResolver(conn, 'products', 'product_id')
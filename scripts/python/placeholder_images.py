@@ -0,0 +1,175 @@
+"""Shared placeholder image renderer.
+
+Placeholders are keyed by a hash of (text, style, size): the same text is
+rendered once and every product that needs it points at the same
+placeholder_<key>.png in the uploads folder. Files that already exist are
+never rendered again, fonts are loaded once per process, and
+create_placeholders renders a whole batch in a process pool.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+UPLOADS_FOLDER = "uploads/products"
+URL_PREFIX = "/uploads/products"
+# Bump when the drawing code changes so cached placeholders are re-rendered
+RENDER_VERSION = 1
+
+# Placeholder looks used by the scripts. background is an RGB tuple, or a
+# tuple of multipliers for a colour derived from the text.
+STYLES = {
+    # Grey card with the text in large type (import_excel_data_unique, create_placeholder_images)
+    'plain': {
+        'size': (400, 400),
+        'background': (240, 240, 240),
+        'text_color': (100, 100, 100),
+        'font': ('arial.ttf', 40),
+        'max_chars': 20,
+        'wrap': False,
+    },
+    # Colour derived from the product name with the name wrapped in white (image fix scripts)
+    'color': {
+        'size': (400, 300),
+        'background': ('hash', 33, 89, 144),
+        'text_color': (255, 255, 255),
+        'font': ('arial.ttf', 20),
+        'max_chars': 50,
+        'wrap': True,
+    },
+    # Colour derived from the image number, labelled "Image: <no>" (import_excel_data)
+    'label': {
+        'size': (400, 300),
+        'background': ('hash', 13, 17, 19),
+        'text_color': (255, 255, 255),
+        'font': None,
+        'template': "Image: {}",
+        'max_chars': 50,
+        'wrap': False,
+    },
+    # Light grey square with the product name in black (fix_image_paths)
+    'caption': {
+        'size': (300, 300),
+        'background': (200, 200, 200),
+        'text_color': (0, 0, 0),
+        'font': ('arial.ttf', 20),
+        'max_chars': 30,
+        'wrap': False,
+    },
+}
+
+# Image paths of placeholders already created in this process, keyed by file name
+_created = {}
+
+@lru_cache(maxsize=None)
+def load_font(name=None, size=None):
+    """Load a TrueType font once per process, falling back to PIL's default font"""
+    if name:
+        try:
+            return ImageFont.truetype(name, size)
+        except IOError:
+            pass
+    return ImageFont.load_default()
+
+def placeholder_key(text, style='plain', size=None):
+    """Return the cache key of a placeholder rendering"""
+    size = tuple(size or STYLES[style]['size'])
+    raw = f"{RENDER_VERSION}|{style}|{size[0]}x{size[1]}|{text or ''}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+def placeholder_filename(text, style='plain', size=None):
+    """Return the file name a placeholder is stored under"""
+    return f"placeholder_{placeholder_key(text, style, size)}.png"
+
+def _background(spec, text):
+    """Resolve a style background to an RGB tuple"""
+    if spec[0] != 'hash':
+        return spec
+    hash_val = sum(ord(c) for c in text)
+    return tuple((hash_val * factor) % 200 + 55 for factor in spec[1:])  # Keep colors not too dark (55-255)
+
+def _lines(text, style_spec, draw, font, width):
+    """Split the text into the lines to draw"""
+    text = text[:style_spec['max_chars']]
+    if not style_spec['wrap']:
+        return [text]
+    lines = []
+    current_line = []
+    for word in text.split():
+        test_line = ' '.join(current_line + [word])
+        if draw.textlength(test_line, font=font) <= width - 40 or not current_line:  # Leave margin
+            current_line.append(word)
+        else:
+            lines.append(' '.join(current_line))
+            current_line = [word]
+    if current_line:
+        lines.append(' '.join(current_line))
+    return lines
+
+def render_placeholder(text, style='plain', size=None):
+    """Render a placeholder image and return it as a PIL image"""
+    style_spec = STYLES[style]
+    width, height = size or style_spec['size']
+    text = text or ''
+    label = style_spec.get('template', "{}").format(text) if text else "No Image"
+
+    image = Image.new('RGB', (width, height), _background(style_spec['background'], text))
+    draw = ImageDraw.Draw(image)
+    font = load_font(*(style_spec['font'] or (None, None)))
+
+    lines = _lines(label, style_spec, draw, font, width)
+    line_height = max(draw.textbbox((0, 0), "Ag", font=font)[3], 1) + 4
+    y_position = (height - len(lines) * line_height) // 2
+    for line in lines:
+        text_width = draw.textlength(line, font=font)
+        draw.text(((width - text_width) // 2, y_position), line, fill=style_spec['text_color'], font=font)
+        y_position += line_height
+    return image
+
+def _render_to_file(job):
+    """Render one placeholder to its file (runs in a worker process for batches)"""
+    text, style, size, target_path = job
+    temp_path = f"{target_path}.{os.getpid()}.tmp"
+    render_placeholder(text, style, size).save(temp_path, format='PNG')
+    os.replace(temp_path, target_path)
+    return target_path
+
+def create_placeholder(text, style='plain', size=None, uploads_folder=UPLOADS_FOLDER):
+    """Return the image path of the placeholder for text, rendering it only if it does not exist yet"""
+    filename = placeholder_filename(text, style, size)
+    if filename not in _created:
+        target_path = os.path.join(uploads_folder, filename)
+        if not os.path.exists(target_path):
+            os.makedirs(uploads_folder, exist_ok=True)
+            _render_to_file((text, style, size, target_path))
+        _created[filename] = f"{URL_PREFIX}/{filename}"
+    return _created[filename]
+
+def create_placeholders(texts, style='plain', size=None, uploads_folder=UPLOADS_FOLDER, workers=None):
+    """Create placeholders for many texts and return their image paths in the same order.
+
+    Each distinct text is rendered at most once, existing files are skipped,
+    and the remaining renders are spread over a process pool of workers.
+    """
+    os.makedirs(uploads_folder, exist_ok=True)
+    filenames = [placeholder_filename(text, style, size) for text in texts]
+
+    jobs = {}
+    for text, filename in zip(texts, filenames):
+        target_path = os.path.join(uploads_folder, filename)
+        if filename not in jobs and filename not in _created and not os.path.exists(target_path):
+            jobs[filename] = (text, style, size, target_path)
+
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render_to_file, jobs.values(), chunksize=64))
+    else:
+        for job in jobs.values():
+            _render_to_file(job)
+    print(f"Placeholders: {len(set(filenames))} distinct, {len(jobs)} rendered, "
+          f"{len(set(filenames)) - len(jobs)} reused")
+
+    for filename in filenames:
+        _created.setdefault(filename, f"{URL_PREFIX}/{filename}")
+    return [_created[filename] for filename in filenames]
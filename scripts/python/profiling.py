@@ -0,0 +1,242 @@
+"""Profiling hooks shared by the maintenance scripts.
+
+Every script takes --profile (all modes) or --profile-modes MODES, with
+MODES a comma separated list of
+  cpu     cProfile of the whole run, saved as a .prof file (pstats, snakeviz)
+  memory  tracemalloc: peak memory of each metrics phase, and the top
+          allocation sites between the points where a new phase starts
+  wall    a sampled wall-clock profile of the main thread, saved as folded
+          stacks (.folded) for flamegraph.pl or speedscope
+or 'all'.
+
+The files go to data/metrics, next to the metrics summaries, together with
+a <script>-<time>.profile.json report of the top-N hot functions and the
+peak memory per phase. Phases are the ones RunMetrics times (parse,
+resolve, image, insert, commit), so scripts that do not use RunMetrics get
+run-level figures only. Worker processes of process pools are not profiled.
+"""
+import argparse
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_FOLDER = "./data/metrics"
+PROFILE_MODES = ('cpu', 'memory', 'wall')
+TOP_N = 25  # Hot functions and allocation sites listed in the report
+SAMPLE_INTERVAL = 0.005  # Seconds between wall-clock samples
+TRACEMALLOC_FRAMES = 10
+
+_active = None  # The RunProfiler of this process, if any
+
+class RunProfiler:
+    """cProfile, tracemalloc and wall-clock sampling for one run"""
+
+    def __init__(self, name, modes, top=TOP_N, folder=PROFILE_FOLDER):
+        self.name = name
+        self.modes = modes
+        self.top = top
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.stem = os.path.join(folder, f"{name}-{stamp}-{os.getpid()}")
+        self.report_file = f"{self.stem}.profile.json"
+        self.cpu = cProfile.Profile() if 'cpu' in modes else None
+        self.open_phases = []
+        self.phase_peaks = {}
+        self.snapshots = []  # (label, tracemalloc snapshot) at phase boundaries
+        self.samples = Counter()
+        self.sampler = None
+        self.stop_sampling = threading.Event()
+
+    def start(self):
+        self.started = time.perf_counter()
+        if 'memory' in self.modes:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.snapshots.append(('start', tracemalloc.take_snapshot()))
+        if 'wall' in self.modes:
+            self.sampler = threading.Thread(target=self._sample, args=(threading.main_thread().ident,), daemon=True)
+            self.sampler.start()
+        if self.cpu:
+            self.cpu.enable()
+
+    def _sample(self, thread_id):
+        """Record the stack of the main thread every SAMPLE_INTERVAL seconds (runs in a thread)"""
+        while not self.stop_sampling.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def phase_started(self, name):
+        """A metrics phase starts: fold the peak so far into the open phases and reset it"""
+        if 'memory' not in self.modes:
+            return
+        if name not in self.phase_peaks and not self.open_phases:
+            # First time this phase runs: a boundary between stages of the run
+            self.snapshots.append((f"before {name}", tracemalloc.take_snapshot()))
+        self._update_peaks()
+        tracemalloc.reset_peak()
+        self.open_phases.append(name)
+        self.phase_peaks.setdefault(name, 0)
+
+    def phase_finished(self, name):
+        if 'memory' not in self.modes or name not in self.open_phases:
+            return
+        self._update_peaks()
+        self.open_phases.remove(name)
+
+    def _update_peaks(self):
+        _, peak = tracemalloc.get_traced_memory()
+        for name in self.open_phases:
+            self.phase_peaks[name] = max(self.phase_peaks[name], peak)
+
+    def stop(self):
+        """Stop every profiler, write the files and the report; returns the report"""
+        if self.cpu:
+            self.cpu.disable()
+        elapsed = time.perf_counter() - self.started
+        report = {'script': self.name, 'modes': list(self.modes), 'elapsed': round(elapsed, 3),
+                  'files': {'report': self.report_file}}
+        os.makedirs(os.path.dirname(self.stem) or '.', exist_ok=True)
+
+        if self.cpu:
+            report['files']['cprofile'] = f"{self.stem}.prof"
+            self.cpu.dump_stats(report['files']['cprofile'])
+            report['top_functions'] = self._top_functions()
+
+        if 'memory' in self.modes:
+            current, peak = tracemalloc.get_traced_memory()
+            self.snapshots.append(('end', tracemalloc.take_snapshot()))
+            tracemalloc.stop()
+            report['memory'] = {
+                'peak_bytes': max([peak, *self.phase_peaks.values()]),
+                'end_bytes': current,
+                'phase_peak_bytes': dict(self.phase_peaks),
+                'allocations': self._allocation_growth(),
+            }
+
+        if self.sampler:
+            self.stop_sampling.set()
+            self.sampler.join()
+            report['files']['flamegraph'] = f"{self.stem}.folded"
+            with open(report['files']['flamegraph'], 'w', encoding='utf-8') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            report['wall_samples'] = sum(self.samples.values())
+
+        with open(self.report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        return report
+
+    def _top_functions(self):
+        """Return the top-N functions by own time from the cProfile stats"""
+        stats = pstats.Stats(self.cpu).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]
+        return [{
+            'function': f"{os.path.basename(filename)}:{line}({function})",
+            'calls': calls,
+            'own_seconds': round(own_time, 4),
+            'cumulative_seconds': round(cumulative_time, 4),
+        } for (filename, line, function), (_, calls, own_time, cumulative_time, _) in rows]
+
+    def _allocation_growth(self):
+        """Top allocation sites that grew between consecutive phase-boundary snapshots"""
+        growth = []
+        for (label, before), (next_label, after) in zip(self.snapshots, self.snapshots[1:]):
+            differences = after.compare_to(before, 'lineno')[:self.top]
+            growth.append({
+                'from': label,
+                'to': next_label,
+                'top': [{'where': str(difference.traceback[0]), 'size_diff': difference.size_diff,
+                         'count_diff': difference.count_diff} for difference in differences
+                        if difference.size_diff > 0],
+            })
+        return growth
+
+def phase_started(name):
+    """Called by RunMetrics when a phase starts (no-op unless a profile is running)"""
+    if _active is not None:
+        _active.phase_started(name)
+
+def phase_finished(name):
+    """Called by RunMetrics when a phase ends"""
+    if _active is not None:
+        _active.phase_finished(name)
+
+def active_report():
+    """Return the report file of the running profile, or None"""
+    return _active.report_file if _active is not None else None
+
+def parse_modes(value):
+    """Turn a --profile-modes value into a tuple of modes (also the argparse type of the option)"""
+    if not value:
+        return ()
+    if value == 'all':
+        return PROFILE_MODES
+    modes = tuple(mode.strip() for mode in value.split(',') if mode.strip())
+    unknown = [mode for mode in modes if mode not in PROFILE_MODES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown profile mode(s): {', '.join(unknown)}")
+    return modes
+
+def add_profile_arguments(parser):
+    """Add the --profile, --profile-modes and --profile-top options shared by the scripts.
+
+    Both profile options store the parsed tuple of modes in args.profile.
+    """
+    parser.add_argument('--profile', action='store_const', const=PROFILE_MODES, default=None,
+                        help=f"Profile the run in every mode ({', '.join(PROFILE_MODES)})")
+    parser.add_argument('--profile-modes', dest='profile', type=parse_modes, metavar='MODES',
+                        help=f"Profile the run in some modes: comma separated {', '.join(PROFILE_MODES)} or all")
+    parser.add_argument('--profile-top', type=int, default=TOP_N, metavar='N',
+                        help='Hot functions and allocation sites listed in the profile report')
+    return parser
+
+@contextmanager
+def profiled(name, profile=None, top=TOP_N):
+    """Profile the enclosed block when profile (a tuple of modes, or a --profile-modes string) is set"""
+    global _active
+    modes = parse_modes(profile) if isinstance(profile, str) else tuple(profile or ())
+    if not modes or _active is not None:
+        yield None
+        return
+    profiler = RunProfiler(name, modes, top)
+    _active = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _active = None
+        report = profiler.stop()
+        print_report(report)
+
+def profile_from_argv(name):
+    """profiled() for scripts without an argument parser: takes --profile options out of sys.argv"""
+    parser = add_profile_arguments(argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), add_help=False))
+    args, remaining = parser.parse_known_args(sys.argv[1:])
+    sys.argv[1:] = remaining
+    return profiled(name, args.profile, args.profile_top)
+
+def print_report(report, count=10):
+    """Print the short form of a profile report"""
+    print(f"\nProfile of {report['script']} ({', '.join(report['modes'])}, {report['elapsed']:.2f}s):")
+    for entry in report.get('top_functions', [])[:count]:
+        print(f"  {entry['own_seconds']:>8.3f}s own {entry['cumulative_seconds']:>8.3f}s cum "
+              f"{entry['calls']:>9} calls  {entry['function']}")
+    if 'memory' in report:
+        memory = report['memory']
+        print(f"  Peak memory: {memory['peak_bytes'] / 1024 / 1024:.1f} MB (traced)")
+        for phase, peak in memory['phase_peak_bytes'].items():
+            print(f"    {phase:<10} {peak / 1024 / 1024:.1f} MB")
+    for kind, path in report['files'].items():
+        print(f"  {kind}: {path}")
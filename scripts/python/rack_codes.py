@@ -0,0 +1,62 @@
+"""Canonical rack codes.
+
+Packing lists write the same rack in several ways ("R3 E1", "R3E1",
+"r3-e1", "Rack 3 E01"). rack_key reduces a rack name to one canonical form
+(R<n>E<n> for rack/level codes), which is stored in locations.rack_key and
+used to match rack locations.
+"""
+import re
+
+RACK_CODE_PATTERN = re.compile(r'^R(?:ACK)?[\s\-_./]*0*(\d+)[\s\-_./]*E[\s\-_./]*0*(\d+)$', re.IGNORECASE)
+SEPARATORS = re.compile(r'[\s\-_./]+')
+
+def rack_key(name):
+    """Return the canonical key for a rack name, or None when it is blank"""
+    if name is None:
+        return None
+    text = str(name).strip()
+    if not text:
+        return None
+    match = RACK_CODE_PATTERN.match(text)
+    if match:
+        return f"R{int(match.group(1))}E{int(match.group(2))}"
+    # Other rack names only ignore case and separators
+    return SEPARATORS.sub('', text).upper()
+
+def ensure_rack_keys(conn):
+    """Make sure locations has a rack_key column, filled in for every rack, with a unique index.
+
+    Racks created without a key (e.g. by the web app) are keyed from their
+    name. Only the oldest rack of each code gets the key; a rack whose key
+    already belongs to another rack keeps a NULL key, and update_schema.py
+    merges such duplicates. The caller commits.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(locations)")}
+    if 'rack_key' not in columns:
+        conn.execute("ALTER TABLE locations ADD COLUMN rack_key TEXT")
+        print("Added 'rack_key' column to locations table")
+
+    conn.create_function('rack_key', 1, rack_key, deterministic=True)
+    # Databases keyed before the index existed can hold the same key on several racks
+    conn.execute("""
+        UPDATE locations SET rack_key = NULL
+        WHERE rack_key IS NOT NULL
+          AND rowid != (SELECT min(l.rowid) FROM locations l WHERE l.rack_key = locations.rack_key)
+    """)
+    conn.execute("""
+        UPDATE locations SET rack_key = rack_key(name)
+        WHERE type = 'Rack' AND rack_key IS NULL
+          AND rowid IN (SELECT min(rowid) FROM locations WHERE type = 'Rack' GROUP BY rack_key(name))
+          AND rack_key(name) NOT IN (SELECT rack_key FROM locations WHERE rack_key IS NOT NULL)
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_locations_rack_key ON locations (rack_key)")
+
+def load_rack_ids(conn):
+    """Return {rack key: location_id} for all rack locations, keeping the oldest rack per key"""
+    rack_ids = {}
+    for name, location_id in conn.execute(
+            "SELECT name, location_id FROM locations WHERE type = 'Rack' ORDER BY rowid"):
+        key = rack_key(name)
+        if key:
+            rack_ids.setdefault(key, location_id)
+    return rack_ids
@@ -1,65 +1,139 @@
 import os
-import sqlite3
-import shutil
-import datetime
+import time
+import argparse
+from db_backup import backup_database
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
 
 # Configuration
-DB_FILE = "./data/inventory.db"
 BACKUP_FOLDER = "./data/backups"
+RESET_TABLES = ['products', 'inventory']  # Tables to clear; every table referencing them is cleared too
+# Tables keyed by product without a declared foreign key
+UNDECLARED_DEPENDENTS = {'import_row_fingerprints': 'products'}
 
-def reset_database():
-    """Backup the current database and reset it to a clean state"""
+def dependent_tables(conn, tables=RESET_TABLES):
+    """Return tables and every table that references them, ordered so children come before parents"""
+    all_tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    references = {table: set() for table in all_tables}
+    for table in all_tables:
+        for fk in conn.execute(f"PRAGMA foreign_key_list({table})"):
+            if fk[2] in references and fk[2] != table:
+                references[table].add(fk[2])
+    for table, parent in UNDECLARED_DEPENDENTS.items():
+        if table in references and parent in references:
+            references[table].add(parent)
+
+    # Collect every table that (indirectly) references one of the reset tables
+    selected = {table for table in tables if table in references}
+    changed = True
+    while changed:
+        changed = False
+        for table, parents in references.items():
+            if table not in selected and parents & selected:
+                selected.add(table)
+                changed = True
+
+    # Delete children first: a table is emitted once no remaining selected table references it
+    ordered = []
+    remaining = set(selected)
+    while remaining:
+        leaves = sorted(table for table in remaining
+                        if not any(table in references[other] for other in remaining if other != table))
+        if not leaves:  # Reference cycle; the order inside it does not matter with FKs off
+            leaves = sorted(remaining)
+        ordered.extend(leaves)
+        remaining -= set(leaves)
+    return ordered
+
+def clear_tables(conn, tables, drop_indexes=False):
+    """Delete all rows of tables (in the given order) inside one transaction.
+
+    With drop_indexes the explicit indexes of those tables are dropped
+    before the delete and recreated afterwards.
+    """
+    placeholders = ', '.join('?' * len(tables))
+    indexes = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        tables
+    ).fetchall() if drop_indexes else []
+
+    # Unconditional DELETEs on tables without triggers use SQLite's truncate optimisation
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        for table in tables:
+            count = conn.execute(f"DELETE FROM {table}").rowcount
+            print(f"  Cleared {table} ({count} rows)")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+            conn.execute(f"DELETE FROM sqlite_sequence WHERE name IN ({placeholders})", tables)
+        for name, sql in indexes:
+            conn.execute(sql)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if indexes:
+        print(f"  Dropped and recreated {len(indexes)} indexes")
+
+def recreate_file(conn, db_file):
+    """Rebuild db_file from its schema and remaining rows into a fresh, defragmented file.
+
+    Only safe while nothing else has the database open.
+    """
+    temp_file = db_file + '.rebuild'
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM INTO ?", (temp_file,))
+    conn.close()
+    os.replace(temp_file, db_file)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+
+def reset_database(drop_indexes=False, vacuum=False, recreate=False, backup=True):
+    """Backup the current database and reset it to a clean state
+
+    Products, inventory and every table depending on them are cleared in
+    one transaction. vacuum compacts the file in place afterwards; recreate
+    instead rebuilds it as a new file (stop the API first).
+    """
     print(f"Backing up and resetting database: {DB_FILE}")
-    
+
     # Check if database exists
     if not os.path.exists(DB_FILE):
         print(f"Error: Database file '{DB_FILE}' not found!")
         return
-    
-    # Create backup folder if it doesn't exist
-    if not os.path.exists(BACKUP_FOLDER):
-        os.makedirs(BACKUP_FOLDER, exist_ok=True)
-        print(f"Created backup folder: {BACKUP_FOLDER}")
-    
-    # Create backup with timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = os.path.join(BACKUP_FOLDER, f"inventory_backup_{timestamp}.db")
-    
+
     try:
-        # Copy the database file to backup
-        shutil.copy2(DB_FILE, backup_file)
-        print(f"Created backup: {backup_file}")
-        
-        # Connect to database
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Get list of tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        # Save schema for each table
-        table_schemas = {}
-        for table in tables:
-            table_name = table[0]
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            table_schemas[table_name] = columns
-        
-        # Delete all products and related inventory entries
-        print("Deleting all products and inventory entries...")
-        cursor.execute("DELETE FROM inventory")
-        cursor.execute("DELETE FROM products")
-        
-        # Reset SQLite sequences if they exist
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name='products' OR name='inventory'")
-        
-        # Commit changes
-        conn.commit()
-        print("Database reset completed successfully")
-        
+        # Take an online backup (consistent even while the API is writing)
+        if backup:
+            backup_database(DB_FILE, BACKUP_FOLDER)
+
+        # Connect to database (autocommit; clear_tables manages its transaction)
+        conn = connect(DB_FILE, isolation_level=None)
+        started = time.perf_counter()
+
+        # Delete all products and everything that depends on them
+        tables = dependent_tables(conn)
+        print(f"Deleting all rows from: {', '.join(tables)}")
+        clear_tables(conn, tables, drop_indexes)
+
+        if recreate:
+            print("Rebuilding database file...")
+            recreate_file(conn, DB_FILE)
+        elif vacuum:
+            print("Compacting database file...")
+            conn.execute("VACUUM")
+
+        print(f"Database reset completed successfully in {time.perf_counter() - started:.2f}s "
+              f"({os.path.getsize(DB_FILE) / 1024 / 1024:.1f} MB)")
+
         return True
-        
+
     except Exception as e:
         print(f"Error resetting database: {e}")
         return False
@@ -68,4 +142,15 @@ def reset_database():
             conn.close()
 
 if __name__ == "__main__":
-    reset_database()
+    parser = argparse.ArgumentParser(description='Back up and reset the inventory database')
+    parser.add_argument('--drop-indexes', action='store_true', help='Drop and recreate indexes around the delete')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM the database after clearing it')
+    parser.add_argument('--recreate', action='store_true',
+                        help='Rebuild the database as a fresh file after clearing it (API must be stopped)')
+    parser.add_argument('--no-backup', action='store_true', help='Skip the backup before resetting')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('reset_database', args.profile, args.profile_top):
+        reset_database(drop_indexes=args.drop_indexes, vacuum=args.vacuum, recreate=args.recreate,
+                       backup=not args.no_backup)
@@ -0,0 +1,101 @@
+"""Per-row fingerprints for incremental packing-list imports.
+
+Every imported source row is recorded in import_row_fingerprints under
+(sheet key, row key), with a hash of its content and the product and
+inventory rows it produced. The sheet key is the absolute workbook path
+and the sheet name, so workbooks sharing a file name in different folders
+are tracked separately. A rerun compares the workbook with these records
+and only touches rows that are new, changed or gone.
+"""
+import datetime
+import hashlib
+import json
+import os
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS import_row_fingerprints (
+    sheet TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    row_hash TEXT NOT NULL,
+    product_id TEXT,
+    inventory_id TEXT,
+    retired_at TEXT,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sheet, row_key)
+)
+"""
+
+def workbook_key(excel_file):
+    """Normalized absolute path of a workbook, the first part of its sheet keys"""
+    return os.path.normcase(os.path.abspath(excel_file))
+
+def sheet_key(excel_file, sheet):
+    """Key the row fingerprints of a sheet are stored under (workbook path and sheet name)"""
+    return f"{workbook_key(excel_file)}:{sheet}"
+
+def legacy_sheet_key(excel_file, sheet):
+    """Key of the sheet in databases written before sheets were keyed by path (file name and sheet name)"""
+    return f"{os.path.basename(excel_file)}:{sheet}"
+
+def sheet_sku_tag(key):
+    """Short tag added to the SKUs of a sheet, so sheets sharing SR numbers do not collide"""
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:6].upper()
+
+def ensure_fingerprint_table(conn):
+    """Create the fingerprint table if it does not exist"""
+    conn.execute(CREATE_TABLE)
+
+def adopt_legacy_fingerprints(conn, excel_file, sheet):
+    """Move the fingerprints a sheet has under its legacy key to its path key.
+
+    Only done while the path key has no fingerprints, so each legacy key is
+    adopted once, by the first workbook of that name imported after the
+    upgrade. Returns the number of rows moved.
+    """
+    ensure_fingerprint_table(conn)
+    key = sheet_key(excel_file, sheet)
+    if conn.execute("SELECT 1 FROM import_row_fingerprints WHERE sheet = ? LIMIT 1", (key,)).fetchone():
+        return 0
+    return conn.execute("UPDATE import_row_fingerprints SET sheet = ? WHERE sheet = ?",
+                        (key, legacy_sheet_key(excel_file, sheet))).rowcount
+
+def row_fingerprint(values):
+    """Return a stable hash of a row's imported values"""
+    return hashlib.sha1(json.dumps(list(values), default=str).encode('utf-8')).hexdigest()
+
+def load_fingerprints(conn, sheet):
+    """Return {row key: {'hash', 'product_id', 'inventory_id', 'retired'}} for a sheet"""
+    fingerprints = {}
+    for row_key, row_hash, product_id, inventory_id, retired_at in conn.execute(
+            "SELECT row_key, row_hash, product_id, inventory_id, retired_at "
+            "FROM import_row_fingerprints WHERE sheet = ?", (sheet,)):
+        fingerprints[row_key] = {
+            'hash': row_hash,
+            'product_id': product_id,
+            'inventory_id': inventory_id,
+            'retired': retired_at is not None,
+        }
+    return fingerprints
+
+def save_fingerprints(conn, sheet, entries):
+    """Insert or replace fingerprints given as (row key, hash, product_id, inventory_id) tuples"""
+    now = datetime.datetime.now()
+    conn.executemany(
+        """
+        INSERT INTO import_row_fingerprints (sheet, row_key, row_hash, product_id, inventory_id, retired_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, NULL, ?)
+        ON CONFLICT (sheet, row_key) DO UPDATE SET
+            row_hash = excluded.row_hash, product_id = excluded.product_id,
+            inventory_id = excluded.inventory_id, retired_at = NULL, updated_at = excluded.updated_at
+        """,
+        [(sheet, row_key, row_hash, product_id, inventory_id, now)
+         for row_key, row_hash, product_id, inventory_id in entries]
+    )
+
+def retire_fingerprints(conn, sheet, row_keys):
+    """Mark rows that disappeared from the sheet as retired"""
+    now = datetime.datetime.now()
+    conn.executemany(
+        "UPDATE import_row_fingerprints SET retired_at = ?, updated_at = ? WHERE sheet = ? AND row_key = ?",
+        [(now, now, sheet, row_key) for row_key in row_keys]
+    )
@@ -1,13 +1,17 @@
-import sqlite3
 import os
-import pandas as pd
 import uuid
+import argparse
+from excel_reader import cell_text
+from layout_cache import open_layout
+from name_resolver import rack_resolver, product_resolver
+from import_metrics import RunMetrics, add_metrics_arguments
+from db_connection import DB_FILE, connect
+from profiling import profiled, add_profile_arguments
 
 # Configuration - same as import_excel_data.py
 EXCEL_FILE = "PL- ARPER.xlsx"
-DB_FILE = "./data/inventory.db"
 
-def update_rack_locations():
+def update_rack_locations(debug=False, metrics_file=None):
     """Update rack locations for all products based on Excel data"""
     print(f"Updating rack locations from Excel file: {EXCEL_FILE}")
     
@@ -21,117 +25,97 @@ def update_rack_locations():
         return
     
     # Connect to database
-    conn = sqlite3.connect(DB_FILE)
+    metrics = RunMetrics('update_rack_locations', debug=debug, metrics_file=metrics_file)
+    conn = connect(DB_FILE, profile='bulk')
     cursor = conn.cursor()
     
     try:
-        # Read Excel file
-        df = pd.read_excel(EXCEL_FILE)
-        print(f"Read {len(df)} rows from Excel file")
+        # Stream the Excel file; the header row and columns come from the cached layout of its format
+        layout, rows = open_layout(EXCEL_FILE)
         
         # Print column names for debugging
-        print(f"Columns in Excel: {df.columns.tolist()}")
+        print(f"Header row: {layout['header_row']}{' (cached layout)' if layout['cached'] else ''}")
+        print(f"Columns in Excel: {layout['columns']}")
         
         # Identify the correct columns for product data
-        name_col = next((col for col in df.columns if 'DESCRIPTION' in str(col)), None)
-        rack_col = next((col for col in df.columns if 'RACK' in str(col)), None)
-        
-        # Fallback based on observation from import_excel_data.py
-        if not name_col:
-            name_col = 'Unnamed: 1'  # Fallback based on observation
-        if not rack_col:
-            rack_col = 'Unnamed: 5'  # Fallback based on observation
+        name_col = layout['mapping']['name']
+        rack_col = layout['mapping']['rack']
             
         print(f"\nUsing columns:")
         print(f"  Product Name: {name_col}")
         print(f"  Rack Location: {rack_col}")
         
+        # Load the product and rack name -> id maps once instead of querying per row
+        with metrics.phase('resolve'):
+            products = product_resolver(conn)
+            racks = rack_resolver(conn)
+        print(f"Loaded {len(products)} products and {len(racks)} rack locations")
+        
         # Process each row
         products_updated = 0
-        racks_created = 0
+        inventory_rows = []
         
-        for _, row in df.iterrows():
-            # Skip rows with no product name
-            if pd.isna(row[name_col]):
-                continue
-                
+        for row in metrics.timed(rows):
             # Get product data
-            product_name = str(row[name_col]).strip()
-            rack_location = str(row[rack_col]).strip() if not pd.isna(row[rack_col]) else ''
+            product_name = cell_text(row.get(name_col))
+            rack_location = cell_text(row.get(rack_col)) or ''
             
             if not product_name:
                 continue
+            metrics.advance()
             
             # Check if product exists
-            cursor.execute("SELECT product_id FROM products WHERE name = ?", (product_name,))
-            product = cursor.fetchone()
+            product_id = products.get(product_name)
             
-            if not product:
-                print(f"Product not found: {product_name}")
+            if not product_id:
+                metrics.debug(f"Product not found: {product_name}")
+                metrics.count('not_found')
                 continue
             
-            product_id = product[0]
-            
             if not rack_location:
-                print(f"No rack location for product: {product_name}")
+                metrics.debug(f"No rack location for product: {product_name}")
+                metrics.count('without_rack')
                 continue
-                
-            print(f"Processing product: {product_name}, Rack: {rack_location}")
-            
-            # Handle rack location - create or get rack location ID
-            cursor.execute("SELECT location_id FROM locations WHERE name = ? AND type = 'Rack'", (rack_location,))
-            rack = cursor.fetchone()
             
-            if rack:
-                location_id = rack[0]
-            else:
-                # Create new rack location
-                location_id = str(uuid.uuid4())
-                cursor.execute(
-                    """INSERT INTO locations 
-                       (location_id, name, description, type) 
-                       VALUES (?, ?, ?, ?)""",
-                    (location_id, rack_location, f'Rack location {rack_location}', 'Rack')
-                )
-                racks_created += 1
-                print(f"Created rack location: {rack_location}")
+            # Get the rack location ID; new racks are created in one batch below
+            with metrics.phase('resolve'):
+                location_id = racks.get_or_create(rack_location, description=f'Rack location {rack_location}')
             
-            # Check if inventory entry exists for this product and location
-            cursor.execute(
-                "SELECT inventory_id FROM inventory WHERE product_id = ? AND location_id = ?",
-                (product_id, location_id)
-            )
-            existing_inventory = cursor.fetchone()
-            
-            if existing_inventory:
-                # Update inventory entry
-                cursor.execute(
-                    """UPDATE inventory SET 
-                       updated_at = CURRENT_TIMESTAMP
-                       WHERE product_id = ? AND location_id = ?""",
-                    (product_id, location_id)
-                )
-            else:
-                # Create new inventory entry
-                inventory_id = str(uuid.uuid4())
-                cursor.execute(
-                    """INSERT INTO inventory 
-                       (inventory_id, product_id, location_id, quantity) 
-                       VALUES (?, ?, ?, ?)""",
-                    (inventory_id, product_id, location_id, 1)
-                )
+            # Queue the inventory entry for this product and location
+            inventory_rows.append((str(uuid.uuid4()), product_id, location_id, 1))
             
             products_updated += 1
-            print(f"Updated product: {product_name} with rack location: {rack_location}")
+            metrics.debug(f"Updated product: {product_name} with rack location: {rack_location}")
         
-        conn.commit()
+        # Write the new racks, then create or touch the inventory entries in one statement
+        with metrics.phase('insert'):
+            racks_created = racks.flush()
+            cursor.executemany(
+                """INSERT INTO inventory 
+                   (inventory_id, product_id, location_id, quantity) 
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (product_id, location_id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP""",
+                inventory_rows
+            )
+        
+        with metrics.phase('commit'):
+            conn.commit()
         print(f"\nUpdate completed: {products_updated} products updated, {racks_created} rack locations created")
+        metrics.count('updated', products_updated)
+        metrics.count('racks_created', racks_created)
+        metrics.finish(file=EXCEL_FILE)
         
     except Exception as e:
-        print(f"Error updating rack locations: {e}")
+        metrics.info(f"Error updating rack locations: {e}")
         conn.rollback()
     finally:
         conn.close()
 
 if __name__ == "__main__":
-    update_rack_locations()
+    parser = argparse.ArgumentParser(description='Update the rack locations of the products from the Excel file')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('update_rack_locations', args.profile, args.profile_top):
+        update_rack_locations(debug=args.debug, metrics_file=args.metrics_file)
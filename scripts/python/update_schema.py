@@ -1,11 +1,66 @@
-import sqlite3
 import os
+from db_indexes import ensure_indexes
+from rack_codes import rack_key, ensure_rack_keys
+from db_connection import DB_FILE, connect
+from profiling import profile_from_argv
 
-# Configuration
-DB_FILE = "./data/inventory.db"  # Same as in import_excel_data.py
+def location_references(conn):
+    """Return [(table, column)] for every foreign key pointing at locations, except inventory's"""
+    references = []
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for table in tables:
+        for fk in conn.execute(f"PRAGMA foreign_key_list({table})"):
+            # fk: (id, seq, referenced table, from column, to column, ...)
+            if fk[2] == 'locations' and table != 'inventory':
+                references.append((table, fk[3]))
+    return references
+
+def merge_duplicate_racks(conn):
+    """Merge rack locations whose names have the same canonical rack code ("R3 E1" / "R3E1").
+
+    The oldest location of each code is kept. Stock held at a duplicate is
+    moved to it, adding the quantities when both hold the same product,
+    and every other reference is repointed before the duplicate is deleted.
+    Returns the number of locations removed.
+    """
+    racks = {}
+    for location_id, name in conn.execute(
+            "SELECT location_id, name FROM locations WHERE type = 'Rack' ORDER BY rowid"):
+        key = rack_key(name)
+        if key:
+            racks.setdefault(key, []).append(location_id)
+
+    references = location_references(conn)
+    removed = 0
+    for key, location_ids in racks.items():
+        keep = location_ids[0]
+        for duplicate in location_ids[1:]:
+            params = {'keep': keep, 'duplicate': duplicate}
+            conn.execute("""
+                UPDATE inventory
+                SET quantity = quantity + (SELECT d.quantity FROM inventory d
+                                           WHERE d.location_id = :duplicate AND d.product_id = inventory.product_id),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE location_id = :keep
+                  AND product_id IN (SELECT product_id FROM inventory WHERE location_id = :duplicate)
+            """, params)
+            conn.execute("""
+                DELETE FROM inventory
+                WHERE location_id = :duplicate
+                  AND product_id IN (SELECT product_id FROM inventory WHERE location_id = :keep)
+            """, params)
+            conn.execute("UPDATE inventory SET location_id = :keep WHERE location_id = :duplicate", params)
+            for table, column in references:
+                conn.execute(f"UPDATE {table} SET {column} = :keep WHERE {column} = :duplicate", params)
+            conn.execute("DELETE FROM locations WHERE location_id = :duplicate", params)
+            removed += 1
+        conn.execute("UPDATE locations SET rack_key = ? WHERE location_id = ?", (key, keep))
+        if len(location_ids) > 1:
+            print(f"Merged {len(location_ids) - 1} duplicate location(s) into rack {key}")
+    return removed
 
 def update_schema():
-    """Update the database schema to add type column to locations table"""
+    """Update the database schema: locations type and rack key columns, merged duplicate racks, import indexes"""
     print(f"Updating database schema for {DB_FILE}")
     
     # Check if database exists
@@ -14,7 +69,7 @@ def update_schema():
         return
     
     # Connect to database
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect(DB_FILE)
     cursor = conn.cursor()
     
     try:
@@ -41,12 +96,29 @@ def update_schema():
                 WHERE name LIKE 'R%' OR name LIKE 'Rack%' OR name LIKE '%Shelf%'
             """)
             
-            # Commit changes
-            conn.commit()
-            print("Schema update completed successfully")
         else:
             print("Type column already exists in locations table")
         
+        # Match racks on a canonical code: merge locations that are the same
+        # rack spelled differently, then key every rack and index the keys
+        if 'rack_key' not in column_names:
+            cursor.execute("ALTER TABLE locations ADD COLUMN rack_key TEXT")
+            print("Added 'rack_key' column to locations table")
+        cursor.execute("DROP INDEX IF EXISTS idx_locations_rack_key")
+        cursor.execute("UPDATE locations SET rack_key = NULL WHERE type = 'Rack'")
+        merged = merge_duplicate_racks(conn)
+        print(f"Merged {merged} duplicate rack locations")
+        ensure_rack_keys(conn)
+        
+        # Create the indexes used by the importers' per-row lookups and let
+        # SQLite refresh its statistics for them
+        ensure_indexes(conn)
+        cursor.execute("PRAGMA optimize")
+        
+        # Commit changes
+        conn.commit()
+        print("Schema update completed successfully")
+        
     except Exception as e:
         print(f"Error updating schema: {e}")
         conn.rollback()
@@ -54,4 +126,5 @@ def update_schema():
         conn.close()
 
 if __name__ == "__main__":
-    update_schema()
+    with profile_from_argv('update_schema'):
+        update_schema()
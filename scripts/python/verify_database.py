@@ -1,18 +1,20 @@
-import sqlite3
+import argparse
 import os
+import sys
 import pandas as pd
 import tabulate
+from db_connection import connect
+from db_integrity import CHECKS, MAX_ROWS, CHECK_TIMEOUT, estimated_rows, run_checks, print_results, failed
+from profiling import profiled, add_profile_arguments
 
-def verify_database():
+def verify_database(db_file="arper_inventory.db"):
     """Verify the database structure and imported data."""
-    db_file = "arper_inventory.db"
-    
     if not os.path.exists(db_file):
         print(f"Database file not found: {db_file}")
-        return
+        return False
     
     # Connect to SQLite database
-    conn = sqlite3.connect(db_file)
+    conn = connect(db_file, profile='readonly')
     cursor = conn.cursor()
     
     print(f"Connected to database: {db_file}")
@@ -31,13 +33,11 @@ def verify_database():
     for i, view in enumerate(views):
         print(f"{i+1}. {view[0]}")
     
-    # Check table counts
-    print("\nTable row counts:")
+    # Estimated table sizes (COUNT(*) reads every page of a table)
+    print("\nTable row counts (estimated from the largest rowid):")
     for table in tables:
         table_name = table[0]
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        count = cursor.fetchone()[0]
-        print(f"{table_name}: {count} rows")
+        print(f"{table_name}: ~{estimated_rows(conn, table_name)} rows")
     
     # Sample data from products table
     print("\nSample products (first 5):")
@@ -89,6 +89,42 @@ def verify_database():
     
     # Close connection
     conn.close()
+    return True
+
+def check_integrity(db_file, sample=None, seed=None, workers=None, max_rows=MAX_ROWS, timeout=CHECK_TIMEOUT):
+    """Run the db_integrity checks; returns True when none of them failed"""
+    mode = f"sampled, {sample} rows per large table" if sample else "full"
+    print(f"\nIntegrity checks ({mode}):")
+    results = run_checks(db_file, CHECKS, sample=sample, seed=seed, workers=workers,
+                         max_rows=max_rows, timeout=timeout)
+    print_results(results)
+    return not failed(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify the database and run the integrity checks')
+    parser.add_argument('db_file', nargs='?', default="arper_inventory.db", help='Path to the SQLite database')
+    parser.add_argument('--checks-only', action='store_true',
+                        help='Only run the integrity checks (pre-deploy gate); exits 1 when one fails')
+    parser.add_argument('--sample', type=int, default=None, metavar='ROWS',
+                        help='Check tables larger than ROWS on a random sample of about ROWS rows')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the sample, to repeat a sampled run')
+    parser.add_argument('--workers', type=int, default=None, help='Checks run in parallel (default: all)')
+    parser.add_argument('--max-rows', type=int, default=MAX_ROWS, help='Offending rows fetched per check')
+    parser.add_argument('--timeout', type=float, default=CHECK_TIMEOUT, help='Seconds before a check is stopped')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiled('verify_database', args.profile, args.profile_top):
+        if not args.checks_only and not verify_database(args.db_file):
+            sys.exit(2)
+        if not os.path.exists(args.db_file):
+            print(f"Database file not found: {args.db_file}")
+            sys.exit(2)
+        passed = check_integrity(args.db_file, args.sample, args.seed, args.workers, args.max_rows, args.timeout)
+    if not passed:
+        print("\nIntegrity checks failed")
+        sys.exit(1)
+    print("\nAll integrity checks passed")
 
 if __name__ == "__main__":
-    verify_database() 
\ No newline at end of file
+    main()
@@ -0,0 +1,197 @@
+"""Direct access to the pictures embedded in an .xlsx workbook.
+
+An .xlsx file is a zip archive: the picture bytes live in xl/media/* and
+each sheet's drawing part (xl/drawings/drawingN.xml) anchors them to cells.
+Reading those parts directly avoids decoding every picture through PIL just
+to find out where it sits. ImageIndex turns the anchors into a row interval
+index, so the picture of a product row is found without probing cells.
+"""
+import posixpath
+import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from openpyxl.utils import get_column_letter
+
+NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+    'xdr': 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+}
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+DRAWING_REL = R_NS + '/drawing'
+IMAGE_REL = R_NS + '/image'
+
+def _rels_path(part):
+    """Return the relationships part that belongs to a package part"""
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, '_rels', name + '.rels')
+
+def _read_rels(archive, part):
+    """Map relationship id -> (type, absolute target part) for a package part"""
+    rels_part = _rels_path(part)
+    if rels_part not in archive.namelist():
+        return {}
+    root = ET.fromstring(archive.read(rels_part))
+    base = posixpath.dirname(part)
+    rels = {}
+    for rel in root.findall('rel:Relationship', NS):
+        target = rel.get('Target')
+        if rel.get('TargetMode') == 'External':
+            continue
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join(base, target))
+        rels[rel.get('Id')] = (rel.get('Type'), target)
+    return rels
+
+def sheet_parts(archive):
+    """Return [(sheet name, worksheet part)] in workbook order"""
+    workbook_part = 'xl/workbook.xml'
+    root = ET.fromstring(archive.read(workbook_part))
+    rels = _read_rels(archive, workbook_part)
+    parts = []
+    for sheet in root.findall('main:sheets/main:sheet', NS):
+        rel_id = sheet.get(f'{{{R_NS}}}id')
+        if rel_id in rels:
+            parts.append((sheet.get('name'), rels[rel_id][1]))
+    return parts
+
+def active_sheet_name(archive):
+    """Return the name of the sheet that opens by default (openpyxl's workbook.active)"""
+    root = ET.fromstring(archive.read('xl/workbook.xml'))
+    view = root.find('main:bookViews/main:workbookView', NS)
+    active = int(view.get('activeTab', 0)) if view is not None else 0
+    parts = sheet_parts(archive)
+    if not parts:
+        return None
+    return parts[min(active, len(parts) - 1)][0]
+
+def _marker(element):
+    """Read an xdr:from / xdr:to marker as (col, col offset, row, row offset)"""
+    if element is None:
+        return None
+    return tuple(int(element.findtext(f'xdr:{field}', '0', NS))
+                 for field in ('col', 'colOff', 'row', 'rowOff'))
+
+def read_sheet_images(archive, sheet_name=None):
+    """List the pictures anchored on a sheet.
+
+    archive is an open zipfile.ZipFile. Each picture is a dict with the
+    media part name and its 0-based anchor cells: from_row/from_col and
+    to_row/to_col (the cell holding the bottom-right corner; equal to the
+    from cell for one-cell anchors).
+    """
+    if sheet_name is None:
+        sheet_name = active_sheet_name(archive)
+    sheet_part = dict(sheet_parts(archive)).get(sheet_name)
+    if not sheet_part:
+        return []
+
+    images = []
+    for rel_type, drawing_part in _read_rels(archive, sheet_part).values():
+        if rel_type != DRAWING_REL:
+            continue
+        media = {rel_id: target for rel_id, (kind, target) in _read_rels(archive, drawing_part).items()
+                 if kind == IMAGE_REL}
+        root = ET.fromstring(archive.read(drawing_part))
+        for anchor in list(root):
+            blip = anchor.find('.//xdr:pic/xdr:blipFill/a:blip', NS)
+            if blip is None:
+                continue
+            media_part = media.get(blip.get(f'{{{R_NS}}}embed'))
+            if not media_part:
+                continue
+            start = _marker(anchor.find('xdr:from', NS))
+            end = _marker(anchor.find('xdr:to', NS))
+            if start is None:
+                continue
+            if end is None:
+                end = start
+            to_col, to_row = end[0], end[2]
+            # A corner sitting exactly on a cell boundary does not cover that cell
+            if end[1] == 0 and to_col > start[0]:
+                to_col -= 1
+            if end[3] == 0 and to_row > start[2]:
+                to_row -= 1
+            images.append({
+                'media': media_part,
+                'from_col': start[0],
+                'from_row': start[2],
+                'to_col': to_col,
+                'to_row': to_row,
+            })
+    return images
+
+def cell_range(image):
+    """Return the cells a picture covers as an A1 range, e.g. 'E5' or 'E5:F7'"""
+    start = f"{get_column_letter(image['from_col'] + 1)}{image['from_row'] + 1}"
+    end = f"{get_column_letter(image['to_col'] + 1)}{image['to_row'] + 1}"
+    return start if start == end else f"{start}:{end}"
+
+def column_distance(image, col):
+    """Return how many columns a picture is away from col (0 when it covers col)"""
+    if image['from_col'] <= col <= image['to_col']:
+        return 0
+    return min(abs(image['from_col'] - col), abs(image['to_col'] - col))
+
+class ImageIndex:
+    """Row interval index over the pictures of a sheet.
+
+    Each picture covers rows from_row..to_row (0-based, inclusive). The
+    pictures are sorted by first row next to a running maximum of their last
+    rows, so the pictures covering a row are found with two bisections.
+    """
+
+    def __init__(self, images):
+        self.images = sorted(images, key=lambda image: (image['from_row'], image['from_col']))
+        self.starts = [image['from_row'] for image in self.images]
+        self.reach = list(accumulate((image['to_row'] for image in self.images), max))
+
+    def __len__(self):
+        return len(self.images)
+
+    def covering(self, row):
+        """Return the pictures whose row span includes row"""
+        end = bisect_right(self.starts, row)
+        begin = bisect_left(self.reach, row, 0, end)
+        return [image for image in self.images[begin:end] if image['to_row'] >= row]
+
+    def image_for_row(self, row, col=None):
+        """Return the picture for a row, or None.
+
+        Pictures anchored on the row win over pictures that only extend into
+        it from a row above; then the picture nearest col (e.g. the IMAGE
+        column) wins, then the left-most one.
+        """
+        candidates = self.covering(row)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda image: (
+            image['from_row'] != row,
+            0 if col is None else column_distance(image, col),
+            image['from_col'],
+        ))
+
+    def row_images(self, rows, col=None):
+        """Map each of rows (0-based) to its picture.
+
+        A picture reaching into a row from an earlier listed row stays with
+        that earlier row; only the first row it covers gets it.
+        """
+        assigned = {}
+        claimed = set()
+        for row in sorted(rows):
+            image = self.image_for_row(row, col)
+            if image is None:
+                continue
+            if image['from_row'] != row and id(image) in claimed:
+                continue
+            claimed.add(id(image))
+            assigned[row] = image
+        return assigned
+
+    def multi_row(self):
+        """Return the pictures that span more than one row"""
+        return [image for image in self.images if image['to_row'] > image['from_row']]